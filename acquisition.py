@@ -0,0 +1,195 @@
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
+from datetime import datetime
+from time import perf_counter
+from typing import Any, Callable, Iterable, Optional, Tuple
+
+import pytz
+
+from device import Device
+from metrics import registry
+
+sensor_read_seconds = registry.histogram("sensor_read_seconds", "Latency of one sensor read, including failed ones")
+sensor_read_errors = registry.counter("sensor_read_errors", "Sensor reads that raised")
+sensor_read_timeouts = registry.counter("sensor_read_timeouts", "Sweeps that used a device's last good value because "
+                                                                "its read missed the deadline")
+sensor_read_not_ready = registry.counter("sensor_read_not_ready", "Sweeps that used a device's last good value because "
+                                                                  "it had no new measurement")
+
+
+def read_weather(weather_bme280) -> Tuple[float, float]:
+    weather_bme280.update_sensor()
+    return weather_bme280.get_temperature(), weather_bme280.get_humidity()
+
+
+def read_light(light_prox) -> float:
+    return light_prox.get_lux()
+
+
+def read_gas(bulk_gas):
+    return bulk_gas.read_all()
+
+
+def read_particulate(pms5003):
+    return pms5003.read()
+
+
+def read_co2(scd4x) -> Optional[Tuple[float, float, float]]:
+    if not scd4x.data_ready:
+        return None
+    return scd4x.CO2, scd4x.temperature, scd4x.relative_humidity
+
+
+readers: dict[Device, Callable[[Any], Any]] = {
+    Device.WEATHER: read_weather,
+    Device.LIGHT_PROX: read_light,
+    Device.GAS: read_gas,
+    Device.PARTICULATE_MATTER: read_particulate,
+    Device.CO2: read_co2,
+}
+
+# Seconds from the start of a sweep before a device's last good value is used instead
+default_timeouts_s: dict[Device, float] = {
+    Device.WEATHER: 1.0,
+    Device.LIGHT_PROX: 1.0,
+    Device.GAS: 1.0,
+    Device.PARTICULATE_MATTER: 5.0,
+    Device.CO2: 2.0,
+}
+
+
+def timed_read(reader: Callable[[Any], Any], device: Any) -> Tuple[Any, float, Optional[str]]:
+    start: float = perf_counter()
+    try:
+        return reader(device), perf_counter() - start, None
+    except Exception as e:
+        return None, perf_counter() - start, str(e)
+
+
+class Reading:
+    def __init__(self, value: Any, latency_s: float, stale: bool = False, error: Optional[str] = None):
+        self.value: Any = value
+        self.latency_s: float = latency_s
+        self.stale: bool = stale
+        self.error: Optional[str] = error
+
+
+class SensorSnapshot:
+    def __init__(self, ts: datetime, readings: dict[Device, Reading]):
+        self.ts: datetime = ts
+        self.readings: dict[Device, Reading] = readings
+
+    def value(self, device: Device) -> Any:
+        reading: Optional[Reading] = self.readings.get(device)
+        return None if reading is None else reading.value
+
+    @property
+    def latencies(self) -> dict[Device, float]:
+        return {device: reading.latency_s for device, reading in self.readings.items()}
+
+    @property
+    def stale(self) -> list[Device]:
+        return [device for device, reading in self.readings.items() if reading.stale]
+
+    @property
+    def missing(self) -> list[Device]:
+        """Devices with no value at all, stale ones that have never had a good read."""
+        return [device for device, reading in self.readings.items() if reading.value is None]
+
+    @property
+    def temp_C(self) -> Optional[float]:
+        weather: Optional[Tuple[float, float]] = self.value(Device.WEATHER)
+        return None if weather is None else weather[0]
+
+    @property
+    def humidity_pct(self) -> Optional[float]:
+        weather: Optional[Tuple[float, float]] = self.value(Device.WEATHER)
+        return None if weather is None else weather[1]
+
+    @property
+    def lux(self) -> Optional[float]:
+        return self.value(Device.LIGHT_PROX)
+
+    @property
+    def gas(self):
+        return self.value(Device.GAS)
+
+    @property
+    def pm(self):
+        return self.value(Device.PARTICULATE_MATTER)
+
+    @property
+    def co2_ppm(self) -> Optional[float]:
+        co2: Optional[Tuple[float, float, float]] = self.value(Device.CO2)
+        return None if co2 is None else co2[0]
+
+    @property
+    def scd41_temp_C(self) -> Optional[float]:
+        co2: Optional[Tuple[float, float, float]] = self.value(Device.CO2)
+        return None if co2 is None else co2[1]
+
+    @property
+    def scd41_humidity_pct(self) -> Optional[float]:
+        co2: Optional[Tuple[float, float, float]] = self.value(Device.CO2)
+        return None if co2 is None else co2[2]
+
+
+class SensorAcquisition:
+    """Reads every sensor in a device suite at the same time.
+
+    Each device gets its own deadline. A device that misses it, raises, or has no new measurement yet reports its
+    last good value marked stale so one hung sensor can't hold up the rest of the loop; None when it has never had a
+    good read, see SensorSnapshot.missing. A read still running from an earlier sweep is waited on
+    again rather than piling up another one behind it.
+    """
+    def __init__(self, devices: dict[Device, Any], timeouts_s: dict[Device, float] = None):
+        self.devices: dict[Device, Any] = {device: devices[device] for device in readers if device in devices}
+        self.timeouts_s: dict[Device, float] = {**default_timeouts_s, **(timeouts_s or {})}
+
+        self.pool: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=len(self.devices),
+                                                           thread_name_prefix="acquisition")
+        self.in_flight: dict[Device, Future] = {}
+        self.last_good: dict[Device, Any] = {}
+
+    def acquire(self, only: Optional[Iterable[Device]] = None) -> SensorSnapshot:
+        """One sweep of every device, or only of those given."""
+        ts_now: datetime = datetime.now(tz=pytz.UTC)
+        start: float = perf_counter()
+        devices: list[Device] = list(self.devices) if only is None else [device for device in only
+                                                                         if device in self.devices]
+
+        for device in devices:
+            if device not in self.in_flight:
+                self.in_flight[device] = self.pool.submit(timed_read, readers[device], self.devices[device])
+
+        readings: dict[Device, Reading] = {}
+        for device in devices:
+            future: Future = self.in_flight[device]
+            remaining_s: float = self.timeouts_s[device] - (perf_counter() - start)
+            try:
+                value, latency_s, error = future.result(timeout=max(remaining_s, 0))
+            except TimeoutError:
+                sensor_read_timeouts.labels(device=device.value).inc()
+                readings[device] = Reading(self.last_good.get(device), self.timeouts_s[device], stale=True,
+                                           error="timeout")
+                continue
+
+            del self.in_flight[device]
+            sensor_read_seconds.labels(device=device.value).observe(latency_s)
+            if error is not None:
+                sensor_read_errors.labels(device=device.value).inc()
+                readings[device] = Reading(self.last_good.get(device), latency_s, stale=True, error=error)
+                continue
+
+            if value is None:
+                # the reader had nothing new, e.g. the SCD4x between measurements
+                sensor_read_not_ready.labels(device=device.value).inc()
+                readings[device] = Reading(self.last_good.get(device), latency_s, stale=True, error="not ready")
+                continue
+
+            self.last_good[device] = value
+            readings[device] = Reading(value, latency_s)
+
+        return SensorSnapshot(ts_now, readings)
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
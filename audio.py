@@ -0,0 +1,238 @@
+from functools import lru_cache
+from typing import Optional
+
+import numpy as np
+from numpy import pi
+from scipy.signal import bilinear_zpk, freqs, sosfilt, sosfilt_zi, zpk2sos, zpk2tf
+
+
+def ABC_weighting(curve='A'):
+    """
+    Design of an analog weighting filter with A, B, or C curve.
+    Returns zeros, poles, gain of the filter.
+    """
+    if curve not in 'ABC':
+        raise ValueError('Curve type not understood')
+
+    # ANSI S1.4-1983 C weighting
+    #    2 poles on the real axis at "20.6 Hz" HPF
+    #    2 poles on the real axis at "12.2 kHz" LPF
+    #    -3 dB down points at "10^1.5 (or 31.62) Hz"
+    #                         "10^3.9 (or 7943) Hz"
+    #
+    # IEC 61672 specifies "10^1.5 Hz" and "10^3.9 Hz" points and formulas for
+    # derivation.  See _derive_coefficients()
+
+    z = [0, 0]
+    p = [-2 * pi * 20.598997057568145,
+         -2 * pi * 20.598997057568145,
+         -2 * pi * 12194.21714799801,
+         -2 * pi * 12194.21714799801]
+    k = 1
+
+    if curve == 'A':
+        # ANSI S1.4-1983 A weighting =
+        #    Same as C weighting +
+        #    2 poles on real axis at "107.7 and 737.9 Hz"
+        #
+        # IEC 61672 specifies cutoff of "10^2.45 Hz" and formulas for
+        # derivation.  See _derive_coefficients()
+
+        p.append(-2 * pi * 107.65264864304628)
+        p.append(-2 * pi * 737.8622307362899)
+        z.append(0)
+        z.append(0)
+
+    elif curve == 'B':
+        # ANSI S1.4-1983 B weighting
+        #    Same as C weighting +
+        #    1 pole on real axis at "10^2.2 (or 158.5) Hz"
+
+        p.append(-2 * pi * 10 ** 2.2)  # exact
+        z.append(0)
+    b, a = zpk2tf(z, p, k)
+    k /= abs(freqs(b, a, [2 * pi * 1000])[1][0])
+
+    return np.array(z), np.array(p), k
+
+
+def A_weighting(fs, output='ba'):
+    """
+    Design of a digital A-weighting filter.
+    Designs a digital A-weighting filter for
+    sampling frequency `fs`.
+    Warning: fs should normally be higher than 20 kHz. For example,
+    fs = 48000 yields a class 1-compliant filter.
+    Parameters
+    ----------
+    fs : float
+        Sampling frequency
+    output : {'ba', 'zpk', 'sos'}, optional
+        Type of output:  numerator/denominator ('ba'), pole-zero ('zpk'), or
+        second-order sections ('sos'). Default is 'ba'.
+    Since this uses the bilinear transform, frequency response around fs/2 will
+    be inaccurate at lower sampling rates.
+    """
+    z, p, k = ABC_weighting('A')
+
+    # Use the bilinear transformation to get the digital filter.
+    z_d, p_d, k_d = bilinear_zpk(z, p, k, fs)
+
+    if output == 'zpk':
+        return z_d, p_d, k_d
+    elif output in {'ba', 'tf'}:
+        return zpk2tf(z_d, p_d, k_d)
+    elif output == 'sos':
+        return zpk2sos(z_d, p_d, k_d)
+    else:
+        raise ValueError("'%s' is not a valid output form." % output)
+
+
+@lru_cache(maxsize=8)
+def a_weighting_sos(fs: float) -> np.ndarray:
+    """A_weighting(fs, 'sos'), designed once per sample rate. Shared, don't modify it."""
+    return A_weighting(fs, output='sos')
+
+
+class AWeighting:
+    """Streaming A-weighting: blocks are filtered along axis 0 with the filter state carried from one block to the
+    next, so consecutive blocks filter the same as one continuous signal.
+
+    Call reset() when the stream has a gap, the next block then starts from the steady state of its first sample.
+    """
+    def __init__(self, fs: float):
+        self.fs: float = fs
+        self.sos: np.ndarray = a_weighting_sos(fs)
+        self.zi: Optional[np.ndarray] = None
+
+    def reset(self):
+        self.zi = None
+
+    def __call__(self, block: np.ndarray) -> np.ndarray:
+        if self.zi is None or self.zi.shape[2:] != block.shape[1:]:
+            zi: np.ndarray = sosfilt_zi(self.sos).reshape(self.sos.shape[0], 2, *([1] * (block.ndim - 1)))
+            self.zi = zi * block[0]
+        weighted, self.zi = sosfilt(self.sos, block, axis=0, zi=self.zi)
+        return weighted
+
+
+def octave_bands(fraction: int = 1, fmin: float = 20.0, fmax: float = 20000.0) -> list[tuple[float, float]]:
+    """(low, high) edges of the 1/fraction octave bands, base 2 around 1kHz, whose centres lie in [fmin, fmax].
+
+    octave_bands(1) are the octave bands, octave_bands(3) the third-octave bands.
+    """
+    half: float = 2 ** (1 / (2 * fraction))
+    ret: list[tuple[float, float]] = []
+    for k in range(int(np.floor(fraction * np.log2(fmin / 1000))), int(np.ceil(fraction * np.log2(fmax / 1000))) + 1):
+        centre: float = 1000 * 2 ** (k / fraction)
+        if fmin <= centre <= fmax:
+            ret.append((centre / half, centre * half))
+    return ret
+
+
+class BandAnalyzer:
+    """RMS of the spectrum in each band of a fixed band set, for blocks of a fixed size.
+
+    The block is split into nfft long segments advancing by nfft * (1 - overlap), each windowed and transformed, and
+    the power spectra averaged (Welch). nfft defaults to the block size, a single segment. Band edges are mapped to
+    rfft bins once; a band narrower than a bin takes the bin nearest its centre. Band RMS is sqrt of the mean power
+    over the band's bins, all bands in one cumulative sum.
+
+    Power is scaled to what a rectangular FFT of the whole block gives, which is also what the block zero padded to
+    nfft == fs gives, so levels don't depend on the FFT size, window or overlap chosen.
+
+    :param bands: (low, high) Hz, bins in [low, high)
+    :param window: scipy.signal.get_window name, None for rectangular
+    """
+    def __init__(self, fs: float, bands: list[tuple[float, float]], block_size: int, nfft: Optional[int] = None,
+                 window: Optional[str] = None, overlap: float = 0.0):
+        self.fs: float = fs
+        self.bands: list[tuple[float, float]] = list(bands)
+        self.block_size: int = block_size
+        self.nfft: int = nfft or block_size
+        if self.block_size < self.nfft:
+            raise ValueError(f"nfft {self.nfft} is longer than the block {self.block_size}")
+        self.step: int = max(1, int(round(self.nfft * (1 - overlap))))
+        self.segments: int = 1 + (self.block_size - self.nfft) // self.step
+
+        self.window: Optional[np.ndarray] = None
+        self.scale: float = self.block_size / self.nfft
+        if window is not None:
+            from scipy.signal import get_window
+            self.window = get_window(window, self.nfft)
+            self.scale /= np.mean(np.square(self.window))
+
+        bin_hz: float = fs / self.nfft
+        bins: int = self.nfft // 2 + 1
+        edges: np.ndarray = np.asarray(self.bands, dtype=float).reshape(-1, 2)
+        self.starts: np.ndarray = np.clip(np.ceil(edges[:, 0] / bin_hz), 0, bins).astype(np.intp)
+        self.ends: np.ndarray = np.clip(np.ceil(edges[:, 1] / bin_hz), 0, bins).astype(np.intp)
+        empty: np.ndarray = self.ends <= self.starts
+        nearest: np.ndarray = np.clip(np.round(np.sqrt(edges[:, 0] * edges[:, 1]) / bin_hz), 0, bins - 1).astype(np.intp)
+        self.starts[empty] = nearest[empty]
+        self.ends[empty] = nearest[empty] + 1
+        self.counts: np.ndarray = self.ends - self.starts
+
+    def power(self, block: np.ndarray) -> np.ndarray:
+        if self.segments == 1:
+            segments: np.ndarray = block[np.newaxis, :self.nfft]
+        else:
+            segments = np.lib.stride_tricks.sliding_window_view(block, self.nfft)[::self.step][:self.segments]
+        if self.window is not None:
+            segments = segments * self.window
+        spectrum: np.ndarray = np.fft.rfft(segments, axis=-1)
+        return np.mean(np.square(spectrum.real) + np.square(spectrum.imag), axis=0) * self.scale
+
+    def __call__(self, block: np.ndarray) -> np.ndarray:
+        """Band RMS of a (block_size,) or (block_size, channels) block, the first channel."""
+        if block.ndim > 1:
+            block = block[:, 0]
+        cumulative: np.ndarray = np.concatenate(([0.0], np.cumsum(self.power(block))))
+        return np.sqrt((cumulative[self.ends] - cumulative[self.starts]) / self.counts)
+
+
+class AudioRingBuffer:
+    """Preallocated ring of the last capacity frames of an audio stream.
+
+    Frame i is kept at i % capacity, write() copies a block in once, split where it wraps, without allocating. A
+    window is a view of the ring unless it straddles the wrap, then it is copied into a scratch array kept for that,
+    overwritten by the next such window.
+
+    Frames are addressed by their absolute position in the stream, frames_written is the end of the newest block.
+    Single writer, single reader; a reader holding a window should check holds() afterwards, the writer may have
+    lapped it.
+    """
+    def __init__(self, capacity: int, channels: int = 1, dtype=np.float32):
+        self.capacity: int = capacity
+        self.buffer: np.ndarray = np.zeros((capacity, channels), dtype=dtype)
+        self.scratch: np.ndarray = np.zeros((capacity, channels), dtype=dtype)
+        self.frames_written: int = 0
+
+    def write(self, block: np.ndarray):
+        frames: int = len(block)
+        if self.capacity < frames:
+            raise ValueError(f"block of {frames} frames is larger than the ring ({self.capacity})")
+        start: int = self.frames_written % self.capacity
+        first: int = min(frames, self.capacity - start)
+        self.buffer[start:start + first] = block[:first]
+        if first < frames:
+            self.buffer[:frames - first] = block[first:]
+        self.frames_written += frames
+
+    def holds(self, start: int) -> bool:
+        """Whether the frames from absolute position start on are still in the ring."""
+        return 0 <= start and self.frames_written - start <= self.capacity
+
+    def window(self, length: int, end: Optional[int] = None) -> np.ndarray:
+        """The length frames ending at absolute position end, the newest by default."""
+        end = self.frames_written if end is None else end
+        if not self.holds(end - length) or self.frames_written < end:
+            raise IndexError(f"frames {end - length}:{end} are not in the ring, it holds "
+                             f"{max(0, self.frames_written - self.capacity)}:{self.frames_written}")
+        start: int = (end - length) % self.capacity
+        first: int = min(length, self.capacity - start)
+        if first == length:
+            return self.buffer[start:start + length]
+        self.scratch[:first] = self.buffer[start:]
+        self.scratch[first:length] = self.buffer[:length - first]
+        return self.scratch[:length]
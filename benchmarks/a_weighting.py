@@ -0,0 +1,43 @@
+# A-weighting per 0.25s block: filter designed on every block with zero initial state vs audio.AWeighting
+# python -m benchmarks.a_weighting [blocks]
+# Also the error of blockwise filtering against filtering the whole signal at once.
+import sys
+from time import perf_counter
+
+import numpy as np
+from scipy.signal import sosfilt
+
+from audio import A_weighting, AWeighting
+
+fs: int = 48000
+block_size: int = 12000
+
+
+def per_block_design(block: np.ndarray) -> np.ndarray:
+    return sosfilt(A_weighting(fs, output='sos'), block, axis=0)
+
+
+if __name__ == "__main__":
+    blocks: int = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    rng: np.random.Generator = np.random.default_rng(1)
+    t: np.ndarray = np.arange(blocks * block_size) / fs
+    # 100Hz hum, a 1kHz tone and noise, shaped like the (frames, 1) blocks from sounddevice
+    signal: np.ndarray = 0.2 * np.sin(2 * np.pi * 100 * t) + 0.1 * np.sin(2 * np.pi * 1000 * t)
+    signal = (signal + 0.01 * rng.standard_normal(signal.shape))[:, np.newaxis]
+    reference: np.ndarray = sosfilt(A_weighting(fs, output='sos'), signal, axis=0)
+    print(f"{blocks} blocks of {block_size} samples at {fs}Hz")
+
+    stateful: AWeighting = AWeighting(fs)
+    stateful.zi = np.zeros((stateful.sos.shape[0], 2, 1))  # same start as the whole-signal reference
+    for name, weight in (("design per block", per_block_design), ("AWeighting", stateful)):
+        out: list[np.ndarray] = []
+        begin: float = perf_counter()
+        for i in range(blocks):
+            out.append(weight(signal[i * block_size:(i + 1) * block_size]))
+        elapsed: float = perf_counter() - begin
+        error: float = np.max(np.abs(np.concatenate(out) - reference))
+        block_rms_error: float = np.max(np.abs(
+            np.sqrt(np.mean(np.square(np.concatenate(out).reshape(blocks, -1)), axis=1)) /
+            np.sqrt(np.mean(np.square(reference.reshape(blocks, -1)), axis=1)) - 1))
+        print(f"{name}\t{elapsed / blocks * 1000:.2f}ms/block\tmax sample error {error:.2e}\t"
+              f"max block RMS error {block_rms_error * 100:.2f}%")
@@ -0,0 +1,69 @@
+# Per block audio handling of the SPL monitor: copy per callback + fresh arrays per step vs audio.AudioRingBuffer
+# python -m benchmarks.audio_ring [blocks]
+# Transient memory is the tracemalloc peak while handling one block, numpy allocations are traced. Times come from a
+# separate pass without tracemalloc, which slows every allocation down.
+import sys
+import tracemalloc
+from time import perf_counter
+from typing import Callable
+
+import numpy as np
+
+from audio import AudioRingBuffer, AWeighting
+from simulated import SimulatedAudioStream
+
+fs: int = 48000
+block_size: int = 12000
+
+
+def copying() -> Callable[[np.ndarray], float]:
+    weighting: AWeighting = AWeighting(fs)
+
+    def handle(indata: np.ndarray) -> float:
+        recording: np.ndarray = indata.copy()
+        recording = recording - np.mean(recording)
+        weighted: np.ndarray = weighting(recording)
+        return float(np.sqrt(np.mean(np.square(weighted))))
+    return handle
+
+
+def ring(window_size: int) -> Callable[[np.ndarray], float]:
+    weighting: AWeighting = AWeighting(fs)
+    raw: AudioRingBuffer = AudioRingBuffer(block_size * 6)
+    weighted: AudioRingBuffer = AudioRingBuffer(max(window_size, block_size) + block_size)
+    centred: np.ndarray = np.zeros((block_size, 1), dtype=np.float32)
+
+    def handle(indata: np.ndarray) -> float:
+        raw.write(indata)
+        block: np.ndarray = raw.window(block_size)
+        np.subtract(block, float(np.mean(block)), out=centred)
+        weighted.write(weighting(centred))
+        window: np.ndarray = weighted.window(min(window_size, weighted.frames_written))
+        return float(np.sqrt(np.vdot(window, window) / len(window)))
+    return handle
+
+
+if __name__ == "__main__":
+    blocks: int = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    source: SimulatedAudioStream = SimulatedAudioStream(fs, block_size, seed=1)
+    print(f"{blocks} blocks of {block_size} float32 samples ({block_size * 4 / 1000:.0f}kB)")
+
+    for name, handle in (("copy + new arrays", copying()), ("ring, 0.25s window", ring(block_size)),
+                         ("ring, 1s overlapping window", ring(4 * block_size))):
+        elapsed: float = 0.0
+        for i in range(blocks):
+            source.fill(i * block_size)
+            begin: float = perf_counter()
+            handle(source.indata)
+            elapsed += perf_counter() - begin
+
+        peaks: list[int] = []
+        tracemalloc.start()
+        for i in range(blocks, 2 * blocks):
+            source.fill(i * block_size)
+            tracemalloc.reset_peak()
+            current: int = tracemalloc.get_traced_memory()[0]
+            handle(source.indata)
+            peaks.append(tracemalloc.get_traced_memory()[1] - current)
+        tracemalloc.stop()
+        print(f"{name}\t{elapsed / blocks * 1000:.3f}ms/block\ttransient {np.median(peaks) / 1000:.0f}kB/block")
@@ -0,0 +1,46 @@
+# Band RMS per 0.25s block: the zero padded rfft + per-range loop from northcliff_spl vs audio.BandAnalyzer
+# python -m benchmarks.band_analyzer [blocks]
+import sys
+from time import perf_counter
+
+import numpy as np
+
+from audio import BandAnalyzer, octave_bands
+
+fs: int = 48000
+block_size: int = 12000
+display_bands: list[tuple[int, int]] = [(20, 500), (500, 2000), (2000, 20000)]
+
+
+def padded_loop(recording: np.ndarray, ranges: list[tuple[float, float]]) -> list[float]:
+    magnitude = np.square(np.abs(np.fft.rfft(recording[:, 0], n=fs)))
+    result = []
+    for start, end in ranges:
+        result.append(np.sqrt(np.mean(magnitude[int(start):int(end)])))
+    return result
+
+
+if __name__ == "__main__":
+    blocks: int = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    rng: np.random.Generator = np.random.default_rng(1)
+    recordings: list[np.ndarray] = [rng.standard_normal((block_size, 1)) for _ in range(blocks)]
+    print(f"{blocks} blocks of {block_size} samples at {fs}Hz")
+
+    for bands_name, bands in (("display bands", display_bands), ("third octave", octave_bands(3))):
+        analyzers: dict[str, BandAnalyzer] = {
+            "BandAnalyzer": BandAnalyzer(fs, bands, block_size),
+            "BandAnalyzer hann 4096/50%": BandAnalyzer(fs, bands, block_size, nfft=4096, window="hann", overlap=0.5),
+        }
+        begin: float = perf_counter()
+        reference: list = [padded_loop(r, bands) for r in recordings]
+        elapsed: float = perf_counter() - begin
+        print(f"{bands_name} ({len(bands)})\tpadded loop\t{elapsed / blocks * 1000:.2f}ms/block")
+        for name, analyzer in analyzers.items():
+            begin = perf_counter()
+            levels: list = [analyzer(r) for r in recordings]
+            elapsed = perf_counter() - begin
+            # noise blocks, so compare levels averaged over all blocks, single blocks of narrow bands are noisy
+            bias: float = np.max(np.abs(10 * np.log10(np.mean(np.square(levels), axis=0) /
+                                                      np.mean(np.square(reference), axis=0))))
+            print(f"{bands_name} ({len(bands)})\t{name}\t{elapsed / blocks * 1000:.2f}ms/block\t"
+                  f"mean level within {bias:.2f}dB of padded loop")
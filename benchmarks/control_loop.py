@@ -0,0 +1,47 @@
+# Control loop throughput on simulated drivers, no Raspberry Pi needed
+# python -m benchmarks.control_loop [cycles] [sensor_latency_s] [failure_rate]
+import contextlib
+import io
+import sys
+from time import perf_counter
+
+from controller import init_device_suite, data_control_loop
+from device import Device
+from drivers import Backend
+
+
+class MemoryStore:
+    """Stands in for SqliteStore so the numbers are the loop, not the SD card."""
+    def __init__(self):
+        self.rows: list = []
+
+    def store_row(self, row):
+        self.rows.append(row)
+
+
+if __name__ == "__main__":
+    cycles: int = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    latency_s: float = float(sys.argv[2]) if len(sys.argv) > 2 else 0.0
+    failure_rate: float = float(sys.argv[3]) if len(sys.argv) > 3 else 0.0
+
+    sensor_options: dict = {"latency_s": latency_s, "failure_rate": failure_rate, "seed": 1}
+    devices = init_device_suite(Backend.SIMULATED, options={
+        Device.WEATHER: sensor_options,
+        Device.LIGHT_PROX: sensor_options,
+        Device.GAS: sensor_options,
+        Device.PARTICULATE_MATTER: sensor_options,
+        Device.CO2: sensor_options,
+    })
+    store: MemoryStore = MemoryStore()
+
+    log: io.StringIO = io.StringIO()
+    start: float = perf_counter()
+    with contextlib.redirect_stdout(log):
+        data_control_loop(devices, store, sleep_time=0, cycles=cycles)
+    elapsed: float = perf_counter() - start
+
+    errors: int = log.getvalue().count("ERROR")
+    stale: int = log.getvalue().count("WARN stale")
+    print(f"{cycles} cycles in {elapsed:.2f}s\t{cycles / elapsed:,.0f} cycles/s\t{elapsed / cycles * 1000:.3f}ms/cycle")
+    print(f"rows stored {len(store.rows)}\tskipped cycles {errors}\tcycles with stale sensors {stale}")
+    print(f"display frames {devices[Device.DISPLAY].frames_pushed}\tfan {devices[Device.THERMOSTAT].plug_state.value}")
@@ -0,0 +1,109 @@
+# Controller rows with the old NUMERIC measurement columns vs REAL: buffered insert and ORM read throughput, and the
+# time ControllerCollect.migrate_to_real takes to rewrite the NUMERIC table
+# python -m benchmarks.controller_real [rows] [batch_size]
+import os
+import sys
+import tempfile
+import warnings
+from datetime import datetime
+from time import perf_counter
+from typing import Type
+
+import numpy as np
+import pytz
+from sqlalchemy import Numeric, REAL, Table, create_engine
+from sqlalchemy.future import select
+from sqlalchemy.orm import declarative_base
+
+from controller import ControllerCollect
+from sqlite import SqliteStore
+
+LegacyBase = declarative_base()
+measurements: list[str] = [column.name for column in ControllerCollect.__table__.columns
+                           if isinstance(column.type, REAL)]
+
+
+legacy_table: Table = ControllerCollect.__table__.to_metadata(LegacyBase.metadata)
+for name in measurements:
+    legacy_table.columns[name].type = Numeric()
+
+
+class LegacyControllerCollect(LegacyBase):
+    # the controller table as it was, every measurement NUMERIC
+    __table__ = legacy_table
+
+
+def rows(model: Type, count: int, start_epoch: int = 1_700_000_000, chunk: int = 10000):
+    rng: np.random.Generator = np.random.default_rng(1)
+    for offset in range(0, count, chunk):
+        n: int = min(chunk, count - offset)
+        values: list[list[float]] = np.round(rng.normal(50, 10, (n, len(measurements))), 2).tolist()
+        for i, row in enumerate(values):
+            epoch_ts: int = start_epoch + 60 * (offset + i)
+            yield model(ts=datetime.fromtimestamp(epoch_ts, tz=pytz.UTC), epoch_ts=epoch_ts, fan_state="off",
+                        tstat_action="NO_CHANGE", **dict(zip(measurements, row)))
+
+
+def insert(store: SqliteStore, model: Type, count: int, batch_size: int) -> float:
+    begin: float = perf_counter()
+    batch: list = []
+    for row in rows(model, count):
+        batch.append(row)
+        if len(batch) == batch_size:
+            store.insert_batch(batch)
+            batch = []
+    if batch:
+        store.insert_batch(batch)
+    return perf_counter() - begin
+
+
+def read(store: SqliteStore, model: Type, chunk_size: int = 10000) -> tuple[float, float]:
+    # streamed, every measurement of every row touched as a float
+    begin: float = perf_counter()
+    total: float = 0.0
+    stmt = select(model).order_by(model.epoch_ts).execution_options(yield_per=chunk_size)
+    for partition in store.session.execute(stmt).scalars().partitions(chunk_size):
+        for row in partition:
+            for name in measurements:
+                value = getattr(row, name)
+                if value is not None:
+                    total += float(value)
+    store.session.rollback()
+    store.session.expunge_all()
+    return perf_counter() - begin, total
+
+
+if __name__ == "__main__":
+    count: int = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    batch_size: int = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    # SQLAlchemy warns on every NUMERIC statement that SQLite has no native Decimal
+    warnings.simplefilter("ignore")
+    print(f"{count} rows, {len(measurements)} measurements each, insert_batch of {batch_size}")
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_path: str = os.path.join(tmp, "legacy")
+        LegacyBase.metadata.create_all(create_engine(f"sqlite:///{legacy_path}.sqlite", future=True))
+        # no models, no migrations: the NUMERIC table stays as it is
+        legacy: SqliteStore = SqliteStore(legacy_path, [], wal=True)
+        numeric_insert_s: float = insert(legacy, LegacyControllerCollect, count, batch_size)
+        numeric_read_s, numeric_total = read(legacy, LegacyControllerCollect)
+        legacy.engine.dispose()
+
+        current: SqliteStore = SqliteStore(os.path.join(tmp, "current"), [ControllerCollect], wal=True)
+        real_insert_s: float = insert(current, ControllerCollect, count, batch_size)
+        real_read_s, real_total = read(current, ControllerCollect)
+
+        for name, insert_s, read_s in (("NUMERIC", numeric_insert_s, numeric_read_s),
+                                       ("REAL", real_insert_s, real_read_s)):
+            print(f"{name:8s} insert {insert_s:6.2f}s {count / insert_s:9.0f} rows/s   "
+                  f"read {read_s:6.2f}s {count / read_s:9.0f} rows/s")
+        print(f"read speedup {numeric_read_s / real_read_s:.2f}x, insert speedup "
+              f"{numeric_insert_s / real_insert_s:.2f}x, sums {numeric_total:.2f} / {real_total:.2f}")
+
+        begin: float = perf_counter()
+        migrated: SqliteStore = SqliteStore(legacy_path, [ControllerCollect], wal=True)
+        migrate_s: float = perf_counter() - begin
+        types: set[str] = {row[2] for row in migrated.session.execute("PRAGMA table_info(controller)")
+                           if row[1] in measurements}
+        migrated_read_s, migrated_total = read(migrated, ControllerCollect)
+        print(f"migration {migrate_s:.2f}s ({count / migrate_s:.0f} rows/s), column types now {sorted(types)}, "
+              f"read after {migrated_read_s:.2f}s, sum {migrated_total:.2f}")
@@ -0,0 +1,51 @@
+# Display.write_text cost on the control loop's path: render and push every call vs frame cache vs background push
+# python -m benchmarks.display_frames [calls] [spi_s]
+# The panel is simulated, spi_s is the transfer time of one 160x80 RGB565 frame (~25600 bytes at 10MHz).
+import sys
+from time import perf_counter
+
+from PIL import Image, ImageDraw, ImageFont
+
+from display import Display
+from simulated import SimulatedPanel, Waveform
+
+
+def write_text_uncached(disp: Display, message: str):
+    """Display.write_text as it was: a new image, measure, draw and push on every call."""
+    img = Image.new('RGB', (disp.WIDTH, disp.HEIGHT), color=(0, 0, 0))
+    draw = ImageDraw.Draw(img)
+    left, top, size_x, size_y = draw.textbbox((0, 0), message, font=disp.font)
+    x = (disp.WIDTH - size_x) / 2
+    y = (disp.HEIGHT / 2) - (size_y / 2)
+    draw.rectangle((0, 0, 160, 80), disp.back_colour)
+    draw.text((x, y), message, font=disp.font, fill=disp.text_colour)
+    disp.disp.display(img)
+
+
+if __name__ == "__main__":
+    calls: int = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    spi_s: float = float(sys.argv[2]) if len(sys.argv) > 2 else 0.025
+
+    # the loop's message, a slowly drifting temperature at one decimal
+    import random
+    rng: random.Random = random.Random(1)
+    temps: Waveform = Waveform(72.0, 2.0, period_s=calls, noise=0.03)
+    messages: list[str] = [f"temp: {temps.sample(i, rng):.1f}F" for i in range(calls)]
+    print(f"{calls} calls, {len(set(messages))} distinct messages, {spi_s * 1000:.0f}ms per SPI frame")
+
+    font = ImageFont.load_default(size=25)
+    for name, background in (("uncached", False), ("cached", False), ("cached+background", True)):
+        panel: SimulatedPanel = SimulatedPanel(latency_s=spi_s)
+        disp: Display = Display(panel=panel, font=font, background=background)
+        write = (lambda m: write_text_uncached(disp, m)) if name == "uncached" else disp.write_text
+        worst: float = 0.0
+        start: float = perf_counter()
+        for message in messages:
+            begin: float = perf_counter()
+            write(message)
+            worst = max(worst, perf_counter() - begin)
+        elapsed: float = perf_counter() - start
+        disp.flush()
+        disp.close()
+        print(f"{name}\t{elapsed / calls * 1000:.2f}ms/call\tworst {worst * 1000:.1f}ms\t"
+              f"{panel.frames_pushed} frames pushed")
@@ -0,0 +1,77 @@
+# export.export throughput to CSV and JSON lines, plain and gzipped, over millions of controller and timeseries rows,
+# and its peak Python memory for a tenth of the history vs all of it
+# python -m benchmarks.export [controller_rows] [timeseries_rows]
+import os
+import resource
+import sys
+import tempfile
+import tracemalloc
+from time import perf_counter
+
+from benchmarks.fetch_columns import populate
+from controller import ControllerCollect
+from export import export
+from sqlite import SqliteStore
+from timeseries import DatetimeMask, Timeseries, TimeseriesID
+
+start_epoch: int = 1_600_000_000
+
+
+def populate_timeseries(store: SqliteStore, rows: int, series: int = 10, chunk: int = 100000):
+    # hourly values of a few series, one version each
+    with store.engine.connect() as conn:
+        dbapi_conn = conn.connection
+        for offset in range(0, rows, chunk):
+            dbapi_conn.executemany(
+                "INSERT INTO timeseries (series_id, ts, version_ts, value, created_at) VALUES (?, ?, ?, ?, ?)",
+                ((f"series-{i % series}", start_epoch + 3600 * (i // series), start_epoch, 40.0 + i % 50 / 7,
+                  start_epoch) for i in range(offset, min(rows, offset + chunk))))
+            dbapi_conn.commit()
+
+
+def timed(store: SqliteStore, model, path: str, fmt: str, compress: bool, **kwargs) -> tuple[int, float, float]:
+    begin: float = perf_counter()
+    rows: int = export(store, model, path, fmt, compress=compress, **kwargs)
+    return rows, perf_counter() - begin, os.path.getsize(path) / 1e6
+
+
+if __name__ == "__main__":
+    controller_rows: int = int(sys.argv[1]) if len(sys.argv) > 1 else 2000000
+    timeseries_rows: int = int(sys.argv[2]) if len(sys.argv) > 2 else 2000000
+    with tempfile.TemporaryDirectory() as tmp:
+        sensors: SqliteStore = SqliteStore(os.path.join(tmp, "sensors"), [ControllerCollect], wal=True)
+        timeseries: SqliteStore = SqliteStore(os.path.join(tmp, "timeseries"), [Timeseries, TimeseriesID,
+                                                                               DatetimeMask], wal=True)
+        begin: float = perf_counter()
+        populate(sensors, controller_rows, start_epoch)
+        populate_timeseries(timeseries, timeseries_rows)
+        print(f"{controller_rows} controller and {timeseries_rows} timeseries rows populated in "
+              f"{perf_counter() - begin:.0f}s")
+
+        out: str = os.path.join(tmp, "out")
+        runs = [
+            ("controller", sensors, ControllerCollect, "csv", False, {}),
+            ("controller", sensors, ControllerCollect, "csv", True, {}),
+            ("controller", sensors, ControllerCollect, "jsonl", False, {}),
+            ("controller", sensors, ControllerCollect, "jsonl", True, {}),
+            ("controller 3 columns", sensors, ControllerCollect, "csv", False,
+             {"columns": ["epoch_ts", "temp_F", "co2_ppm"]}),
+            ("timeseries", timeseries, Timeseries, "csv", False, {}),
+            ("timeseries", timeseries, Timeseries, "jsonl", True, {}),
+            ("timeseries 1 series", timeseries, Timeseries, "csv", False, {"where": {"series_id": "series-3"}}),
+        ]
+        for name, store, model, fmt, compress, kwargs in runs:
+            rows, seconds, mb = timed(store, model, out, fmt, compress, **kwargs)
+            print(f"{name:21s} {fmt + ('.gz' if compress else ''):9s} {rows:8d} rows {seconds:6.1f}s "
+                  f"{rows / seconds:9,.0f} rows/s {mb:7.1f} MB")
+            os.remove(out)
+
+        # peak of what the export itself allocates, for a tenth of the history and all of it
+        for name, end in (("tenth", start_epoch + 60 * controller_rows // 10), ("all", None)):
+            tracemalloc.start()
+            export(sensors, ControllerCollect, out, "csv", end=end)
+            peak: int = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            os.remove(out)
+            print(f"controller csv, {name} of the history: peak Python allocations {peak / 1e6:.1f} MB")
+        print(f"process max RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3:.0f} MB")
@@ -0,0 +1,98 @@
+import asyncio
+import json
+import struct
+from typing import Optional
+
+from kasa.protocol import TPLinkSmartHomeProtocol
+
+
+class FakePlug:
+    """Local stand-in for a Kasa smart plug.
+
+    Answers the UDP discovery broadcast and the TCP command protocol on the same port, like the real plugs do.
+    `latency_s` is added to every TCP response to mimic a plug on wifi.
+    """
+    def __init__(self, alias: str = "Fan", host: str = "127.0.0.1", port: int = 9999, latency_s: float = 0.005):
+        self.alias: str = alias
+        self.host: str = host
+        self.port: int = port
+        self.latency_s: float = latency_s
+        self.relay_state: int = 0
+        self.tcp_requests: int = 0
+        self.discovery_requests: int = 0
+
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._udp: Optional[asyncio.DatagramTransport] = None
+
+    def sysinfo(self) -> dict:
+        return {
+            "alias": self.alias,
+            "dev_name": "Smart Wi-Fi Plug Mini",
+            "type": "IOT.SMARTPLUGSWITCH",
+            "model": "HS103(US)",
+            "mac": "00:00:00:00:00:01",
+            "deviceId": "FAKE0001",
+            "hwId": "FAKE",
+            "hw_ver": "1.0",
+            "sw_ver": "1.0.0 Build 000000 Rel.000000",
+            "feature": "TIM",
+            "relay_state": self.relay_state,
+            "on_time": 0,
+            "led_off": 0,
+            "rssi": -50,
+            "err_code": 0,
+        }
+
+    def respond(self, request: dict) -> dict:
+        ret: dict = {}
+        for module, methods in request.items():
+            ret[module] = {}
+            for method, params in methods.items():
+                if module == "system" and method == "get_sysinfo":
+                    ret[module][method] = self.sysinfo()
+                elif module == "system" and method == "set_relay_state":
+                    self.relay_state = params["state"]
+                    ret[module][method] = {"err_code": 0}
+                else:
+                    ret[module][method] = {"err_code": 0}
+        return ret
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                length: int = struct.unpack(">I", await reader.readexactly(4))[0]
+                request: dict = json.loads(TPLinkSmartHomeProtocol.decrypt(await reader.readexactly(length)))
+                self.tcp_requests += 1
+                await asyncio.sleep(self.latency_s)
+                writer.write(TPLinkSmartHomeProtocol.encrypt(json.dumps(self.respond(request))))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionResetError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    class _Discovery(asyncio.DatagramProtocol):
+        def __init__(self, plug: "FakePlug"):
+            self.plug: FakePlug = plug
+            self.transport: Optional[asyncio.DatagramTransport] = None
+
+        def connection_made(self, transport):
+            self.transport = transport
+
+        def datagram_received(self, data, addr):
+            self.plug.discovery_requests += 1
+            # discovery payloads are encrypted without the length prefix
+            payload: bytes = TPLinkSmartHomeProtocol.encrypt(json.dumps(self.plug.respond(
+                {"system": {"get_sysinfo": {}}})))[4:]
+            self.transport.sendto(payload, addr)
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        loop = asyncio.get_running_loop()
+        self._udp, _ = await loop.create_datagram_endpoint(lambda: FakePlug._Discovery(self),
+                                                           local_addr=(self.host, self.port))
+
+    async def stop(self):
+        self._udp.close()
+        self._server.close()
+        await self._server.wait_closed()
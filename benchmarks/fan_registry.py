@@ -0,0 +1,74 @@
+# Per-command latency for the fan plug, full discovery per command vs the cached DeviceRegistry
+# python -m benchmarks.fan_registry [discovery_timeout_s] [commands]
+import asyncio
+import statistics
+import sys
+from time import perf_counter
+
+from kasa import SmartDevice
+
+from benchmarks.fake_plug import FakePlug
+from fan_scripting import DeviceRegistry, State, discover, onoff_toggle, get_state
+
+
+def summarize(name: str, samples: list[float]):
+    ms: list[float] = sorted(s * 1000 for s in samples)
+    print(f"{name}\tn={len(ms)}\tmean={statistics.mean(ms):.2f}ms\tp50={ms[len(ms) // 2]:.2f}ms\tmax={ms[-1]:.2f}ms")
+
+
+async def legacy_command(alias: str, state: State, discovery_timeout_s: int):
+    # What onoff_toggle did before the registry: broadcast, update everything, then command
+    devices: dict[str, SmartDevice] = await discover(discovery_timeout_s, "127.0.0.1")
+    dev = devices[alias]
+    await dev.update()
+    if state == State.ON:
+        await dev.turn_on()
+    else:
+        await dev.turn_off()
+    for dev in devices.values():
+        await dev.protocol.close()
+
+
+async def main(discovery_timeout_s: int, commands: int):
+    plug: FakePlug = FakePlug()
+    await plug.start()
+
+    states: list[State] = [State.ON, State.OFF]
+    legacy: list[float] = []
+    for i in range(min(commands, 5)):
+        start: float = perf_counter()
+        await legacy_command(plug.alias, states[i % 2], discovery_timeout_s)
+        legacy.append(perf_counter() - start)
+
+    registry: DeviceRegistry = DeviceRegistry(discovery_timeout_s=discovery_timeout_s, discovery_target="127.0.0.1")
+    first_start: float = perf_counter()
+    await onoff_toggle(plug.alias, State.ON, registry)
+    first: float = perf_counter() - first_start
+
+    cached_commands: list[float] = []
+    cached_reads: list[float] = []
+    discoveries_before: int = plug.discovery_requests
+    for i in range(commands):
+        start: float = perf_counter()
+        await onoff_toggle(plug.alias, states[i % 2], registry)
+        cached_commands.append(perf_counter() - start)
+
+        start = perf_counter()
+        await get_state(plug.alias, registry)
+        cached_reads.append(perf_counter() - start)
+
+    print(f"discovery timeout {discovery_timeout_s}s (production uses 10s), plug latency {plug.latency_s * 1000:.1f}ms")
+    summarize("legacy discover+command", legacy)
+    print(f"registry first command (cold)\t{first * 1000:.2f}ms")
+    summarize("registry command (warm)", cached_commands)
+    summarize("registry state read (warm)", cached_reads)
+    print(f"discovery broadcasts during warm run: {plug.discovery_requests - discoveries_before}")
+
+    await registry.invalidate(plug.alias)
+    await plug.stop()
+
+
+if __name__ == "__main__":
+    timeout_s: int = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+    n: int = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    asyncio.run(main(timeout_s, n))
@@ -0,0 +1,78 @@
+# Reading controller measurements back: ORM entities (fetch_entities) turned into arrays vs SqliteStore.fetch_columns
+# python -m benchmarks.fetch_columns [rows]
+import os
+import sys
+import tempfile
+from datetime import datetime
+from time import perf_counter
+
+import numpy as np
+import pytz
+from sqlalchemy import Numeric
+from sqlalchemy.future import select
+
+from controller import ControllerCollect
+from sqlite import SqliteStore
+
+numeric_columns: list[str] = [column.key for column in ControllerCollect.__table__.columns
+                              if isinstance(column.type, Numeric)]
+
+
+def populate(store: SqliteStore, rows: int, start_epoch: int, chunk: int = 50000):
+    rng: np.random.Generator = np.random.default_rng(1)
+    columns: list[str] = [c for c in numeric_columns if not c.endswith("_ppm") or c == "co2_ppm"]
+    for offset in range(0, rows, chunk):
+        n: int = min(chunk, rows - offset)
+        epoch_ts: list[int] = (start_epoch + 60 * np.arange(offset, offset + n)).tolist()
+        values: np.ndarray = rng.normal(50, 10, (n, len(columns)))
+        batch: list[dict] = []
+        for i, (ts, row) in enumerate(zip(epoch_ts, values.tolist())):
+            record: dict = dict(zip(columns, row))
+            if i % 97 == 0:
+                # a control-only row, no sensor readings
+                record = {c: None for c in columns}
+            record.update(ts=datetime.fromtimestamp(ts, tz=pytz.UTC), epoch_ts=ts, fan_state="off",
+                          tstat_action="NO_CHANGE")
+            batch.append(record)
+        with store.engine.begin() as conn:
+            conn.execute(ControllerCollect.__table__.insert(), batch)
+
+
+def orm_arrays(store: SqliteStore, start: int, end: int, chunk_size: int = 10000) -> dict[str, np.ndarray]:
+    # streamed with yield_per, fetch_entities' .all() of a million rows doesn't fit in 6GB
+    stmt = (select(ControllerCollect).where(ControllerCollect.epoch_ts >= start, ControllerCollect.epoch_ts < end)
+            .order_by(ControllerCollect.epoch_ts).execution_options(yield_per=chunk_size))
+    values: dict[str, list[float]] = {name: [] for name in numeric_columns}
+    for rows in store.session.execute(stmt).scalars().partitions(chunk_size):
+        for name, column in values.items():
+            column.extend(np.nan if getattr(row, name) is None else float(getattr(row, name)) for row in rows)
+    store.session.rollback()
+    store.session.expunge_all()
+    return {name: np.array(column) for name, column in values.items()}
+
+
+if __name__ == "__main__":
+    rows: int = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    start_epoch: int = 1_700_000_000
+    with tempfile.TemporaryDirectory() as tmp:
+        store: SqliteStore = SqliteStore(os.path.join(tmp, "sensors"), [ControllerCollect], wal=True)
+        begin: float = perf_counter()
+        populate(store, rows, start_epoch)
+        print(f"{rows:,} controller rows written in {perf_counter() - begin:.1f}s, reading {len(numeric_columns)} "
+              f"numeric columns")
+
+        month: tuple[int, int] = (start_epoch, start_epoch + 30 * 86400)
+        everything: tuple[int, int] = (start_epoch, start_epoch + 60 * rows)
+        for name, (start, end) in (("one month", month), ("all rows", everything)):
+            begin = perf_counter()
+            orm: dict[str, np.ndarray] = orm_arrays(store, start, end)
+            orm_s: float = perf_counter() - begin
+            begin = perf_counter()
+            columns: dict[str, np.ndarray] = store.fetch_columns(ControllerCollect, numeric_columns, start, end)
+            columns_s: float = perf_counter() - begin
+            n: int = len(columns[numeric_columns[0]])
+            same: bool = all(np.allclose(orm[c], columns[c], equal_nan=True) for c in numeric_columns)
+            print(f"{name}, {n:,} rows\tORM {orm_s:.2f}s ({n / orm_s:,.0f} rows/s)\t"
+                  f"fetch_columns {columns_s:.2f}s ({n / columns_s:,.0f} rows/s)\t{orm_s / columns_s:.0f}x\t"
+                  f"same values {same}")
+            del orm, columns
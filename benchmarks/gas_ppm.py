@@ -0,0 +1,72 @@
+# Gas concentrations from MICS6814 resistances: the scalar gas_calcs methods per reading vs gas_calcs.concentrations,
+# then backfill_gas_ppm over a controller table of simulated minutely rows
+# python -m benchmarks.gas_ppm [readings] [rows]
+import os
+import sys
+import tempfile
+from datetime import datetime
+from time import perf_counter
+
+import numpy as np
+import pytz
+from sqlalchemy import text
+
+from controller import ControllerCollect, backfill_gas_ppm
+from gas_calcs import Ammonia, Oxidizing, Reducing, all_concentrations, ratios
+from sqlite import SqliteStore
+
+scalar_classes: dict[str, type] = {"reducing": Reducing, "oxidizing": Oxidizing, "ammonia": Ammonia}
+r0: dict[str, float] = {"reducing": 250000.0, "oxidizing": 20000.0, "ammonia": 100000.0}
+
+
+def resistances(n: int, rng: np.random.Generator) -> dict[str, np.ndarray]:
+    return {channel: r * rng.uniform(0.5, 1.5, n) for channel, r in r0.items()}
+
+
+def scalar(readings: dict[str, np.ndarray]) -> dict[str, dict[str, list[float]]]:
+    ret: dict[str, dict[str, list[float]]] = {}
+    for channel, values in readings.items():
+        cls: type = scalar_classes[channel]
+        methods = [(name, getattr(cls, name)) for name in vars(cls) if not name.startswith("_")]
+        ret[channel] = {name: [method(r / r0[channel]) for r in values.tolist()] for name, method in methods}
+    return ret
+
+
+if __name__ == "__main__":
+    n: int = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    rows: int = int(sys.argv[2]) if len(sys.argv) > 2 else 200000
+    rng: np.random.Generator = np.random.default_rng(1)
+    readings: dict[str, np.ndarray] = resistances(n, rng)
+
+    begin: float = perf_counter()
+    scalar(readings)
+    scalar_s: float = perf_counter() - begin
+    begin = perf_counter()
+    all_concentrations({channel: ratios(values, r0[channel]) for channel, values in readings.items()})
+    vector_s: float = perf_counter() - begin
+    print(f"{n:,} readings x 16 species\tscalar methods {scalar_s:.2f}s\tconcentrations {vector_s * 1000:.0f}ms")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store: SqliteStore = SqliteStore(os.path.join(tmp, "sensors"), [ControllerCollect], wal=True)
+        # minutely rows with a slow drift of the clean air resistance, every 50th row from do_control without gas
+        epoch_ts: np.ndarray = 1_700_000_000 + 60 * np.arange(rows)
+        drift: np.ndarray = 1 + 0.2 * epoch_ts / epoch_ts[-1]
+        gas: dict[str, np.ndarray] = {channel: values * drift for channel, values in resistances(rows, rng).items()}
+        values: list[dict] = [{"ts": datetime.fromtimestamp(t, tz=pytz.UTC),
+                               "epoch_ts": int(t), "reducing_ohm": r, "oxidizing_ohms": o, "ammonia_ohms": a}
+                              for t, r, o, a in zip(epoch_ts.tolist(), gas["reducing"].tolist(),
+                                                    gas["oxidizing"].tolist(), gas["ammonia"].tolist())]
+        for row in values[::50]:
+            row.update(reducing_ohm=None, oxidizing_ohms=None, ammonia_ohms=None)
+        with store.engine.begin() as conn:
+            conn.execute(ControllerCollect.__table__.insert(), values)
+
+        begin = perf_counter()
+        done: int = backfill_gas_ppm(store, chunk_size=10000)
+        elapsed: float = perf_counter() - begin
+        filled: int = store.session.execute(text("SELECT count(*) FROM controller WHERE co_ppm IS NOT NULL")).scalar()
+        print(f"backfill_gas_ppm\t{rows:,} rows\t{elapsed:.2f}s\t{rows / elapsed:,.0f} rows/s\t{filled:,} filled")
+        store.session.commit()
+        begin = perf_counter()
+        backfill_gas_ppm(store, chunk_size=10000)
+        print(f"rerun, only the rows without gas readings left\t{perf_counter() - begin:.2f}s")
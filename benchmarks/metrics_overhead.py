@@ -0,0 +1,46 @@
+# Cost of the metrics hot path, and what the control loop on simulated drivers exposes at /metrics
+# python -m benchmarks.metrics_overhead [ops] [cycles]
+import contextlib
+import io
+import sys
+from time import perf_counter
+from urllib.request import urlopen
+
+from benchmarks.control_loop import MemoryStore
+from controller import init_device_suite, data_control_loop
+from drivers import Backend
+from metrics import Histogram, MetricsServer, Registry, registry
+
+if __name__ == "__main__":
+    ops: int = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    cycles: int = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+
+    scratch: Registry = Registry()
+    histogram: Histogram = scratch.histogram("bench_seconds", "").labels()
+    counter = scratch.counter("bench", "").labels(device="gas")
+    family = scratch.counter("bench_lookup", "")
+    for name, op in (("Histogram.observe", lambda: histogram.observe(0.003)),
+                     ("Counter.inc", counter.inc),
+                     ("Family.labels().inc", lambda: family.labels(device="gas").inc())):
+        begin: float = perf_counter()
+        for _ in range(ops):
+            op()
+        print(f"{name}\t{(perf_counter() - begin) / ops * 1e9:.0f}ns")
+    begin = perf_counter()
+    for _ in range(ops):
+        with histogram.time():
+            pass
+    print(f"with Histogram.time()\t{(perf_counter() - begin) / ops * 1e9:.0f}ns")
+
+    devices = init_device_suite(Backend.SIMULATED)
+    with contextlib.redirect_stdout(io.StringIO()):
+        data_control_loop(devices, MemoryStore(), sleep_time=0, cycles=cycles)
+    server: MetricsServer = MetricsServer(port=0).start()
+    begin = perf_counter()
+    body: str = urlopen(server.url).read().decode()
+    print(f"scrape\t{(perf_counter() - begin) * 1000:.1f}ms\t{len(body):,} bytes\t"
+          f"{sum(1 for line in body.splitlines() if not line.startswith('#'))} samples")
+    server.stop()
+    for line in body.splitlines():
+        if line.split("{")[0].split(" ")[0].endswith(("_count", "_total")):
+            print(line)
@@ -0,0 +1,68 @@
+# The single 60s control loop vs MultiRateController on simulated drivers, time compressed by scale
+# python -m benchmarks.multi_rate [minutes] [scale]
+# Periods and sensor timings are multiplied by scale (0.05: a minute takes 3s). The PMS5003 blocks for its next frame
+# (~1s), the SCD4X has a new measurement every 30s, the other sensors answer in a few ms.
+import asyncio
+import contextlib
+import io
+import sys
+from time import perf_counter
+
+from acquisition import sensor_read_seconds
+from benchmarks.control_loop import MemoryStore
+from cadence import MultiRateController, cadence_cycle_seconds, default_periods_s
+from controller import control_loop_seconds, data_control_loop_async, init_device_suite
+from device import Device
+from drivers import Backend
+from metrics import Histogram
+from thermostat import thermostat_results
+
+def suite(scale: float) -> dict:
+    return init_device_suite(Backend.SIMULATED, options={
+        Device.WEATHER: {"latency_s": 0.004 * scale},
+        Device.LIGHT_PROX: {"latency_s": 0.003 * scale},
+        Device.GAS: {"latency_s": 0.02 * scale},
+        Device.PARTICULATE_MATTER: {"latency_s": 0.2 * scale, "jitter_s": 0.8 * scale},
+        Device.CO2: {"latency_s": 0.005 * scale, "measurement_interval_s": 30 * scale},
+    })
+
+def reads() -> dict[str, int]:
+    return {dict(labels)["device"]: child.count for labels, child in sensor_read_seconds.children.items()}
+
+
+def reads_since(before: dict[str, int]) -> str:
+    return ", ".join(f"{device} {n - before.get(device, 0)}" for device, n in reads().items())
+
+
+def decisions() -> int:
+    return int(sum(child.value for child in thermostat_results.children.values()))
+
+def summary(histogram: Histogram, scale: float) -> str:
+    return f"{histogram.count} cycles, mean {histogram.sum / max(histogram.count, 1) / scale * 1000:.0f}ms"
+
+if __name__ == "__main__":
+    minutes: int = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    scale: float = float(sys.argv[2]) if len(sys.argv) > 2 else 0.05
+
+    store: MemoryStore = MemoryStore()
+    before: int = decisions()
+    before_reads: dict[str, int] = reads()
+    begin: float = perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        asyncio.run(data_control_loop_async(suite(scale), store, sleep_time=60 * scale, cycles=minutes))
+    print(f"single 60s loop\t{perf_counter() - begin:.1f}s\t{len(store.rows)} rows\t"
+          f"{decisions() - before} thermostat decisions, one per {60 * minutes / max(decisions() - before, 1):.0f}s\t"
+          f"reads {reads_since(before_reads)}\tcycle {summary(control_loop_seconds.labels(), scale)} (unscaled)")
+
+    store = MemoryStore()
+    before = decisions()
+    before_reads = reads()
+    controller: MultiRateController = MultiRateController(
+        suite(scale), store, control_period_s=5 * scale, collect_period_s=60 * scale,
+        periods_s={device: period_s * scale for device, period_s in default_periods_s.items()})
+    begin = perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        asyncio.run(controller.run(collections=minutes))
+    print(f"MultiRateController\t{perf_counter() - begin:.1f}s\t{controller.rows_stored} rows\t"
+          f"{decisions() - before} thermostat decisions, one per {60 * minutes / max(decisions() - before, 1):.0f}s\t"
+          f"reads {reads_since(before_reads)}\tcontrol {summary(cadence_cycle_seconds.labels(cadence='control'), scale)} (unscaled)")
@@ -0,0 +1,62 @@
+# NoiseStatistics over a day of synthetic 0.25s block levels: cost per block, accuracy against exact percentiles over
+# all stored levels, and the rows written through SqliteStore's buffered path
+# python -m benchmarks.noise_stats [hours]
+import math
+import os
+import sys
+import tempfile
+from time import perf_counter
+
+import numpy as np
+from sqlalchemy import text
+
+from noise_stats import NoiseLevel, NoiseStatistics
+from sqlite import SqliteStore
+
+ref_level: float = 0.000001
+block_s: float = 0.25
+
+if __name__ == "__main__":
+    hours: float = float(sys.argv[1]) if len(sys.argv) > 1 else 24
+    blocks: int = int(hours * 3600 / block_s)
+    rng: np.random.Generator = np.random.default_rng(1)
+    # 45dB background with a daily swing, plus short loud events
+    t: np.ndarray = 1_700_000_000 // 86400 * 86400 + np.arange(blocks) * block_s
+    levels_db: np.ndarray = (45 + 8 * np.sin(2 * np.pi * t / 86400) + rng.normal(0, 2, blocks)
+                             + (rng.random(blocks) < 0.02) * rng.uniform(10, 35, blocks))
+    rms: np.ndarray = ref_level * 10 ** (levels_db / 20)
+    print(f"{hours:.0f}h, {blocks:,} blocks")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store: SqliteStore = SqliteStore(os.path.join(tmp, "sensors"), [NoiseLevel], buffered=True, batch_size=16,
+                                         flush_interval_s=None, wal=True)
+        statistics: NoiseStatistics = NoiseStatistics(ref_level)
+        begin: float = perf_counter()
+        for ts, value in zip(t.tolist(), rms.tolist()):
+            rows = statistics.add(ts, value)
+            if rows:
+                store.store_rows(rows)
+        store.store_rows(statistics.close())
+        store.close()
+        elapsed: float = perf_counter() - begin
+        print(f"NoiseStatistics\t{elapsed / blocks * 1e6:.1f}us/block, "
+              f"{sum(w.levels.counts.nbytes for w in statistics.windows) / 1000:.0f}kB of sketches")
+
+        worst: dict[str, float] = {"leq_db": 0.0, "lmax_db": 0.0, "l10_db": 0.0, "l90_db": 0.0}
+        stored = store.session.execute(text(
+            "SELECT window_s, epoch_ts, leq_db, lmax_db, l10_db, l90_db FROM noise_level ORDER BY window_s, epoch_ts"
+        )).all()
+        for window_s, epoch_ts, *values in stored:
+            window: np.ndarray = (epoch_ts <= t) & (t < epoch_ts + window_s)
+            exact: dict[str, float] = {
+                "leq_db": 10 * math.log10(np.mean(np.square(rms[window])) / ref_level ** 2),
+                "lmax_db": float(np.max(levels_db[window])),
+                "l10_db": float(np.percentile(levels_db[window], 90)),
+                "l90_db": float(np.percentile(levels_db[window], 10)),
+            }
+            for (name, value), got in zip(exact.items(), values):
+                worst[name] = max(worst[name], abs(got - value))
+        per_window: dict[int, int] = dict(store.session.execute(text(
+            "SELECT window_s, count(*) FROM noise_level GROUP BY window_s")).all())
+        print(f"stored {per_window.get(60, 0)} 1-min and {per_window.get(900, 0)} 15-min rows, worst error against "
+              f"exact: " + ", ".join(f"{name} {error:.3f}dB" for name, error in worst.items()))
@@ -0,0 +1,187 @@
+# Local stand-in for api.weather.gov serving recorded payloads, and a fetch/store comparison against it
+# python -m benchmarks.nws_standin [cycles] [payload_dir]
+# payload_dir mirrors the API paths, e.g. payload_dir/gridpoints/PQR/112,103/forecast/hourly.json, record with
+#   curl -H 'User-Agent: (me)' https://api.weather.gov/gridpoints/PQR/112,103/forecast/hourly > .../hourly.json
+# Without payload_dir a forecast and an observation in the same shape are generated.
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import perf_counter, time
+from typing import Optional
+
+import pytz
+import requests
+
+from nws_client import NwsClient, forecast_path, forecast_rows, observation_path, observation_rows
+from sqlite import SqliteStore
+from timeseries import ChangeFilter, MetadataWriter, Timeseries, TimeseriesID, DatetimeMask, VersionedTimeseries
+
+
+def generated_forecast(start: datetime, hours: int = 156, revision: int = 0) -> dict:
+    """Hourly periods from start, a period's content depends on its own hour, and on revision for 1 in 5 hours."""
+    periods: list[dict] = []
+    for h in range(hours):
+        ts: datetime = start + timedelta(hours=h)
+        hour: int = int(ts.timestamp()) // 3600
+        periods.append({
+            "number": h + 1, "name": "", "startTime": ts.isoformat(), "endTime": (ts + timedelta(hours=1)).isoformat(),
+            "isDaytime": 6 <= ts.hour < 18, "temperature": 50 + ts.hour // 2 + (revision % 3 if hour % 5 == 0 else 0),
+            "temperatureUnit": "F", "temperatureTrend": None,
+            "probabilityOfPrecipitation": {"unitCode": "wmoUnit:percent", "value": hour % 40},
+            "dewpoint": {"unitCode": "wmoUnit:degC", "value": 5.0 + hour % 7},
+            "relativeHumidity": {"unitCode": "wmoUnit:percent", "value": 60 + hour % 30},
+            "windSpeed": f"{hour % 12} mph", "windDirection": "SSW",
+            "icon": f"https://api.weather.gov/icons/land/{'day' if 6 <= ts.hour < 18 else 'night'}/rain,{hour % 40}"
+                    f"?size=small",
+            "shortForecast": "Chance Light Rain", "detailedForecast": "",
+        })
+    return {"type": "Feature", "properties": {"updated": start.isoformat(), "units": "us", "periods": periods}}
+
+
+def generated_observation(ts: datetime) -> dict:
+    return {"type": "Feature", "properties": {
+        "station": "https://api.weather.gov/stations/KPDX", "timestamp": ts.isoformat(),
+        "textDescription": "Cloudy", "temperature": {"unitCode": "wmoUnit:degC", "value": 11.1, "qualityControl": "V"},
+        "relativeHumidity": {"unitCode": "wmoUnit:percent", "value": 80.5, "qualityControl": "V"},
+    }}
+
+
+class NwsStandIn:
+    """Serves a payload per API path with ETag and Last-Modified, and answers conditional requests with 304."""
+    def __init__(self, payloads: dict[str, dict], host: str = "127.0.0.1", port: int = 0):
+        self.payloads: dict[str, tuple[bytes, str, str]] = {}
+        for path, payload in payloads.items():
+            self.publish(path, payload)
+        self.requests: int = 0
+        self.not_modified: int = 0
+        self.connections: int = 0
+
+        standin: NwsStandIn = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                standin.connections += 1
+                super().setup()
+
+            def do_GET(self):
+                standin.requests += 1
+                entry: Optional[tuple[bytes, str, str]] = standin.payloads.get(self.path.lstrip("/"))
+                if entry is None:
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                body, etag, last_modified = entry
+                if self.headers.get("If-None-Match") == etag:
+                    standin.not_modified += 1
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "application/geo+json")
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("ETag", etag)
+                self.send_header("Last-Modified", last_modified)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server: ThreadingHTTPServer = ThreadingHTTPServer((host, port), Handler)
+        self.thread: threading.Thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def publish(self, path: str, payload: dict):
+        body: bytes = json.dumps(payload).encode()
+        self.payloads[path] = (body, f'"{hashlib.sha1(body).hexdigest()}"', formatdate(time(), usegmt=True))
+
+    def start(self) -> "NwsStandIn":
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def load_recorded(payload_dir: str) -> dict[str, dict]:
+    payloads: dict[str, dict] = {}
+    for root, _, files in os.walk(payload_dir):
+        for name in files:
+            if name.endswith(".json"):
+                path: str = os.path.relpath(os.path.join(root, name[:-len(".json")]), payload_dir)
+                with open(os.path.join(root, name)) as f:
+                    payloads[path.replace(os.sep, "/")] = json.load(f)
+    return payloads
+
+
+if __name__ == "__main__":
+    cycles: int = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+    payload_dir: Optional[str] = sys.argv[2] if len(sys.argv) > 2 else None
+
+    start: datetime = datetime(2024, 1, 1, tzinfo=pytz.UTC)
+    payloads: dict[str, dict] = load_recorded(payload_dir) if payload_dir else {
+        forecast_path: generated_forecast(start), observation_path: generated_observation(start)}
+    # the forecast is reissued every 10th fetch with 3 periods changed, the observation every 3rd
+    reissue_every: int = 10
+
+    def reissue(standin: NwsStandIn, cycle: int):
+        if cycle and cycle % reissue_every == 0:
+            forecast: dict = json.loads(json.dumps(payloads[forecast_path]))
+            for p in forecast["properties"]["periods"][:3]:
+                p["temperature"] += cycle
+            standin.publish(forecast_path, forecast)
+        if cycle and cycle % 3 == 0:
+            obs: dict = json.loads(json.dumps(payloads[observation_path]))
+            obs["properties"]["timestamp"] = (start + timedelta(hours=cycle // 3)).isoformat()
+            standin.publish(observation_path, obs)
+
+    print(f"{cycles} fetch cycles of forecast + observation")
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in ("requests.get", "NwsClient+ChangeFilter"):
+            standin: NwsStandIn = NwsStandIn(payloads).start()
+            store: SqliteStore = SqliteStore(os.path.join(tmp, name), [Timeseries, TimeseriesID, DatetimeMask],
+                                             write_hooks=[MetadataWriter()])
+            client: NwsClient = NwsClient(standin.url)
+            changes: ChangeFilter = ChangeFilter(VersionedTimeseries(store))
+            stored: int = 0
+            begin: float = perf_counter()
+            for cycle in range(cycles):
+                reissue(standin, cycle)
+                data_ts: datetime = start + timedelta(minutes=20 * cycle)
+                if name == "requests.get":
+                    rows: list[Timeseries] = forecast_rows(
+                        requests.get(f"{standin.url}/{forecast_path}", timeout=10).json(), data_ts)
+                    rows += observation_rows(requests.get(f"{standin.url}/{observation_path}", timeout=10).json(),
+                                             data_ts)
+                else:
+                    rows = []
+                    payload, modified = client.get_json(forecast_path)
+                    if modified:
+                        rows += changes.changed(forecast_rows(payload, data_ts))
+                    payload, modified = client.get_json(observation_path)
+                    if modified:
+                        rows += changes.changed(observation_rows(payload, data_ts))
+                store.store_rows(rows)
+                stored += len(rows)
+            elapsed: float = perf_counter() - begin
+            print(f"{name}\t{elapsed / cycles * 1000:.1f}ms/cycle\t{standin.connections} connections\t"
+                  f"{standin.not_modified}/{standin.requests} not modified\t{stored} rows stored")
+            client.close()
+            standin.stop()
+            store.session.close()
@@ -0,0 +1,70 @@
+# Controller history in one file vs rolled into monthly partitions by retention.compact: main file size, recent and
+# multi-month fetch_columns reads, and how long the roll, downsampling and VACUUM take
+# python -m benchmarks.partitions [months] [retain_months]
+import glob
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+from time import perf_counter
+
+import numpy as np
+import pytz
+
+from benchmarks.fetch_columns import numeric_columns, populate
+from controller import ControllerCollect
+from retention import compact
+from rollup import Rollup
+from sqlite import SqliteStore, month_start
+
+
+def reads(store: SqliteStore, now: datetime) -> list[tuple[str, float, int, float]]:
+    ret: list[tuple[str, float, int, float]] = []
+    for name, days in (("last day", 1), ("last week", 7), ("last 90 days", 90)):
+        # best of 3, warm cache
+        best_s: float = float("inf")
+        for _ in range(3):
+            begin: float = perf_counter()
+            columns: dict[str, np.ndarray] = store.fetch_columns(ControllerCollect, numeric_columns,
+                                                                 now - timedelta(days=days), now)
+            best_s = min(best_s, perf_counter() - begin)
+        ret.append((name, best_s, len(columns["temp_F"]), float(np.nansum(columns["temp_F"]))))
+    return ret
+
+
+def size_mb(path: str) -> float:
+    return sum(os.path.getsize(p) for p in glob.glob(path + "*")) / 1e6
+
+
+if __name__ == "__main__":
+    months: int = int(sys.argv[1]) if len(sys.argv) > 1 else 24
+    retain_months: int = int(sys.argv[2]) if len(sys.argv) > 2 else 12
+    now: datetime = datetime.now(tz=pytz.UTC).replace(microsecond=0)
+    first: datetime = month_start(now - timedelta(days=30.5 * (months - 1)))
+    rows: int = int((now - first).total_seconds() // 60)
+    with tempfile.TemporaryDirectory() as tmp:
+        path: str = os.path.join(tmp, "sensors")
+        store: SqliteStore = SqliteStore(path, [ControllerCollect, Rollup], wal=True, partitioned=[ControllerCollect])
+        begin: float = perf_counter()
+        populate(store, rows, int(first.timestamp()))
+        store.vacuum()
+        print(f"{rows} rows, one a minute from {first:%Y-%m}, populated in {perf_counter() - begin:.1f}s")
+        before_mb: float = size_mb(path + ".sqlite")
+        before = reads(store, now)
+
+        begin = perf_counter()
+        moved: int = compact(store, retain_months)
+        compact_s: float = perf_counter() - begin
+        after_mb: float = size_mb(path + ".sqlite")
+        partitions: list[datetime] = store.partition_months()
+        partitions_mb: float = sum(size_mb(store.partition_path(month)) for month in partitions)
+        after = reads(store, now)
+        buckets: int = store.session.execute("SELECT count(*) FROM rollup").scalar()
+
+        print(f"compact: {moved} rows moved, {compact_s:.1f}s, {len(partitions)} partitions kept "
+              f"({partitions_mb:.0f} MB), {buckets} rollup buckets")
+        print(f"main file {before_mb:.1f} MB -> {after_mb:.1f} MB")
+        for (name, before_s, before_n, before_sum), (_, after_s, after_n, after_sum) in zip(before, after):
+            print(f"{name:13s} one file {before_s * 1000:7.1f}ms {before_n:7d} rows   "
+                  f"partitioned {after_s * 1000:7.1f}ms {after_n:7d} rows   "
+                  f"{'same' if (before_n, before_sum) == (after_n, after_sum) else 'past retention dropped'}")
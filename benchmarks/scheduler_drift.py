@@ -0,0 +1,48 @@
+# Cycle start times of work-then-sleep(period) vs FixedRateScheduler (skip and catch-up), real time
+# python -m benchmarks.scheduler_drift [cycles] [period_s]
+# Work takes 30% of the period with noise, and every 40th cycle stalls for 3.5 periods like a Kasa rediscovery.
+import random
+import sys
+from time import monotonic, sleep
+from typing import Callable
+
+from scheduler import FixedRateScheduler, OverrunPolicy, Tick
+
+
+def work(cycle: int, period_s: float, rng: random.Random):
+    sleep(period_s * (3.5 if cycle % 40 == 39 else rng.uniform(0.2, 0.4)))
+
+
+def report(name: str, starts: list[float], stamps: list[float], period_s: float, missed: int = 0):
+    # drift: where the last cycle started against the fixed cadence from the first one, periods dropped included
+    first: float = starts[0]
+    drift_s: float = starts[-1] - first - (len(starts) - 1 + missed) * period_s
+    print(f"{name:<20}{len(starts)} cycles, {missed} periods dropped\tdrift of the last cycle {drift_s * 1000:+.1f}ms\t"
+          f"duplicate stamps {len(stamps) - len(set(stamps))}")
+
+
+if __name__ == "__main__":
+    cycles: int = int(sys.argv[1]) if len(sys.argv) > 1 else 120
+    period_s: float = float(sys.argv[2]) if len(sys.argv) > 2 else 0.1
+
+    rng: random.Random = random.Random(1)
+    starts: list[float] = []
+    stamps: list[float] = []
+    for cycle in range(cycles):
+        starts.append(monotonic())
+        stamps.append(round(starts[-1] / period_s))
+        work(cycle, period_s, rng)
+        sleep(period_s)
+    report("sleep after work", starts, stamps, period_s)
+
+    for policy in OverrunPolicy:
+        rng = random.Random(1)
+        scheduler: FixedRateScheduler = FixedRateScheduler(period_s, policy, name=f"bench-{policy.value}")
+        starts, stamps = [], []
+        for cycle in range(cycles):
+            tick: Tick = scheduler.wait()
+            starts.append(monotonic())
+            stamps.append(round(tick.ts.timestamp() / period_s))
+            work(cycle, period_s, rng)
+        report(f"scheduler {policy.value}", starts, stamps, period_s, scheduler.stats.missed)
+        print(f"{'':<20}{scheduler.stats}")
@@ -0,0 +1,65 @@
+# CPU used by the SPL monitor loop on a synthetic 48kHz microphone: busy polling vs the queue fed loop in Noise.run
+# python -m benchmarks.spl_loop [seconds] [display_type]
+import sys
+import threading
+import time
+
+from PIL import Image, ImageDraw, ImageFont
+
+import northcliff_spl
+from northcliff_spl import Noise
+from simulated import SimulatedAudioStream, SimulatedLTR559, SimulatedPanel
+
+
+class BusyPollingNoise(Noise):
+    """Noise.run as it was: spin on the callback counter and read proximity on every pass."""
+    def process_frames(self, recording, frames, time, status):
+        self.raw.write(recording)
+        self.sample_counter += 1
+
+    def run(self):
+        self.running.set()
+        with self.stream:
+            while self.running.is_set():
+                if self.sample_counter != self.previous_sample_count:
+                    self.previous_sample_count = self.sample_counter
+                    self.process_block(self.sample_counter, self.raw.frames_written)
+                self.poll_proximity()
+
+
+class CountingProximity:
+    def __init__(self):
+        self.sensor: SimulatedLTR559 = SimulatedLTR559()
+        self.reads: int = 0
+
+    def __call__(self) -> float:
+        self.reads += 1
+        return self.sensor.get_proximity()
+
+
+def measure(noise_type: type, seconds: float, display_type: int) -> str:
+    panel: SimulatedPanel = SimulatedPanel()
+    img = Image.new('RGB', (panel.width, panel.height), color=(0, 0, 0))
+    fonts = [ImageFont.load_default(size=size) for size in (11, 16, 24, 32)]
+    proximity: CountingProximity = CountingProximity()
+    stream: SimulatedAudioStream = SimulatedAudioStream(seed=1)
+    noise: Noise = noise_type(northcliff_spl.spl_ref_level, False, False, panel, panel.width, panel.height, *fonts,
+                              (0, 0, 0), display_type, img, ImageDraw.Draw(img), stream=stream, proximity=proximity)
+    stream.callback = noise.process_frames
+
+    threading.Timer(seconds, noise.stop).start()
+    cpu: float = time.process_time()
+    wall: float = time.perf_counter()
+    noise.run()
+    cpu = time.process_time() - cpu
+    wall = time.perf_counter() - wall
+    return (f"{noise_type.__name__}\tCPU {cpu / wall * 100:.1f}% of a core\t{stream.blocks} blocks, "
+            f"{panel.frames_pushed} frames, {proximity.reads / wall:,.0f} proximity reads/s")
+
+
+if __name__ == "__main__":
+    seconds: float = float(sys.argv[1]) if len(sys.argv) > 1 else 5.0
+    display_type: int = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+    print(f"{seconds:.0f}s per loop, display type {display_type}, 12000 sample blocks at 48kHz")
+    for noise_type in (BusyPollingNoise, Noise):
+        print(measure(noise_type, seconds, display_type))
@@ -0,0 +1,45 @@
+# Rows/s for one transaction per row vs the buffered write-behind mode of SqliteStore
+# python -m benchmarks.sqlite_batching [rows]
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+from time import perf_counter
+
+import pytz
+
+from sqlite import SqliteStore
+from timeseries import MetadataWriter, Timeseries, TimeseriesID, DatetimeMask, NumericTimeseries
+
+
+def make_rows(n: int, start: datetime) -> list[Timeseries]:
+    return [NumericTimeseries(series_id="bench", ts=start + timedelta(seconds=60 * i), version_ts=start,
+                              value_=str(20 + (i % 100) / 10), row_metadata={"i": i})
+            for i in range(n)]
+
+
+def run(name: str, n: int, single: bool, **store_kwargs):
+    with tempfile.TemporaryDirectory() as tmp:
+        store: SqliteStore = SqliteStore(os.path.join(tmp, "bench"), [Timeseries, TimeseriesID, DatetimeMask],
+                                         write_hooks=[MetadataWriter()], **store_kwargs)
+        rows: list[Timeseries] = make_rows(n, datetime(2022, 1, 1, tzinfo=pytz.UTC))
+
+        start: float = perf_counter()
+        if single:
+            for row in rows:
+                store.store_row(row)
+        else:
+            for row in rows:
+                store.store_row(row)
+            store.close()
+        elapsed: float = perf_counter() - start
+        print(f"{name}\t{n} rows\t{elapsed:.2f}s\t{n / elapsed:,.0f} rows/s")
+
+
+if __name__ == "__main__":
+    n: int = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    run("single, rollback journal", n, True)
+    run("single, WAL", n, True, wal=True)
+    run("buffered x100, rollback journal", n, False, buffered=True, batch_size=100, flush_interval_s=None)
+    run("buffered x100, WAL", n, False, buffered=True, batch_size=100, flush_interval_s=None, wal=True)
+    run("buffered x1000, WAL", n, False, buffered=True, batch_size=1000, flush_interval_s=None, wal=True)
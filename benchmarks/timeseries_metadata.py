@@ -0,0 +1,86 @@
+# row_metadata inline as JSON on every row vs content-addressed in timeseries_metadata, size and value scan time
+# python -m benchmarks.timeseries_metadata [versions]
+# Forecasts are the generated NWS hourly payloads from benchmarks.nws_standin, 24 periods per version, two a day.
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+from datetime import datetime, timedelta
+from time import perf_counter
+
+import pytz
+from sqlalchemy import text
+
+from benchmarks.nws_standin import generated_forecast
+from nws_client import forecast_rows
+from sqlite import SqliteStore
+from timeseries import MetadataWriter, Timeseries, TimeseriesID, DatetimeMask, VersionedTimeseries
+
+inline_ddl: str = """
+CREATE TABLE timeseries (
+    series_id TEXT NOT NULL,
+    ts INTEGER NOT NULL,
+    version_ts INTEGER NOT NULL,
+    value REAL NOT NULL,
+    row_metadata JSON,
+    created_at INTEGER,
+    PRIMARY KEY (series_id, ts, version_ts)
+)
+"""
+
+
+def scan(path: str) -> float:
+    conn: sqlite3.Connection = sqlite3.connect(path)
+    best: float = float("inf")
+    for _ in range(3):
+        begin: float = perf_counter()
+        conn.execute("SELECT ts, value FROM timeseries NOT INDEXED WHERE series_id = ?",
+                     ("nws-hourly-forecast",)).fetchall()
+        best = min(best, perf_counter() - begin)
+    conn.close()
+    return best
+
+
+if __name__ == "__main__":
+    versions: int = int(sys.argv[1]) if len(sys.argv) > 1 else 4000
+    start: datetime = datetime(2020, 1, 1, tzinfo=pytz.UTC)
+    batches: list[list[Timeseries]] = []
+    for v in range(versions):
+        version_ts: datetime = start + timedelta(hours=12 * v)
+        batches.append(forecast_rows(generated_forecast(version_ts, hours=24, revision=v), version_ts))
+    rows: int = sum(len(batch) for batch in batches)
+    print(f"{versions} versions, {rows:,} rows")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        inline: str = os.path.join(tmp, "inline.sqlite")
+        conn: sqlite3.Connection = sqlite3.connect(inline)
+        conn.execute(inline_ddl)
+        conn.executemany("INSERT INTO timeseries (series_id, ts, version_ts, value, row_metadata) VALUES (?, ?, ?, ?, ?)",
+                         [(row.series_id, int(row.ts.timestamp()), int(row.version_ts.timestamp()), row.value_,
+                           json.dumps(row.row_metadata)) for batch in batches for row in batch])
+        conn.commit()
+        conn.close()
+        print(f"inline JSON\t{os.path.getsize(inline) / 1e6:.1f}MB\tvalue scan {scan(inline) * 1000:.1f}ms")
+
+        for name, compress in (("content-addressed", False), ("content-addressed+zlib", True)):
+            db: str = os.path.join(tmp, name)
+            store: SqliteStore = SqliteStore(db, [Timeseries, TimeseriesID, DatetimeMask], buffered=True,
+                                             batch_size=10000, flush_interval_s=None,
+                                             write_hooks=[MetadataWriter(compress=compress)])
+            for batch in batches:
+                store.store_rows(batch)
+            store.flush()
+            distinct: int = store.session.execute(text("SELECT count(*) FROM timeseries_metadata")).scalar()
+
+            latest = VersionedTimeseries(store).latest("nws-hourly-forecast", start, start + timedelta(days=30))
+            begin: float = perf_counter()
+            values: list[float] = [row.value for row in latest]
+            values_s: float = perf_counter() - begin
+            begin = perf_counter()
+            metadata: list[dict] = [row.row_metadata for row in latest]
+            metadata_s: float = perf_counter() - begin
+            store.session.close()
+            print(f"{name}\t{os.path.getsize(f'{db}.sqlite') / 1e6:.1f}MB\tvalue scan {scan(f'{db}.sqlite') * 1000:.1f}ms"
+                  f"\t{distinct} distinct payloads\t{len(values)} values {values_s * 1000:.2f}ms, "
+                  f"metadata loaded lazily {metadata_s * 1000:.1f}ms")
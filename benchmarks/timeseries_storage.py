@@ -0,0 +1,96 @@
+# DB size and range-read latency of the old DATETIME/TEXT timeseries layout vs epoch INTEGER/REAL after migration
+# python -m benchmarks.timeseries_storage [rows]
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+from datetime import datetime, timedelta
+from time import perf_counter
+
+import pytz
+
+from sqlite import SqliteStore
+from timeseries import Timeseries, TimeseriesID, DatetimeMask, VersionedTimeseries
+
+legacy_ddl: str = """
+CREATE TABLE timeseries (
+    series_id TEXT NOT NULL,
+    ts DATETIME NOT NULL,
+    version_ts DATETIME NOT NULL,
+    value TEXT NOT NULL,
+    row_metadata JSON,
+    created_at DATETIME DEFAULT (CURRENT_TIMESTAMP),
+    PRIMARY KEY (series_id, ts, version_ts)
+)
+"""
+fmt: str = "%Y-%m-%d %H:%M:%S.%f"
+t0: datetime = datetime(2010, 1, 1)
+horizon_h: int = 24
+
+
+def build_legacy(path: str, rows: int):
+    conn: sqlite3.Connection = sqlite3.connect(path)
+    conn.execute(legacy_ddl)
+    batch: list[tuple] = []
+    for v in range(rows // horizon_h):
+        version_ts: datetime = t0 + timedelta(hours=12 * v)
+        for h in range(horizon_h):
+            ts: datetime = version_ts + timedelta(hours=h)
+            batch.append(("nws-hourly-forecast", ts.strftime(fmt), version_ts.strftime(fmt), str(40.0 + (v + h) % 50),
+                          json.dumps({"number": h, "isDaytime": h < 12})))
+        if len(batch) >= 100000:
+            conn.executemany("INSERT INTO timeseries (series_id, ts, version_ts, value, row_metadata) "
+                             "VALUES (?, ?, ?, ?, ?)", batch)
+            batch = []
+    conn.executemany("INSERT INTO timeseries (series_id, ts, version_ts, value, row_metadata) VALUES (?, ?, ?, ?, ?)",
+                     batch)
+    conn.commit()
+    conn.close()
+
+
+def range_read(path: str, start, end) -> tuple[float, int]:
+    conn: sqlite3.Connection = sqlite3.connect(path)
+    best: float = float("inf")
+    n: int = 0
+    for _ in range(5):
+        begin: float = perf_counter()
+        values: list[float] = [float(v) for ts, v in conn.execute(
+            "SELECT ts, value FROM timeseries WHERE series_id = ? AND ? <= ts AND ts < ?",
+            ("nws-hourly-forecast", start, end))]
+        best = min(best, perf_counter() - begin)
+        n = len(values)
+    conn.close()
+    return best, n
+
+
+if __name__ == "__main__":
+    rows: int = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    start: datetime = t0 + timedelta(hours=12 * (rows // horizon_h) // 2)
+    end: datetime = start + timedelta(days=30)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db: str = os.path.join(tmp, "timeseries")
+        build_legacy(f"{db}.sqlite", rows)
+        print(f"{rows:,} rows, 30 day range read")
+        elapsed, n = range_read(f"{db}.sqlite", start.strftime(fmt), end.strftime(fmt))
+        print(f"before\t{os.path.getsize(f'{db}.sqlite') / 1e6:.1f}MB\trange read {n} rows {elapsed * 1000:.1f}ms")
+
+        begin: float = perf_counter()
+        store: SqliteStore = SqliteStore(db, [Timeseries, TimeseriesID, DatetimeMask])
+        print(f"migration {perf_counter() - begin:.1f}s")
+        store.session.close()
+        conn: sqlite3.Connection = sqlite3.connect(f"{db}.sqlite")
+        conn.execute("VACUUM")
+        conn.close()
+
+        epoch_start: int = int(start.replace(tzinfo=pytz.UTC).timestamp())
+        epoch_end: int = int(end.replace(tzinfo=pytz.UTC).timestamp())
+        elapsed, n = range_read(f"{db}.sqlite", epoch_start, epoch_end)
+        print(f"after\t{os.path.getsize(f'{db}.sqlite') / 1e6:.1f}MB\trange read {n} rows {elapsed * 1000:.1f}ms")
+
+        versioned: VersionedTimeseries = VersionedTimeseries(store)
+        begin = perf_counter()
+        latest = versioned.latest("nws-hourly-forecast", start, end)
+        print(f"after\tVersionedTimeseries.latest {len(latest)} rows {(perf_counter() - begin) * 1000:.1f}ms")
+        store.session.close()
@@ -0,0 +1,142 @@
+# Versioned timeseries reads: the ad-hoc SQL from versioned_sql_testing.py vs timeseries.VersionedTimeseries
+# python -m benchmarks.versioned_queries [rows] [db_path]
+# The DB is built once and reused, delete it to regenerate. "query" rows run the API's statement for the same plain
+# (ts, version_ts, value) rows as the legacy SQL, the API rows add building the ORM entities.
+import calendar
+import os
+import sqlite3
+import sys
+from datetime import datetime, timedelta
+from time import perf_counter
+
+import pytz
+from sqlalchemy import text
+
+from sqlite import SqliteStore
+from timeseries import (NumericTimeseries, Timeseries, TimeseriesID, DatetimeMask, VersionedTimeseries, latest_query,
+                        scenario_query)
+
+horizon_h: int = 48  # each version is an hourly forecast 48 hours out, issued every hour
+t0: datetime = datetime(2000, 1, 1)
+
+legacy_latest_sql: str = """
+WITH ver AS (
+    SELECT
+        MAX(version_ts) as max_ver,
+        ts
+    FROM timeseries
+    WHERE {0} <= ts AND ts < {1} AND series_id = 'bench'
+    GROUP BY ts, series_id
+)
+SELECT t.ts, t.version_ts, t.value
+FROM timeseries AS t
+INNER JOIN ver
+    ON ver.ts = t.ts
+        AND ver.max_ver = t.version_ts
+ORDER BY t.ts DESC
+"""
+
+legacy_scenario_sql: str = """
+WITH cte AS (
+    SELECT
+        version_ts,
+        MIN(ts) as min_ts,
+        LAG(MIN(ts), 1, NULL) OVER (ORDER BY version_ts DESC) as lag_ts
+    FROM timeseries
+    WHERE {0} <= ts AND ts < {1} AND series_id = 'bench'
+    GROUP BY version_ts, series_id
+)
+SELECT t.ts, t.version_ts, t.value
+FROM timeseries t
+INNER JOIN cte
+    ON t.version_ts = cte.version_ts
+        AND cte.min_ts <= t.ts
+        AND (lag_ts IS NULL OR t.ts < lag_ts)
+-- versioned_sql_testing.py leaves these out and returns the newest version's rows past the window too
+WHERE t.series_id = 'bench' AND t.ts < {1}
+ORDER BY t.ts DESC;
+"""
+
+
+def epoch(ts: datetime) -> int:
+    # naive is UTC, as TimeseriesValue stores it
+    return calendar.timegm(ts.timetuple())
+
+
+def build(path: str, rows: int):
+    # Plain sqlite3 executemany, the ORM would take an hour to load this. Epoch INTEGER timestamps and REAL values,
+    # the layout TimeseriesValue reads
+    conn: sqlite3.Connection = sqlite3.connect(path)
+    versions: int = rows // horizon_h
+    batch: list[tuple] = []
+    for v in range(versions):
+        vts: int = epoch(t0 + timedelta(hours=v))
+        for h in range(1, horizon_h + 1):
+            batch.append(("bench", vts + 3600 * h, vts, float(10 + (v + h) % 20)))
+        if len(batch) >= 200000:
+            conn.executemany("INSERT INTO timeseries (series_id, ts, version_ts, value) VALUES (?, ?, ?, ?)", batch)
+            batch = []
+            print(f"\r{v * horizon_h:,} rows", end="", flush=True)
+    conn.executemany("INSERT INTO timeseries (series_id, ts, version_ts, value) VALUES (?, ?, ?, ?)", batch)
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.close()
+    print()
+
+
+def timed(fn, repeat: int = 5) -> tuple[float, int]:
+    best: float = float("inf")
+    n: int = 0
+    for _ in range(repeat):
+        start: float = perf_counter()
+        n = len(fn())
+        best = min(best, perf_counter() - start)
+    return best, n
+
+
+if __name__ == "__main__":
+    rows: int = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000_000
+    db: str = sys.argv[2] if len(sys.argv) > 2 else "versioned_bench"
+
+    fresh: bool = not os.path.exists(f"{db}.sqlite")
+    store: SqliteStore = SqliteStore(db, [Timeseries, TimeseriesID, DatetimeMask])
+    if fresh:
+        build(f"{db}.sqlite", rows)
+    total: int = store.session.execute(text("SELECT COUNT(*) FROM timeseries")).scalar()
+    store.session.rollback()
+
+    versioned: VersionedTimeseries = VersionedTimeseries(store)
+    span_h: int = total // horizon_h
+    start: datetime = (t0 + timedelta(hours=span_h // 2)).replace(tzinfo=pytz.UTC)
+    end: datetime = start + timedelta(days=7)
+    version_ts: datetime = start - timedelta(hours=12)
+    s, e = epoch(start), epoch(end)
+
+    print(f"{total:,} rows, one week window")
+    plain = (NumericTimeseries.ts, NumericTimeseries.version_ts, NumericTimeseries.value_)
+    cases = [
+        ("legacy latest", lambda: store.session.execute(text(legacy_latest_sql.format(s, e))).all()),
+        ("latest query", lambda: store.session.execute(latest_query("bench", start, end)
+                                                       .with_only_columns(*plain)).all()),
+        ("latest", lambda: versioned.latest("bench", start, end)),
+        ("as_of", lambda: versioned.as_of("bench", version_ts, start, end)),
+        ("legacy scenario", lambda: store.session.execute(text(legacy_scenario_sql.format(s, e))).all()),
+        ("scenario query", lambda: store.session.execute(scenario_query("bench", start, end)
+                                                         .with_only_columns(*plain)).all()),
+        ("scenario", lambda: versioned.scenario("bench", start, end)),
+    ]
+    counts: dict[str, int] = {}
+    for name, fn in cases:
+        elapsed, counts[name] = timed(fn)
+        store.session.rollback()
+        print(f"{name}\t{counts[name]} rows\t{elapsed * 1000:.1f}ms")
+    for name in ("latest", "scenario"):
+        if counts[name] != counts[f"legacy {name}"]:
+            raise SystemExit(f"{name} returned {counts[name]} rows, the legacy SQL {counts[f'legacy {name}']}")
+        legacy = sorted((row[0], row[1], row[2]) for row in dict(cases)[f"legacy {name}"]())
+        api = sorted((epoch(row.ts.replace(tzinfo=None)), epoch(row.version_ts.replace(tzinfo=None)), row.value)
+                     for row in dict(cases)[name]())
+        if legacy != api:
+            raise SystemExit(f"{name} returned different rows from the legacy SQL")
+    if not counts["latest"] or not counts["as_of"]:
+        raise SystemExit("no rows in the window, the benchmark DB doesn't match the timeseries layout")
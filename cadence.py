@@ -0,0 +1,201 @@
+import asyncio
+from datetime import datetime
+from time import perf_counter
+from typing import Any, Awaitable, Callable, Optional
+
+from acquisition import Reading, SensorAcquisition, SensorSnapshot, readers
+from controller import ControllerCollect, init_device_suite, temp_read_offset
+from device import Device
+from fan_scripting import State
+from metrics import registry as metrics
+from ringbuffer import RingBuffer
+from rollup import Rollup, RollupWriter
+from scheduler import FixedRateScheduler, OverrunPolicy, Tick
+from sqlite import SqliteStore
+from thermostat import Thermostat
+
+cadence_cycle_seconds = metrics.histogram("cadence_cycle_seconds", "One cycle of a cadence, waiting excluded")
+cadence_errors = metrics.counter("cadence_errors", "Cadence cycles skipped on an error")
+
+# Seconds between reads of each sensor, about the rate it produces new data at. The BME280 is read by the control
+# cadence itself.
+default_periods_s: dict[Device, float] = {
+    Device.LIGHT_PROX: 10,
+    Device.GAS: 30,
+    # streams a frame about every second, averaged on the sensor; every 10th is plenty for a room
+    Device.PARTICULATE_MATTER: 10,
+    # low power periodic measurement
+    Device.CO2: 30,
+}
+
+
+class LatestReadings:
+    """Newest reading of every device, each written by its own cadence and read by control and collection.
+
+    Readings come from SensorAcquisition, a read that failed, timed out or had nothing new carries the last good
+    value marked stale.
+    """
+    def __init__(self):
+        self.readings: dict[Device, Reading] = {}
+
+    def update(self, snapshot: SensorSnapshot):
+        self.readings.update(snapshot.readings)
+
+    def snapshot(self, ts: datetime) -> SensorSnapshot:
+        return SensorSnapshot(ts, dict(self.readings))
+
+
+class MultiRateController:
+    """The control loop split by cadence, on one device suite and one store.
+
+    - control, every control_period_s: BME280 temperature, thermostat decision with the latest CO2, display
+    - one cadence per other sensor, every periods_s[device], each updating LatestReadings
+    - collection, every collect_period_s: one ControllerCollect row from the latest readings and thermostat state
+
+    Every cadence has its own FixedRateScheduler, so a slow sensor only delays its own reads. Sensor reads go through
+    one SensorAcquisition, its worker threads and per-device deadlines, the thermostat runs on the event loop.
+    """
+    def __init__(self, devices: dict[Device, Any], datastore: SqliteStore, control_period_s: float = 5,
+                 collect_period_s: float = 60, periods_s: dict[Device, float] = None, history_size: int = 60,
+                 overrun_policy: OverrunPolicy = OverrunPolicy.SKIP, timeouts_s: dict[Device, float] = None):
+        self.devices: dict[Device, Any] = devices
+        self.datastore: SqliteStore = datastore
+        self.control_period_s: float = control_period_s
+        self.collect_period_s: float = collect_period_s
+        self.periods_s: dict[Device, float] = {**default_periods_s, **(periods_s or {})}
+        self.overrun_policy: OverrunPolicy = overrun_policy
+
+        self.acquisition: SensorAcquisition = SensorAcquisition(devices, timeouts_s)
+        self.latest: LatestReadings = LatestReadings()
+        self.tstat: Thermostat = devices[Device.THERMOSTAT]
+        self.tstat_run: Thermostat.Result = Thermostat.Result.NO_ACTION
+        self.fan_state: State = State.UNKNOWN
+        self.corrected_temp: Optional[float] = None
+        self.history: RingBuffer = RingBuffer.from_model(ControllerCollect, capacity=history_size)
+        self.tstat.history = self.history
+        self.cpu_temps: RingBuffer = RingBuffer(["cpu_temp_C"], capacity=5)
+        self.scd41_temp_offset_F: float = (devices[Device.CO2].temperature_offset * 9 / 5) + 32
+        self.schedulers: dict[str, FixedRateScheduler] = {}
+        self.rows_stored: int = 0
+
+    def scheduler(self, name: str, period_s: float) -> FixedRateScheduler:
+        scheduler: FixedRateScheduler = FixedRateScheduler(period_s, self.overrun_policy, name=name)
+        self.schedulers[name] = scheduler
+        return scheduler
+
+    async def read(self, *devices: Device):
+        self.latest.update(await asyncio.to_thread(self.acquisition.acquire, devices))
+
+    async def sensor_cadence(self, device: Device):
+        scheduler: FixedRateScheduler = self.scheduler(device.value, self.periods_s[device])
+        cycle_seconds = cadence_cycle_seconds.labels(cadence=device.value)
+        while True:
+            await scheduler.wait_async()
+            start: float = perf_counter()
+            await self.read(device)
+            cycle_seconds.observe(perf_counter() - start)
+
+    async def control(self, tick: Tick):
+        await self.read(Device.WEATHER)
+        snapshot: SensorSnapshot = self.latest.snapshot(tick.ts)
+        if snapshot.temp_C is None:
+            raise RuntimeError("no good reading yet from BME280")
+        temp: float = (snapshot.temp_C * 9 / 5) + 32
+        self.corrected_temp = temp + temp_read_offset
+        message: str = f"temp: {self.corrected_temp:.1f}F"
+        (self.tstat_run, self.fan_state), _ = await asyncio.gather(
+            self.tstat.do_control_async(self.corrected_temp, snapshot.co2_ppm),
+            asyncio.to_thread(self.devices[Device.DISPLAY].write_text, message))
+
+    def collect(self, tick: Tick) -> ControllerCollect:
+        snapshot: SensorSnapshot = self.latest.snapshot(tick.ts)
+        self.cpu_temps.push({"cpu_temp_C": self.devices[Device.CPU].get_temperature()})
+        avg_cpu_temp_F: float = (self.cpu_temps.mean("cpu_temp_C") * 9 / 5) + 32
+        temp: float = (snapshot.temp_C * 9 / 5) + 32
+        gas = snapshot.gas
+        pm = snapshot.pm
+        scd41_temp_F: Optional[float] = None
+        if snapshot.scd41_temp_C is not None:
+            scd41_temp_F = (snapshot.scd41_temp_C * 9 / 5) + 32
+        return ControllerCollect(
+            ts=tick.ts, epoch_ts=tick.epoch_ts,
+            temp_F=temp, corrected_temp_F=temp + temp_read_offset, temp_offset_F=temp_read_offset,
+            avg_cpu_temp_F=avg_cpu_temp_F,
+            reducing_ohm=gas.reducing, oxidizing_ohms=gas.oxidising, ammonia_ohms=gas.nh3,
+            lux=snapshot.lux,
+            humidity_pct=snapshot.humidity_pct,
+            fan_state=self.fan_state.value, tstat_action=self.tstat_run.value, setpoint_F=self.tstat.cool_setpoint,
+            pm1p0_ug_per_m3=pm.pm_ug_per_m3(1), pm2p5_ug_per_m3=pm.pm_ug_per_m3(2.5),
+            pm10_ug_per_m3=pm.pm_ug_per_m3(10),
+            co2_ppm=snapshot.co2_ppm, scd41_temp_F=scd41_temp_F, scd41_temp_offset_F=self.scd41_temp_offset_F,
+            scd41_humidity_pct=snapshot.scd41_humidity_pct
+        )
+
+    async def timed_cadence(self, name: str, period_s: float, cycle: Callable[[Tick], Awaitable[None]],
+                            cycles: Optional[int]):
+        scheduler: FixedRateScheduler = self.scheduler(name, period_s)
+        cycle_seconds = cadence_cycle_seconds.labels(cadence=name)
+        errors = cadence_errors.labels(cadence=name)
+        done: int = 0
+        while cycles is None or done < cycles:
+            tick: Tick = await scheduler.wait_async()
+            done += 1
+            start: float = perf_counter()
+            try:
+                await cycle(tick)
+            except Exception as e:
+                errors.inc()
+                print(f"ERROR {name} cadence issue, skipping: {e}")
+            cycle_seconds.observe(perf_counter() - start)
+
+    async def collection(self, tick: Tick):
+        row: ControllerCollect = self.collect(tick)
+        self.history.push_row(row)
+        await asyncio.to_thread(self.datastore.store_row, row)
+        self.rows_stored += 1
+        stale: list[str] = [device.value for device, reading in self.latest.readings.items() if reading.stale]
+        print(f"{tick.ts.isoformat()}\t{row.corrected_temp_F:.2f}F\tco2 {row.co2_ppm}\tfan {row.fan_state}\t"
+              f"{row.tstat_action}" + (f"\tstale {', '.join(stale)}" if stale else ""))
+
+    async def run(self, collections: Optional[int] = None):
+        """Run until cancelled, or until collections rows have been stored."""
+        self.devices[Device.CO2].start_low_periodic_measurement()
+        for _ in range(self.cpu_temps.capacity):
+            self.cpu_temps.push({"cpu_temp_C": self.devices[Device.CPU].get_temperature()})
+        # one good read of everything first, so control and collection never see a sensor without a value
+        await self.read(*readers)
+        missing: list[Device] = self.latest.snapshot(datetime.now()).missing
+        while missing:
+            print(f"waiting on {', '.join(device.value for device in missing)} to be ready")
+            await asyncio.sleep(1)
+            await self.read(*missing)
+            missing = self.latest.snapshot(datetime.now()).missing
+
+        sensors: list[asyncio.Task] = [asyncio.create_task(self.sensor_cadence(device))
+                                       for device in readers if device in self.periods_s]
+        control: asyncio.Task = asyncio.create_task(
+            self.timed_cadence("control", self.control_period_s, self.control, None))
+        try:
+            await self.timed_cadence("collect", self.collect_period_s, self.collection, collections)
+        finally:
+            for task in sensors + [control]:
+                task.cancel()
+            await asyncio.gather(*sensors, control, return_exceptions=True)
+            self.acquisition.shutdown()
+            for name, scheduler in self.schedulers.items():
+                print(f"{name} scheduler: {scheduler.stats}")
+
+
+if __name__ == "__main__":
+    import signal
+    import sys
+
+    from drivers import Backend
+    from metrics import MetricsServer
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    backend: Backend = Backend.SIMULATED if "--simulated" in sys.argv else Backend.REAL
+    MetricsServer(port=9101).start()
+    datastore: SqliteStore = SqliteStore("sensors", [ControllerCollect, Rollup], buffered=True, batch_size=10,
+                                         flush_interval_s=600, wal=True, write_hooks=[RollupWriter()])
+    asyncio.run(MultiRateController(init_device_suite(backend), datastore).run())
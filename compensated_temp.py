@@ -1,12 +1,6 @@
 #!/usr/bin/env python3
 
 import time
-from bme280 import BME280
-
-try:
-    from smbus2 import SMBus
-except ImportError:
-    from smbus import SMBus
 
 import logging
 
@@ -24,6 +18,13 @@ def get_cpu_temperature():
 
 
 if __name__ == "__main__":
+    from bme280 import BME280
+
+    try:
+        from smbus2 import SMBus
+    except ImportError:
+        from smbus import SMBus
+
     logging.basicConfig(
         format='%(asctime)s.%(msecs)03d %(levelname)-8s %(message)s',
         level=logging.INFO,
@@ -1,78 +1,63 @@
-from enum import Enum
-from time import sleep
+import asyncio
+import signal
+import sys
+from time import perf_counter, sleep
 from datetime import datetime
-from typing import Any
+from typing import Any, Callable, Optional, Union
 
+import numpy as np
 import pytz
-from adafruit_scd4x import SCD4X
-from busio import I2C
-from smbus2 import SMBus
-from bme280 import BME280
-from sqlalchemy import Column, DateTime, Integer, Numeric, Text
-
-from compensated_temp import get_cpu_temperature
-from display import Display
+from sqlalchemy import Column, DateTime, Integer, MetaData, REAL, Text, text
+from sqlalchemy.orm import Session
+
+from acquisition import SensorAcquisition, SensorSnapshot
+from device import Device
+from drivers import Backend, build_device
+from ringbuffer import RingBuffer
+from rollup import Rollup, RollupWriter, Sample
+from scheduler import FixedRateScheduler, OverrunPolicy, Tick
 from sqlite import SqliteStore, BaseWithMigrations
 from thermostat import Thermostat
 
-try:
-    # Transitional fix for breaking change in LTR559
-    from ltr559 import LTR559
-    ltr559 = LTR559()
-except ImportError:
-    import ltr559
+from fan_scripting import State, run_sync
+from gas_calcs import BaselineR0, concentrations, ratios
+from metrics import MetricsFile, MetricsServer, registry as metrics
 
-from enviroplus import gas
-
-from fan_scripting import State
-
-from pms5003 import PMS5003, PMS5003Data
-
-import board
-import adafruit_scd4x
-
-
-class Device(Enum):
-    WEATHER = 'BME280'
-    LIGHT_PROX = "LTR559"
-    GAS = "gas"
-    PARTICULATE_MATTER = "PMS5003"
-    CO2 = "SCD4X"
-    THERMOSTAT = "THERMOSTAT"
-    DISPLAY = "DISPLAY"
 
 temp_read_offset: float = -5.5  # sensor correction
 
-def init_device_suite() -> dict[Device, Any]:
-    bus = SMBus(1)
-    i2c: I2C = board.I2C()
-
-    weather_bme280: BME280 = BME280(i2c_dev=bus)
-    light_prox: LTR559 = LTR559()
-    pms5003: PMS5003 = PMS5003()
-    scd4x: SCD4X = adafruit_scd4x.SCD4X(i2c)
-    disp: Display = Display()
-    tstat: Thermostat = Thermostat(setpoint_F = 72.0, cooldown_duration_s = 600)
-
-    # Do a run to throwaway readings to get started
-    weather_bme280.get_temperature()
-    weather_bme280.get_humidity()
-    light_prox.update_sensor()
-    pms5003.read()
-    gas.read_all()
-    # scd4x.start_low_periodic_measurement()
-    disp.disp.reset()
-    sleep(1)
-
-    return {
-        Device.WEATHER: weather_bme280,
-        Device.LIGHT_PROX: light_prox,
-        Device.GAS: gas,
-        Device.PARTICULATE_MATTER: pms5003,
-        Device.CO2: scd4x,
-        Device.THERMOSTAT: tstat,
-        Device.DISPLAY: disp
+control_loop_seconds = metrics.histogram("control_loop_seconds", "One control loop cycle, sleep excluded")
+control_loop_errors = metrics.counter("control_loop_errors", "Control loop cycles skipped on an error")
+
+def init_device_suite(backend: Backend = Backend.REAL, backends: dict[Device, Backend] = None,
+                      options: dict[Device, dict[str, Any]] = None) -> dict[Device, Any]:
+    """
+    :param backend: driver backend for every device, see drivers.Backend
+    :param backends: per device backend overrides, e.g. a real plug with simulated sensors
+    :param options: per device keyword arguments for the driver factory
+    """
+    backends = backends or {}
+    options = options or {}
+    devices: dict[Device, Any] = {device: build_device(device, backends.get(device, backend), **options.get(device, {}))
+                                  for device in Device}
+
+    # Do a run to throwaway readings to get started, one that fails is left to the loop's stale reading handling
+    priming: dict[Device, Callable[[Any], Any]] = {
+        Device.WEATHER: lambda weather: (weather.get_temperature(), weather.get_humidity()),
+        Device.LIGHT_PROX: lambda light_prox: light_prox.update_sensor(),
+        Device.PARTICULATE_MATTER: lambda pms5003: pms5003.read(),
+        Device.GAS: lambda gas: gas.read_all(),
     }
+    for device, prime in priming.items():
+        try:
+            prime(devices[device])
+        except Exception as e:
+            print(f"WARN priming read of {device.value} failed: {e}")
+    # scd4x.start_low_periodic_measurement()
+    if Backend.REAL in {backends.get(device, backend) for device in Device}:
+        sleep(1)
+
+    return devices
 
 
 def data_collect(datastore: SqliteStore, devices: dict[Device, Any] = None):
@@ -81,15 +66,15 @@ def data_collect(datastore: SqliteStore, devices: dict[Device, Any] = None):
     if devices is None:
         devices = init_device_suite()
 
-    weather_bme280: BME280 = devices[Device.WEATHER]
-    light_prox: LTR559 = devices[Device.LIGHT_PROX]
+    weather_bme280 = devices[Device.WEATHER]
+    light_prox = devices[Device.LIGHT_PROX]
     bulk_gas = devices[Device.GAS]
-    pms5003: PMS5003 = devices[Device.PARTICULATE_MATTER]
-    scd4x: SCD4X = devices[Device.CO2]
+    pms5003 = devices[Device.PARTICULATE_MATTER]
+    scd4x = devices[Device.CO2]
     tstat: Thermostat = devices[Device.THERMOSTAT]
-    disp: Display = devices[Device.DISPLAY]
+    disp = devices[Device.DISPLAY]
 
-    pm_readings: PMS5003Data = pms5003.read()
+    pm_readings = pms5003.read()
     weather_bme280.update_sensor()
     gas_readings = bulk_gas.read_all()
 
@@ -136,7 +121,7 @@ def data_collect(datastore: SqliteStore, devices: dict[Device, Any] = None):
 def do_control(datastore: SqliteStore, devices: dict[Device, Any] = None):
     ts_now = datetime.now(tz=pytz.UTC)
 
-    weather_bme280: BME280 = devices[Device.WEATHER]
+    weather_bme280 = devices[Device.WEATHER]
     tstat: Thermostat = devices[Device.THERMOSTAT]
 
     temp_C: float = weather_bme280.get_temperature()
@@ -162,71 +147,107 @@ def do_control(datastore: SqliteStore, devices: dict[Device, Any] = None):
     datastore.store_row(data_collection)
 
 
-def data_control_loop(devices: dict[Device, Any] = None):
+def data_control_loop(devices: dict[Device, Any] = None, datastore: SqliteStore = None, sleep_time: float = 60,
+                      cycles: Optional[int] = None, history_size: int = 60,
+                      overrun_policy: OverrunPolicy = OverrunPolicy.SKIP):
+    """data_control_loop_async from sync code, run to completion on fan_scripting's plug I/O loop."""
+    run_sync(data_control_loop_async(devices, datastore, sleep_time, cycles, history_size, overrun_policy))
+
+
+async def data_control_loop_async(devices: dict[Device, Any] = None, datastore: SqliteStore = None,
+                                  sleep_time: float = 60, cycles: Optional[int] = None,
+                                  history_size: int = 60, overrun_policy: OverrunPolicy = OverrunPolicy.SKIP):
+    """The control loop, on a single long-lived event loop.
+
+    The acquisition sweep runs in a worker thread, and the plug command runs alongside the display push.
+
+    :param sleep_time: cycle period, cycles start on wall clock multiples of it whatever they take (see
+        scheduler.FixedRateScheduler) and rows are stamped with that boundary; 0 runs unthrottled, stamped with the
+        acquisition time
+    :param overrun_policy: what to do with the cycles a slow cycle ran over
+    :param cycles: stop after this many cycles, None runs forever
+    :param history_size: cycles kept in the in-memory history handed to the thermostat
+    """
     if devices is None:
         devices = init_device_suite()
 
-    weather_bme280: BME280 = devices[Device.WEATHER]
-    light_prox: LTR559 = devices[Device.LIGHT_PROX]
-    bulk_gas = devices[Device.GAS]
-    pms5003: PMS5003 = devices[Device.PARTICULATE_MATTER]
-    scd4x: SCD4X = devices[Device.CO2]
+    scd4x = devices[Device.CO2]
+    cpu = devices[Device.CPU]
     tstat: Thermostat = devices[Device.THERMOSTAT]
-    disp: Display = devices[Device.DISPLAY]
+    disp = devices[Device.DISPLAY]
 
     scd41_temp_offset_F: float = (scd4x.temperature_offset * 9 / 5) + 32
     scd4x.start_low_periodic_measurement()
-    while not scd4x.data_ready:
-        print("waiting on scd4x to be ready")
-        sleep(1)
+    try:
+        while not scd4x.data_ready:
+            print("waiting on scd4x to be ready")
+            await asyncio.sleep(1)
+    except Exception as e:
+        print(f"WARN scd4x readiness check failed, left to the loop's reads: {e}")
 
     # init datastore
-    datastore: SqliteStore = SqliteStore("sensors", [ControllerCollect])
+    if datastore is None:
+        datastore = SqliteStore("sensors", [ControllerCollect, Rollup], buffered=True, batch_size=10,
+                                flush_interval_s=600, wal=True, write_hooks=[RollupWriter()])
 
     print(f"timestamp\ttemp_F\tcorrected_temp_F\ttemp_offset_F\tavg_cpu_temp_F\treducing_ohm\toxidizing_ohms\tammonia_ohms\tlux\thumidity_pct\tfan_state\ttstat_action\tsetpoint_F\tpm1.0 ug/m3\tpm2.5 ug/m3\tpm10 ug/m3\tco2 ppm\tscd41_temp_F\tscd41_temp_offset_F\tscd41_humidity_pct")
     tstat.tstat_mode_override = None  # Thermostat.TstatMode.OFF
 
-    cpu_temps: list[float] = [get_cpu_temperature()] * 5
-    sleep_time: int = 60
-    while True:
+    acquisition: SensorAcquisition = SensorAcquisition(devices)
+    cpu_temps: RingBuffer = RingBuffer(["cpu_temp_C"], capacity=5)
+    for _ in range(cpu_temps.capacity):
+        try:
+            cpu_temps.push({"cpu_temp_C": cpu.get_temperature()})
+        except Exception as e:
+            print(f"WARN priming read of {Device.CPU.value} failed: {e}")
+    history: RingBuffer = RingBuffer.from_model(ControllerCollect, capacity=history_size)
+    tstat.history = history
+    cycle: int = 0
+    loop_seconds = control_loop_seconds.labels()
+    scheduler: Optional[FixedRateScheduler] = FixedRateScheduler(sleep_time, overrun_policy) if sleep_time else None
+    while cycles is None or cycle < cycles:
+        cycle += 1
+        tick: Optional[Tick] = await scheduler.wait_async() if scheduler is not None else None
         try:
+            cycle_start: float = perf_counter()
             # Read all sensors
-            ts_now = datetime.now(tz=pytz.UTC)
-            pm_readings: PMS5003Data = pms5003.read()
-            weather_bme280.update_sensor()
-            gas_readings = bulk_gas.read_all()
-
-            temp_C: float = weather_bme280.get_temperature()
+            snapshot: SensorSnapshot = await asyncio.to_thread(acquisition.acquire)
+            if snapshot.stale:
+                print(f"WARN stale readings: {', '.join(f'{d.value} ({snapshot.readings[d].error})' for d in snapshot.stale)}")
+            if snapshot.missing:
+                raise RuntimeError(f"no good reading yet from {', '.join(d.value for d in snapshot.missing)}")
+            ts_now = snapshot.ts if tick is None else tick.ts
+            pm_readings = snapshot.pm
+            gas_readings = snapshot.gas
+
+            temp_C: float = snapshot.temp_C
             temp: float = (temp_C * 9 / 5) + 32
             corrected_temp = temp + temp_read_offset
 
             # cpu compensated
-            cpu_temp: float = get_cpu_temperature()
-            cpu_temps = cpu_temps[1:] + [cpu_temp]
-            avg_cpu_temp: float = sum(cpu_temps) / float(len(cpu_temps))
+            cpu_temp: float = cpu.get_temperature()
+            cpu_temps.push({"cpu_temp_C": cpu_temp})
+            avg_cpu_temp: float = cpu_temps.mean("cpu_temp_C")
             avg_cpu_temp_F: float = (avg_cpu_temp * 9 / 5) + 32
 
-            instant: int = light_prox.get_lux()
-            humidity_pct: float = weather_bme280.get_humidity()
+            instant: int = snapshot.lux
+            humidity_pct: float = snapshot.humidity_pct
 
-            co2_ppm: float = None
+            co2_ppm: float = snapshot.co2_ppm
             scd41_temp_F: float = None
-            scd41_humidity_pct: float = None
-            if scd4x.data_ready:
-                # print("SCD DATA")
-                co2_ppm = scd4x.CO2
-                scd41_temp_F = (scd4x.temperature * 9 / 5) + 32
-                scd41_humidity_pct = scd4x.relative_humidity
+            scd41_humidity_pct: float = snapshot.scd41_humidity_pct
+            if snapshot.scd41_temp_C is not None:
+                scd41_temp_F = (snapshot.scd41_temp_C * 9 / 5) + 32
+
+            message = f"temp: {corrected_temp:.1f}F"
 
             tstat_run: Thermostat.Result
             fan_state: State
-            tstat_run, fan_state = tstat.do_control(corrected_temp, co2_ppm)
+            (tstat_run, fan_state), _ = await asyncio.gather(tstat.do_control_async(corrected_temp, co2_ppm),
+                                                             asyncio.to_thread(disp.write_text, message))
 
             print(f"{ts_now.isoformat()}\t{temp:.2f}\t{corrected_temp:.2f}\t{temp_read_offset:.2f}\t{avg_cpu_temp_F:.2f}\t{gas_readings.reducing:.2f}\t{gas_readings.oxidising:.2f}\t{gas_readings.nh3:.2f}\t{instant:.2f}\t{humidity_pct:.2f}\t{fan_state.value}\t{tstat.cool_setpoint:.2f}\t{tstat_run.value}\t{pm_readings.pm_ug_per_m3(1):.2f}\t{pm_readings.pm_ug_per_m3(2.5):.2f}\t{pm_readings.pm_ug_per_m3(10):.2f}\t{co2_ppm:.2f}\t{scd41_temp_F:.2f}\t{scd41_temp_offset_F:.2f}\t{scd41_humidity_pct:.2f}")
 
-            message = f"temp: {corrected_temp:.1f}F"
-            disp.write_text(message)
-
             data_collection: ControllerCollect = ControllerCollect(
                 ts=ts_now, epoch_ts=int(ts_now.timestamp()),
                 temp_F=temp, corrected_temp_F=corrected_temp, temp_offset_F=temp_read_offset, avg_cpu_temp_F=avg_cpu_temp_F,
@@ -237,15 +258,49 @@ def data_control_loop(devices: dict[Device, Any] = None):
                 pm1p0_ug_per_m3=pm_readings.pm_ug_per_m3(1), pm2p5_ug_per_m3=pm_readings.pm_ug_per_m3(2.5), pm10_ug_per_m3=pm_readings.pm_ug_per_m3(10),
                 co2_ppm=co2_ppm, scd41_temp_F=scd41_temp_F, scd41_temp_offset_F=scd41_temp_offset_F, scd41_humidity_pct=scd41_humidity_pct
             )
+            history.push_row(data_collection)
             datastore.store_row(data_collection)
-            sleep(sleep_time)
+            loop_seconds.observe(perf_counter() - cycle_start)
         except Exception as e:
+            control_loop_errors.labels().inc()
             print(f"ERROR Control Loop issue, skipping: {e}")
 
+    if scheduler is not None:
+        print(f"scheduler: {scheduler.stats}")
+    acquisition.shutdown()
+
 
 class ControllerCollect(BaseWithMigrations):
     @classmethod
-    def migrations(cls) -> list[str]:
+    def migrate_to_real(cls, session: Session, chunk_size: int = 50000):
+        """Rebuild the table with REAL measurement columns, from the NUMERIC ones and the untyped ones ALTER added.
+
+        NUMERIC went through Decimal on every read. Rows are copied in rowid order, chunk_size rowids per statement,
+        keeping their rowids, then the table is swapped in; all in the migration transaction.
+        """
+        declared: dict[str, str] = {row[1]: row[2].upper() for row in session.execute(
+            text(f"PRAGMA table_info({cls.__tablename__})"))}
+        real: set[str] = {column.name for column in cls.__table__.columns if isinstance(column.type, REAL)}
+        if all(declared[name] == "REAL" for name in real):
+            return
+
+        print(f"migrating {cls.__tablename__} to REAL columns")
+        staging: str = f"{cls.__tablename__}_real"
+        session.execute(text(f"DROP TABLE IF EXISTS {staging}"))
+        cls.__table__.to_metadata(MetaData(), name=staging).create(session.connection())
+        columns: list[str] = [column.name for column in cls.__table__.columns]
+        values: str = ", ".join(f"CAST({name} AS REAL)" if name in real else name for name in columns)
+        max_rowid: int = session.execute(text(f"SELECT max(rowid) FROM {cls.__tablename__}")).scalar() or 0
+        for last_rowid in range(0, max_rowid, chunk_size):
+            session.execute(text(
+                f"INSERT INTO {staging} (rowid, {', '.join(columns)}) SELECT rowid, {values} FROM {cls.__tablename__} "
+                f"WHERE rowid > :last_rowid AND rowid <= :end_rowid"),
+                {"last_rowid": last_rowid, "end_rowid": last_rowid + chunk_size})
+        session.execute(text(f"DROP TABLE {cls.__tablename__}"))
+        session.execute(text(f"ALTER TABLE {staging} RENAME TO {cls.__tablename__}"))
+
+    @classmethod
+    def migrations(cls) -> list[Union[str, Callable[[Session], None]]]:
         return [
             f"ALTER TABLE {cls.__tablename__} ADD COLUMN temp_offset_F;",
             f"ALTER TABLE {cls.__tablename__} ADD COLUMN setpoint_F;",
@@ -255,7 +310,11 @@ class ControllerCollect(BaseWithMigrations):
             f"ALTER TABLE {cls.__tablename__} ADD COLUMN co2_ppm;",
             f"ALTER TABLE {cls.__tablename__} ADD COLUMN scd41_temp_F;",
             f"ALTER TABLE {cls.__tablename__} ADD COLUMN scd41_temp_offset_F;",
-            f"ALTER TABLE {cls.__tablename__} ADD COLUMN scd41_humidity_pct;"
+            f"ALTER TABLE {cls.__tablename__} ADD COLUMN scd41_humidity_pct;",
+            f"ALTER TABLE {cls.__tablename__} ADD COLUMN co_ppm;",
+            f"ALTER TABLE {cls.__tablename__} ADD COLUMN no2_ppm;",
+            f"ALTER TABLE {cls.__tablename__} ADD COLUMN nh3_ppm;",
+            cls.migrate_to_real
         ]
 
     __tablename__ = "controller"
@@ -263,32 +322,113 @@ class ControllerCollect(BaseWithMigrations):
     ts = Column(DateTime, primary_key=True, nullable=False)
     epoch_ts = Column(Integer, unique=True, nullable=False)
 
-    temp_F = Column(Numeric)
-    corrected_temp_F = Column(Numeric)
-    temp_offset_F = Column(Numeric)
-    avg_cpu_temp_F = Column(Numeric)
+    temp_F = Column(REAL)
+    corrected_temp_F = Column(REAL)
+    temp_offset_F = Column(REAL)
+    avg_cpu_temp_F = Column(REAL)
 
-    reducing_ohm = Column(Numeric)
-    oxidizing_ohms = Column(Numeric)
-    ammonia_ohms = Column(Numeric)
+    reducing_ohm = Column(REAL)
+    oxidizing_ohms = Column(REAL)
+    ammonia_ohms = Column(REAL)
 
-    lux = Column(Numeric)
+    lux = Column(REAL)
 
-    humidity_pct = Column(Numeric)
+    humidity_pct = Column(REAL)
 
     fan_state = Column(Text)
     tstat_action = Column(Text)
-    setpoint_F = Column(Numeric)
-
-    pm1p0_ug_per_m3 = Column(Numeric)
-    pm2p5_ug_per_m3 = Column(Numeric)
-    pm10_ug_per_m3 = Column(Numeric)
-
-    co2_ppm = Column(Numeric)
-    scd41_temp_F = Column(Numeric)
-    scd41_temp_offset_F = Column(Numeric)
-    scd41_humidity_pct = Column(Numeric)
+    setpoint_F = Column(REAL)
+
+    pm1p0_ug_per_m3 = Column(REAL)
+    pm2p5_ug_per_m3 = Column(REAL)
+    pm10_ug_per_m3 = Column(REAL)
+
+    co2_ppm = Column(REAL)
+    scd41_temp_F = Column(REAL)
+    scd41_temp_offset_F = Column(REAL)
+    scd41_humidity_pct = Column(REAL)
+
+    # from the gas resistances and their baseline R0, filled in by backfill_gas_ppm
+    co_ppm = Column(REAL)
+    no2_ppm = Column(REAL)
+    nh3_ppm = Column(REAL)
+
+    def rollup_samples(self) -> list[Sample]:
+        return [(column.key, self.ts, float(getattr(self, column.key))) for column in self.__table__.columns
+                if isinstance(column.type, REAL) and getattr(self, column.key) is not None]
+
+
+# ppm column: (resistance column, gas_calcs channel, species)
+gas_ppm_columns: dict[str, tuple[str, str, str]] = {
+    "co_ppm": ("reducing_ohm", "reducing", "CO"),
+    "no2_ppm": ("oxidizing_ohms", "oxidizing", "NO2"),
+    "nh3_ppm": ("ammonia_ohms", "ammonia", "ammonia"),
+}
+
+
+def backfill_gas_ppm(datastore: SqliteStore, chunk_size: int = 10000, days: int = 7, overwrite: bool = False) -> int:
+    """Fill the ppm columns of the whole controller history from the stored gas resistances.
+
+    A first pass streams the resistances in epoch_ts order to estimate each channel's R0 (gas_calcs.BaselineR0), a
+    second converts chunk by chunk with gas_calcs.concentrations and commits each chunk, so an interrupted run keeps
+    its progress. Only rows with NULL ppm are written unless overwrite; run it again to fill rows stored since.
+    """
+    ohm_columns: list[str] = [ohm_column for ohm_column, _, _ in gas_ppm_columns.values()]
+    table: str = ControllerCollect.__tablename__
+    session = datastore.session
+    if session.in_transaction():
+        session.commit()
+
+    def chunks(where: str):
+        last_epoch_ts: int = -2 ** 63
+        while True:
+            with session.begin():
+                rows: list = session.execute(text(
+                    f"SELECT epoch_ts, {', '.join(ohm_columns)} FROM {table} "
+                    f"WHERE epoch_ts > :last_epoch_ts{where} ORDER BY epoch_ts LIMIT :chunk_size"),
+                    {"last_epoch_ts": last_epoch_ts, "chunk_size": chunk_size}).all()
+            if not rows:
+                return
+            last_epoch_ts = rows[-1][0]
+            # NULL resistances come through as NaN; plain tuples, numpy probes Row objects as sequences key by key
+            yield np.array([tuple(row) for row in rows], dtype=np.float64)
+
+    baselines: dict[str, BaselineR0] = {ohm_column: BaselineR0(channel, days)
+                                        for ohm_column, channel, _ in gas_ppm_columns.values()}
+    for chunk in chunks(""):
+        for i, ohm_column in enumerate(ohm_columns, start=1):
+            baselines[ohm_column].update(chunk[:, 0].astype(np.int64), chunk[:, i])
+    for baseline in baselines.values():
+        baseline.finish()
+
+    update_sql: str = (f"UPDATE {table} SET {', '.join(f'{c} = :{c}' for c in gas_ppm_columns)} "
+                       f"WHERE epoch_ts = :epoch_ts")
+    missing: str = "" if overwrite else (
+        f" AND ({' OR '.join(f'({c} IS NULL AND {o} IS NOT NULL)' for c, (o, _, _) in gas_ppm_columns.items())})")
+    rows_done: int = 0
+    for chunk in chunks(missing):
+        epoch_ts: np.ndarray = chunk[:, 0].astype(np.int64)
+        values: dict[str, list] = {"epoch_ts": epoch_ts.tolist()}
+        for i, (column, (ohm_column, channel, species)) in enumerate(gas_ppm_columns.items(), start=1):
+            ppm: np.ndarray = concentrations(channel, ratios(chunk[:, i], baselines[ohm_column].r0(epoch_ts)))[species]
+            values[column] = [None if np.isnan(v) else v for v in ppm.tolist()]
+        with session.begin():
+            session.execute(text(update_sql), [dict(zip(values, row)) for row in zip(*values.values())])
+        rows_done += len(chunk)
+        print(f"gas ppm backfill: {rows_done} rows")
+    return rows_done
 
 
 if __name__ == "__main__":
-    data_control_loop()
+    # Exit normally on `kill` so atexit flushes the buffered rows
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    if "--backfill-gas-ppm" in sys.argv:
+        backfill_gas_ppm(SqliteStore("sensors", [ControllerCollect], wal=True))
+        sys.exit(0)
+    backend: Backend = Backend.SIMULATED if "--simulated" in sys.argv else Backend.REAL
+    # Prometheus scrapes http://127.0.0.1:9101/metrics, or --metrics-file path writes the same text every 15s
+    if "--metrics-file" in sys.argv:
+        MetricsFile(sys.argv[sys.argv.index("--metrics-file") + 1]).start()
+    else:
+        MetricsServer(port=9101).start()
+    asyncio.run(data_control_loop_async(init_device_suite(backend)))
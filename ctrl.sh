@@ -8,6 +8,6 @@ if [ "$2" = "on" ]; then
   echo $! > $1.pid
 elif [ "$2" = "off" ]; then
   echo off
-  kill -9 "$(cat $1.pid)"
+  kill "$(cat $1.pid)"
   rm $1.pid
 fi
@@ -0,0 +1,12 @@
+from enum import Enum
+
+
+class Device(Enum):
+    WEATHER = 'BME280'
+    LIGHT_PROX = "LTR559"
+    GAS = "gas"
+    PARTICULATE_MATTER = "PMS5003"
+    CO2 = "SCD4X"
+    CPU = "CPU"
+    THERMOSTAT = "THERMOSTAT"
+    DISPLAY = "DISPLAY"
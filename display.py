@@ -1,35 +1,158 @@
-import ST7735
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+
 from PIL import Image, ImageDraw, ImageFont
-from fonts.ttf import RobotoMedium as UserFont
+
+from metrics import registry as metrics
+
+display_push_seconds = metrics.histogram("display_push_seconds", "Latency of pushing one frame to the panel")
+
+Colour = tuple[int, int, int]
+FrameKey = tuple[str, Colour, Colour]
 
 
 class Display:
-    def __init__(self):
-        self.disp: ST7735 = ST7735.ST7735(
-            port=0, cs=1, dc=9, backlight=12, rotation=270, spi_speed_hz=10000000
-        )
-        self.disp.begin()
+    """Centred text on the ST7735 LCD.
+
+    Rendered frames are kept in a small LRU keyed by message and colours, and a frame identical to the one already on
+    the panel is not pushed over SPI again. With background=True the push runs on a worker thread and write_text only
+    renders; the worker always pushes the newest frame, frames superseded while a push is in flight are dropped.
+
+    :param panel: anything with width, height and display(image), defaults to the Enviro+ ST7735
+    :param font: PIL font, defaults to Roboto Medium 25
+    :param frame_cache_size: rendered frames kept
+    :param background: push frames from a worker thread
+    """
+    def __init__(self, panel: Any = None, font: Any = None, frame_cache_size: int = 16, background: bool = False):
+        if panel is None:
+            import ST7735
+            panel = ST7735.ST7735(
+                port=0, cs=1, dc=9, backlight=12, rotation=270, spi_speed_hz=10000000
+            )
+            panel.begin()
+        self.disp = panel
 
         self.WIDTH: int = self.disp.width
         self.HEIGHT: int = self.disp.height
 
         # Text settings
-        font_size: int = 25
-        self.font = ImageFont.truetype(UserFont, font_size)
-        self.text_colour = (255, 255, 255)
-        self.back_colour = (0, 170, 170)
+        if font is None:
+            from fonts.ttf import RobotoMedium as UserFont
+            font_size: int = 25
+            font = ImageFont.truetype(UserFont, font_size)
+        self.font = font
+        self.text_colour: Colour = (255, 255, 255)
+        self.back_colour: Colour = (0, 170, 170)
 
-    def write_text(self, message: str):
-        img = Image.new('RGB', (self.WIDTH, self.HEIGHT), color=(0, 0, 0))
+        self.frame_cache_size: int = frame_cache_size
+        self.frames: OrderedDict[FrameKey, Image.Image] = OrderedDict()
+        self.backgrounds: dict[Colour, Image.Image] = {}
+        self.on_panel: Optional[FrameKey] = None
+        self.frames_rendered: int = 0
+        self.frames_pushed: int = 0
+        self.frames_skipped: int = 0
+
+        self.pending: Optional[tuple[FrameKey, Image.Image]] = None
+        self.pushing: bool = False
+        self.closing: bool = False
+        self.cond: threading.Condition = threading.Condition()
+        self.worker: Optional[threading.Thread] = None
+        if background:
+            self.worker = threading.Thread(target=self.push_worker, name="display-push", daemon=True)
+            self.worker.start()
+
+    def background(self, back_colour: Colour) -> Image.Image:
+        img: Optional[Image.Image] = self.backgrounds.get(back_colour)
+        if img is None:
+            img = Image.new('RGB', (self.WIDTH, self.HEIGHT), color=(0, 0, 0))
+            ImageDraw.Draw(img).rectangle((0, 0, 160, 80), back_colour)
+            self.backgrounds[back_colour] = img
+        return img
+
+    def render(self, message: str, text_colour: Colour, back_colour: Colour) -> Image.Image:
+        img: Image.Image = self.background(back_colour).copy()
         draw = ImageDraw.Draw(img)
 
-        size_x, size_y = draw.textsize(message, self.font)
+        left, top, right, bottom = draw.textbbox((0, 0), message, font=self.font)
+        size_x, size_y = right, bottom
 
         # Calculate text position
         x = (self.WIDTH - size_x) / 2
         y = (self.HEIGHT / 2) - (size_y / 2)
 
-        # Draw background rectangle and write text.
-        draw.rectangle((0, 0, 160, 80), self.back_colour)
-        draw.text((x, y), message, font=self.font, fill=self.text_colour)
-        self.disp.display(img)
+        draw.text((x, y), message, font=self.font, fill=text_colour)
+        self.frames_rendered += 1
+        return img
+
+    def frame(self, key: FrameKey) -> Image.Image:
+        img: Optional[Image.Image] = self.frames.get(key)
+        if img is None:
+            img = self.render(*key)
+            self.frames[key] = img
+            if len(self.frames) > self.frame_cache_size:
+                self.frames.popitem(last=False)
+        else:
+            self.frames.move_to_end(key)
+        return img
+
+    def write_text(self, message: str):
+        key: FrameKey = (message, self.text_colour, self.back_colour)
+        with self.cond:
+            latest: Optional[FrameKey] = self.pending[0] if self.pending is not None else self.on_panel
+        if key == latest:
+            self.frames_skipped += 1
+            return
+
+        img: Image.Image = self.frame(key)
+        if self.worker is None:
+            self.on_panel = None
+            with display_push_seconds.labels().time():
+                self.disp.display(img)
+            self.on_panel = key
+            self.frames_pushed += 1
+            return
+
+        with self.cond:
+            if self.pending is not None:
+                self.frames_skipped += 1
+            self.pending = (key, img)
+            self.cond.notify_all()
+
+    def push_worker(self):
+        while True:
+            with self.cond:
+                while self.pending is None and not self.closing:
+                    self.cond.wait()
+                if self.pending is None:
+                    return
+                key, img = self.pending
+                self.pending = None
+                self.pushing = True
+                self.on_panel = None
+            try:
+                with display_push_seconds.labels().time():
+                    self.disp.display(img)
+            except Exception as e:
+                key = None
+                print(f"ERROR display push failed: {e}")
+            with self.cond:
+                self.on_panel = key
+                self.pushing = False
+                if key is not None:
+                    self.frames_pushed += 1
+                self.cond.notify_all()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait for the background push to go idle, True if it did within timeout."""
+        with self.cond:
+            return self.cond.wait_for(lambda: self.pending is None and not self.pushing, timeout)
+
+    def close(self):
+        if self.worker is None:
+            return
+        with self.cond:
+            self.closing = True
+            self.cond.notify_all()
+        self.worker.join()
+        self.worker = None
@@ -0,0 +1,91 @@
+from enum import Enum
+from typing import Any, Callable
+
+from device import Device
+from compensated_temp import get_cpu_temperature
+from thermostat import Thermostat
+import simulated
+
+
+class Backend(Enum):
+    REAL = "real"
+    SIMULATED = "simulated"
+
+
+class CpuThermalZone:
+    def get_temperature(self) -> float:
+        return get_cpu_temperature()
+
+
+# Hardware libraries are imported inside the factories so nothing here needs a Raspberry Pi until it's used
+def real_weather():
+    from smbus2 import SMBus
+    from bme280 import BME280
+    return BME280(i2c_dev=SMBus(1))
+
+
+def real_light_prox():
+    from ltr559 import LTR559
+    return LTR559()
+
+
+def real_gas():
+    from enviroplus import gas
+    return gas
+
+
+def real_particulate_matter():
+    from pms5003 import PMS5003
+    return PMS5003()
+
+
+def real_co2():
+    import board
+    import adafruit_scd4x
+    return adafruit_scd4x.SCD4X(board.I2C())
+
+
+def real_display(**kwargs):
+    from display import Display
+    kwargs.setdefault("background", True)
+    disp: Display = Display(**kwargs)
+    disp.disp.reset()
+    return disp
+
+
+def real_thermostat(**kwargs) -> Thermostat:
+    kwargs.setdefault("setpoint_F", 72.0)
+    kwargs.setdefault("cooldown_duration_s", 600)
+    return Thermostat(**kwargs)
+
+
+drivers: dict[Backend, dict[Device, Callable[..., Any]]] = {
+    Backend.REAL: {
+        Device.WEATHER: real_weather,
+        Device.LIGHT_PROX: real_light_prox,
+        Device.GAS: real_gas,
+        Device.PARTICULATE_MATTER: real_particulate_matter,
+        Device.CO2: real_co2,
+        Device.CPU: CpuThermalZone,
+        Device.THERMOSTAT: real_thermostat,
+        Device.DISPLAY: real_display,
+    },
+    Backend.SIMULATED: {
+        Device.WEATHER: simulated.SimulatedBME280,
+        Device.LIGHT_PROX: simulated.SimulatedLTR559,
+        Device.GAS: simulated.SimulatedGas,
+        Device.PARTICULATE_MATTER: simulated.SimulatedPMS5003,
+        Device.CO2: simulated.SimulatedSCD4X,
+        Device.CPU: simulated.SimulatedCpuThermalZone,
+        Device.THERMOSTAT: simulated.SimulatedThermostat,
+        Device.DISPLAY: simulated.SimulatedDisplay,
+    },
+}
+
+
+def register_driver(backend: Backend, device: Device, factory: Callable[..., Any]):
+    drivers[backend][device] = factory
+
+
+def build_device(device: Device, backend: Backend = Backend.REAL, **kwargs) -> Any:
+    return drivers[backend][device](**kwargs)
@@ -0,0 +1,134 @@
+import csv
+import gzip
+import json
+import sys
+from datetime import datetime
+from typing import Any, Callable, Iterator, Optional, TextIO, Type, Union
+
+import pytz
+
+from sqlite import Base, SqliteStore
+
+
+def iso_datetime(value: Optional[str]) -> Optional[str]:
+    # DateTime columns hold naive UTC as "YYYY-MM-DD HH:MM:SS.ffffff"
+    return None if value is None else f"{value[:10]}T{value[11:]}+00:00"
+
+
+def export_chunks(datastore: SqliteStore, model: Type[Base], columns: list[str],
+                  start: Union[datetime, float, None] = None, end: Union[datetime, float, None] = None,
+                  where: Optional[dict[str, Any]] = None, chunk_size: int = 10000) -> Iterator[list[tuple]]:
+    """SqliteStore.fetch_chunks with DateTime columns as ISO 8601 UTC, everything else as stored (epoch ints stay
+    ints)."""
+    datetimes: list[int] = [i for i, name in enumerate(columns)
+                            if datastore.column_kind(model.__table__.columns[name]) == "datetime"]
+    for chunk in datastore.fetch_chunks(model, columns, start, end, chunk_size=chunk_size, where=where):
+        if datetimes:
+            rows: list[list] = [list(row) for row in chunk]
+            for row in rows:
+                for i in datetimes:
+                    row[i] = iso_datetime(row[i])
+            chunk = rows
+        yield chunk
+
+
+def write_csv(out: TextIO, columns: list[str], chunks: Iterator[list[tuple]]) -> int:
+    # NULL is an empty field
+    writer = csv.writer(out, lineterminator="\n")
+    writer.writerow(columns)
+    rows: int = 0
+    for chunk in chunks:
+        writer.writerows(chunk)
+        rows += len(chunk)
+    return rows
+
+
+def write_jsonl(out: TextIO, columns: list[str], chunks: Iterator[list[tuple]]) -> int:
+    # one object per row, NULL is null
+    encode: Callable[[Any], str] = json.JSONEncoder(separators=(",", ":")).encode
+    rows: int = 0
+    for chunk in chunks:
+        out.write("".join(encode(dict(zip(columns, row))) + "\n" for row in chunk))
+        rows += len(chunk)
+    return rows
+
+
+writers: dict[str, Callable[[TextIO, list[str], Iterator[list[tuple]]], int]] = {
+    "csv": write_csv,
+    "jsonl": write_jsonl,
+}
+
+
+def export(datastore: SqliteStore, model: Type[Base], path: str, fmt: str = "csv",
+           columns: Optional[list[str]] = None, start: Union[datetime, float, None] = None,
+           end: Union[datetime, float, None] = None, where: Optional[dict[str, Any]] = None,
+           compress: bool = False, chunk_size: int = 10000) -> int:
+    """Stream model's rows with start <= time < end to path as CSV or JSON lines, in time order. Returns the rows
+    written.
+
+    Rows go from a raw cursor to the file chunk_size at a time, memory stays the same whatever the history size.
+
+    :param path: "-" for stdout
+    :param columns: table column names, all of them by default
+    :param where: column name: value, rows equal to all of them
+    :param compress: gzip, at level 6 like the gzip command
+    """
+    table_columns: list[str] = [column.name for column in model.__table__.columns]
+    columns = columns or table_columns
+    unknown: list[str] = [name for name in list(columns) + list(where or {}) if name not in table_columns]
+    if unknown:
+        raise ValueError(f"{model.__tablename__} has no column {', '.join(unknown)}, "
+                         f"it has {', '.join(table_columns)}")
+    if fmt not in writers:
+        raise ValueError(f"unknown format {fmt}, one of {', '.join(writers)}")
+
+    chunks: Iterator[list[tuple]] = export_chunks(datastore, model, columns, start, end, where, chunk_size)
+    if path == "-":
+        if compress:
+            with gzip.open(sys.stdout.buffer, "wt", compresslevel=6, newline="") as out:
+                return writers[fmt](out, columns, chunks)
+        return writers[fmt](sys.stdout, columns, chunks)
+    with (gzip.open(path, "wt", compresslevel=6, newline="") if compress else open(path, "w", newline="")) as out:
+        return writers[fmt](out, columns, chunks)
+
+
+def parse_time(value: str) -> datetime:
+    # ISO 8601, naive taken as UTC
+    ts: datetime = datetime.fromisoformat(value)
+    return ts.replace(tzinfo=pytz.UTC) if ts.tzinfo is None else ts
+
+
+if __name__ == "__main__":
+    import argparse
+    import contextlib
+
+    from controller import ControllerCollect
+    from timeseries import DatetimeMask, Timeseries, TimeseriesID
+
+    sources: dict[str, Callable[[], tuple[SqliteStore, Type[Base]]]] = {
+        "controller": lambda: (SqliteStore("sensors", [ControllerCollect], partitioned=[ControllerCollect]),
+                               ControllerCollect),
+        "timeseries": lambda: (SqliteStore("timeseries", [Timeseries, TimeseriesID, DatetimeMask]), Timeseries),
+    }
+    parser = argparse.ArgumentParser(description="Stream controller or timeseries history to CSV or JSON lines.")
+    parser.add_argument("table", choices=sources)
+    parser.add_argument("path", help="output file, - for stdout; .jsonl and .gz suffixes pick the format and gzip")
+    parser.add_argument("--format", choices=writers, help="csv unless the path ends in .jsonl(.gz)")
+    parser.add_argument("--gzip", action="store_true", help="compress, also implied by a .gz path")
+    parser.add_argument("--start", type=parse_time, help="ISO 8601, inclusive, naive is UTC")
+    parser.add_argument("--end", type=parse_time, help="ISO 8601, exclusive, naive is UTC")
+    parser.add_argument("--columns", type=lambda value: value.split(","), help="comma separated, default all")
+    parser.add_argument("--where", action="append", default=[], metavar="COLUMN=VALUE",
+                        help="only rows with this value, e.g. series_id=nws-observations; repeatable")
+    parser.add_argument("--chunk-size", type=int, default=10000)
+    args = parser.parse_args()
+
+    suffix: str = args.path[:-3] if args.path.endswith(".gz") else args.path
+    fmt: str = args.format or ("jsonl" if suffix.endswith(".jsonl") else "csv")
+    # the store reports its migrations on stdout, which may be the export
+    with contextlib.redirect_stdout(sys.stderr):
+        datastore, model = sources[args.table]()
+    rows: int = export(datastore, model, args.path, fmt, args.columns, args.start, args.end,
+                       dict(condition.split("=", 1) for condition in args.where),
+                       args.gzip or args.path.endswith(".gz"), args.chunk_size)
+    print(f"{rows} {args.table} rows exported to {args.path}", file=sys.stderr)
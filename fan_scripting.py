@@ -1,7 +1,21 @@
 import asyncio
+import functools
+import threading
 from enum import Enum
+from time import monotonic
+from typing import Awaitable, Callable, Optional, TypeVar
 
-from kasa import SmartPlug, Discover, SmartDevice
+from kasa import SmartPlug, Discover, SmartDevice, SmartDeviceException
+
+from metrics import registry as metrics
+
+T = TypeVar("T")
+
+kasa_command_seconds = metrics.histogram("kasa_command_seconds", "Kasa plug command latency, including lookup, "
+                                                                 "rediscovery and retry")
+kasa_command_errors = metrics.counter("kasa_command_errors", "Kasa plug commands that failed after the retry")
+kasa_command_retries = metrics.counter("kasa_command_retries", "Kasa plug commands retried after rediscovery")
+kasa_discovery_seconds = metrics.histogram("kasa_discovery_seconds", "Kasa broadcast discovery latency")
 
 
 class State(Enum):
@@ -10,8 +24,8 @@ class State(Enum):
     UNKNOWN = "unknown"
 
 
-async def discover() -> dict[str, SmartDevice]:
-    devices: dict[str, SmartDevice] = await Discover.discover(timeout=10)
+async def discover(timeout: int = 10, target: str = "255.255.255.255") -> dict[str, SmartDevice]:
+    devices: dict[str, SmartDevice] = await Discover.discover(target=target, timeout=timeout)
     ret: dict[str, SmartDevice] = {}
     for addr, dev in devices.items():
         await dev.update()
@@ -33,31 +47,168 @@ async def connect_plug(host: str):
     await plug.update()
 
 
-async def onoff_toggle(alias: str, state: State):
-    devices: dict[str, SmartDevice] = await discover()
-    dev = devices[alias]
-    await dev.update()
+# the event loop every plug connection is made and used on, run by a daemon thread started on first use
+plug_loop: Optional[asyncio.AbstractEventLoop] = None
+plug_loop_lock: threading.Lock = threading.Lock()
+
+
+def io_loop() -> asyncio.AbstractEventLoop:
+    global plug_loop
+    with plug_loop_lock:
+        if plug_loop is None:
+            plug_loop = asyncio.new_event_loop()
+            threading.Thread(target=plug_loop.run_forever, name="kasa-io", daemon=True).start()
+        return plug_loop
+
+
+def on_io_loop(method: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+    """Runs the decorated coroutine method on io_loop(), awaited from whatever loop calls it."""
+    @functools.wraps(method)
+    async def wrapper(*args, **kwargs) -> T:
+        loop: asyncio.AbstractEventLoop = io_loop()
+        if asyncio.get_running_loop() is loop:
+            return await method(*args, **kwargs)
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(method(*args, **kwargs), loop))
+    return wrapper
+
+
+class DeviceRegistry:
+    """Caches alias -> SmartDevice so commands don't pay for a broadcast discovery every time.
+
+    Cached devices keep their connection open between commands. Discovery only runs on a lookup miss, after a
+    connection error, or when an entry past its TTL no longer answers to its alias at the cached host.
+
+    The registry and its connections live on io_loop(): callers on any thread or loop are handed over to it, so
+    connections are never shared between loops and the registry is only ever touched by one thread.
+    """
+    def __init__(self, ttl_s: float = 3600, discovery_timeout_s: int = 10,
+                 discovery_target: str = "255.255.255.255"):
+        self.ttl_s: float = ttl_s
+        self.discovery_timeout_s: int = discovery_timeout_s
+        self.discovery_target: str = discovery_target
+
+        self.devices: dict[str, SmartDevice] = {}
+        self.resolved_at: dict[str, float] = {}
+        self.discovery: Optional[asyncio.Future] = None
+
+    @on_io_loop
+    async def rediscover(self):
+        # lookups that miss at the same time share one broadcast
+        if self.discovery is None:
+            self.discovery = asyncio.ensure_future(self.discover_all())
+            self.discovery.add_done_callback(lambda _: setattr(self, "discovery", None))
+        await asyncio.shield(self.discovery)
+
+    async def discover_all(self):
+        with kasa_discovery_seconds.labels().time():
+            found: dict[str, SmartDevice] = await discover(self.discovery_timeout_s, self.discovery_target)
+        resolved_at: float = monotonic()
+        for alias, dev in found.items():
+            stale: SmartDevice = self.devices.get(alias)
+            if stale is not None and stale is not dev:
+                await stale.protocol.close()
+            self.devices[alias] = dev
+            self.resolved_at[alias] = resolved_at
+
+    @on_io_loop
+    async def invalidate(self, alias: str):
+        dev: SmartDevice = self.devices.pop(alias, None)
+        self.resolved_at.pop(alias, None)
+        if dev is not None:
+            await dev.protocol.close()
+
+    @on_io_loop
+    async def lookup(self, alias: str) -> SmartDevice:
+        dev: SmartDevice = self.devices.get(alias)
+        if dev is not None and monotonic() - self.resolved_at[alias] > self.ttl_s:
+            # Expired, but a unicast update against the cached host is much cheaper than a broadcast
+            try:
+                await dev.update()
+                if dev.alias == alias:
+                    self.resolved_at[alias] = monotonic()
+                else:
+                    await self.invalidate(alias)
+                    dev = None
+            except SmartDeviceException:
+                await self.invalidate(alias)
+                dev = None
+
+        if dev is None:
+            await self.rediscover()
+            dev = self.devices[alias]
+        return dev
+
+    @on_io_loop
+    async def run(self, alias: str, command: Callable[[SmartDevice], Awaitable[T]]) -> T:
+        with kasa_command_seconds.labels(alias=alias).time():
+            try:
+                dev: SmartDevice = await self.lookup(alias)
+                try:
+                    return await command(dev)
+                except SmartDeviceException:
+                    # Plug may have rebooted or picked up a new DHCP lease, rediscover once and retry
+                    kasa_command_retries.labels(alias=alias).inc()
+                    await self.invalidate(alias)
+                    dev = await self.lookup(alias)
+                    return await command(dev)
+            except Exception:
+                kasa_command_errors.labels(alias=alias).inc()
+                raise
+
+
+registry: DeviceRegistry = DeviceRegistry()
+
+
+async def set_plug_state(dev: SmartDevice, state: State):
     if state == State.ON:
         await dev.turn_on()
     else:
         await dev.turn_off()
 
 
-async def get_state(alias: str):
+async def read_plug_state(dev: SmartDevice) -> State:
+    await dev.update()
+    return State.ON if dev.is_on else State.OFF
+
+
+async def onoff_toggle(alias: str, state: State, devices: DeviceRegistry = registry):
+    await devices.run(alias, lambda dev: set_plug_state(dev, state))
+
+
+async def get_state(alias: str, devices: DeviceRegistry = registry):
     ret: State = State.UNKNOWN
     try:
-        devices: dict[str, SmartDevice] = await discover()
-        dev = devices[alias]
-        await dev.update()
-        ret = State.ON if dev.is_on else State.OFF
+        ret = await devices.run(alias, read_plug_state)
     except Exception as ex:
         print(ex)
     return ret
 
 
+def run_sync(coro: Awaitable[T]) -> T:
+    """Run a coroutine to completion on io_loop() and return its result, blocking the calling thread.
+
+    Used by the sync wrappers, from any number of threads at once; plug connections held by the registry survive
+    between calls. Not for coroutines running on io_loop() itself, they await instead.
+    """
+    loop: asyncio.AbstractEventLoop = io_loop()
+    try:
+        running: Optional[asyncio.AbstractEventLoop] = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        raise RuntimeError("run_sync called from the plug I/O loop, await the coroutine instead")
+    future = asyncio.run_coroutine_threadsafe(coro, loop)
+    try:
+        return future.result()
+    except BaseException:
+        # interrupted while waiting, don't leave the coroutine running
+        future.cancel()
+        raise
+
+
 async def main():
-    devices: dict[str, SmartDevice] = await discover()
-    await connect_plug(devices["Fan"].host)
+    dev: SmartDevice = await registry.lookup("Fan")
+    await connect_plug(dev.host)
 
 try:
     asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
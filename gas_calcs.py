@@ -1,90 +1,206 @@
 # https://github.com/paulvha/multichannel-gas/blob/master/mics%206814.xls
-from typing import Type, NewType, TypeVar
+from typing import NamedTuple, Optional, Type, NewType, TypeVar, Union
+
+import numpy as np
 
 PPM = TypeVar("PPM", float, int)
 
 
+class Curve(NamedTuple):
+    """Fit of one species on one MICS6814 channel: ppm = a * ratio ** b, or a * ratio + b when linear."""
+    a: float
+    b: float
+    linear: bool = False
+
+    def ppm(self, reading: float) -> PPM:
+        return self.a * reading + self.b if self.linear else self.a * reading ** self.b
+
+
+# Every fit, keyed by channel and species: the one source for the scalar methods below and the array API
+curves: dict[str, dict[str, Curve]] = {
+    "reducing": {
+        "CO": Curve(4.4638, -1.177),  # R^2 = 0.9999
+        "ethanol": Curve(1.363, -1.58),  # R^2 = 0.9824
+        "hydrogen": Curve(0.828, -1.781),  # R^2 = 0.9995
+        "ammonia": Curve(0.974, -4.33),  # R^2 = 0.9967
+        "methane": Curve(837.38, -4.093),  # R^2 = 0.9845
+        "propane": Curve(323.64, -1.316),  # R^2 = 0.9957
+        "isobutane": Curve(-556000, 44680, linear=True),  # R^2 = 0.9229
+        "H2S": Curve(0.0014, -11.51),  # R^2 = 1.0
+    },
+    "oxidizing": {
+        "hydrogen": Curve(11.109, -10.27),  # R^2 = 0.9778
+        "NO2": Curve(0.1516, 0.9979),  # R^2 = 1.0
+        "NO": Curve(0.1011, -6.398),  # R^2 = 0.9982
+    },
+    "ammonia": {
+        "ethanol": Curve(0.2068, -2.781),  # R^2 = 0.9993
+        "hydrogen": Curve(8.0074, -2.948),  # R^2 = 0.9948
+        "ammonia": Curve(0.6151, -1.903),  # R^2 = 0.9995
+        "propane": Curve(69.56, -2.492),  # R^2 = 0.993
+        "isobutane": Curve(503.2, -1.888),  # R^2 = 0.9767
+    },
+}
+
+
 class Reducing:
     @staticmethod
     def CO(reading: float) -> PPM:
-        # R^2 = 0.9999
-        return 4.4638 * reading ** -1.177
+        return curves["reducing"]["CO"].ppm(reading)
 
     @staticmethod
     def ethanol(reading: float) -> PPM:
-        # R^2 = 0.9824
-        return 1.363 * reading ** -1.58
+        return curves["reducing"]["ethanol"].ppm(reading)
 
     @staticmethod
     def hydrogen(reading: float) -> PPM:
-        # R^2 = 0.9995
-        return 0.828 * reading ** -1.781
+        return curves["reducing"]["hydrogen"].ppm(reading)
 
     @staticmethod
     def ammonia(reading: float) -> PPM:
-        # R^2 = 0.9967
-        return 0.974 * reading ** -4.33
+        return curves["reducing"]["ammonia"].ppm(reading)
 
     @staticmethod
     def methane(reading: float) -> PPM:
-        # R^2 = 0.9845
-        return 837.38 * reading ** -4.093
+        return curves["reducing"]["methane"].ppm(reading)
 
     @staticmethod
     def propane(reading: float) -> PPM:
-        # R^2 = 0.9957
-        return 323.64 * reading ** -1.316
+        return curves["reducing"]["propane"].ppm(reading)
 
     @staticmethod
     def isobutane(reading: float) -> PPM:
-        # R^2 = 0.9229
-        return (-556000 * reading) + 44680
+        return curves["reducing"]["isobutane"].ppm(reading)
 
     @staticmethod
     def H2S(reading: float) -> PPM:
-        # R^2 = 1.0
-        return 0.0014 * reading ** -11.51
+        return curves["reducing"]["H2S"].ppm(reading)
 
 
 class Oxidizing:
     @staticmethod
     def hydrogen(reading: float) -> PPM:
-        # R^2 = 0.9778
-        return 11.109 * reading ** -10.27
+        return curves["oxidizing"]["hydrogen"].ppm(reading)
 
     @staticmethod
     def N02(reading: float) -> PPM:
-        # R^2 = 1.0
-        return 0.1516 * reading ** 0.9979
+        return curves["oxidizing"]["NO2"].ppm(reading)
 
     @staticmethod
     def NO(reading: float) -> PPM:
-        # R^2 = 0.9982
-        return 0.1011 * reading ** -6.398
+        return curves["oxidizing"]["NO"].ppm(reading)
 
 
 class Ammonia:
     @staticmethod
     def ethanol(reading: float) -> PPM:
-        # R^2 = 0.9993
-        return 0.2068 * reading ** -2.781
+        return curves["ammonia"]["ethanol"].ppm(reading)
 
     @staticmethod
     def hydrogen(reading: float) -> PPM:
-        # R^2 = 0.9948
-        return 8.0074 * reading ** -2.948
+        return curves["ammonia"]["hydrogen"].ppm(reading)
 
     @staticmethod
     def ammonia(reading: float) -> PPM:
-        # R^2 = 0.9995
-        return 0.6151 * reading ** -1.903
+        return curves["ammonia"]["ammonia"].ppm(reading)
 
     @staticmethod
     def propane(reading: float) -> PPM:
-        # R^2 = 0.993
-        return  69.56 * reading ** -2.492
+        return curves["ammonia"]["propane"].ppm(reading)
 
     @staticmethod
     def isobutane(reading: float) -> PPM:
-        # R^2 = 0.9767
-        return 503.2 * reading ** -1.888
+        return curves["ammonia"]["isobutane"].ppm(reading)
+
+
+def ratios(resistance: np.ndarray, r0: Union[float, np.ndarray]) -> np.ndarray:
+    """R/R0 as float64, NaN where the resistance or R0 is missing or not positive."""
+    resistance = np.asarray(resistance, dtype=np.float64)
+    r0 = np.asarray(r0, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where((0 < resistance) & (0 < r0), resistance / r0, np.nan)
+
+
+def concentrations(channel: str, ratio: np.ndarray) -> dict[str, np.ndarray]:
+    """ppm of every species of the channel's curves, for an array of R/R0 ratios.
+
+    The power law fits share one log of the ratios: ppm = exp(log(a) + b * log(ratio)) for all species in a single
+    (species, n) product. NaN ratios give NaN.
+    """
+    table: dict[str, Curve] = curves[channel]
+    ratio = np.asarray(ratio, dtype=np.float64)
+    power: list[str] = [name for name, curve in table.items() if not curve.linear]
+    a: np.ndarray = np.array([table[name].a for name in power])
+    b: np.ndarray = np.array([table[name].b for name in power])
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        log_ratio: np.ndarray = np.log(ratio).reshape(-1)
+        ppm: np.ndarray = np.exp(np.log(a)[:, np.newaxis] + np.multiply.outer(b, log_ratio))
+    ret: dict[str, np.ndarray] = {name: row.reshape(ratio.shape) for name, row in zip(power, ppm)}
+    for name, curve in table.items():
+        if curve.linear:
+            ret[name] = curve.a * ratio + curve.b
+    return {name: ret[name] for name in table}
+
+
+def all_concentrations(channel_ratios: dict[str, np.ndarray]) -> dict[str, dict[str, np.ndarray]]:
+    """concentrations() of each channel given, e.g. {"reducing": r, "oxidizing": o, "ammonia": n}."""
+    return {channel: concentrations(channel, ratio) for channel, ratio in channel_ratios.items()}
+
+
+class BaselineR0:
+    """Clean air resistance R0 of one channel, estimated from its own history.
+
+    The channel's clean air reading of a day is taken as a quantile of that day's resistances: a high one for the
+    reducing and ammonia channels, whose resistance falls with gas, a low one for the oxidizing channel, whose
+    resistance rises with NO2. R0 at a time is the median of those daily values over the trailing days, which
+    follows the slow drift of the sensor but not a single dirty day.
+
+    Feed the history in time order with update(), then look R0 up with r0(). A day is added once the history moves
+    past it, or by finish().
+    """
+    clean_air_quantiles: dict[str, float] = {"reducing": 0.95, "oxidizing": 0.05, "ammonia": 0.95}
+
+    def __init__(self, channel: str, days: int = 7, quantile: Optional[float] = None):
+        self.channel: str = channel
+        self.days: int = days
+        self.quantile: float = self.clean_air_quantiles[channel] if quantile is None else quantile
+        self.daily: dict[int, float] = {}
+        self.day: Optional[int] = None
+        self.day_values: list[np.ndarray] = []
+
+    def close_day(self):
+        if self.day_values:
+            values: np.ndarray = np.concatenate(self.day_values)
+            values = values[np.isfinite(values) & (0 < values)]
+            if len(values):
+                self.daily[self.day] = float(np.quantile(values, self.quantile))
+        self.day_values = []
+
+    def update(self, epoch_ts: np.ndarray, resistance: np.ndarray):
+        day: np.ndarray = np.asarray(epoch_ts) // 86400
+        resistance = np.asarray(resistance, dtype=np.float64)
+        # split points of the (sorted) days present in this chunk
+        bounds: np.ndarray = np.flatnonzero(np.diff(day)) + 1
+        for values, days in zip(np.split(resistance, bounds), np.split(day, bounds)):
+            if not len(days):
+                continue
+            if days[0] != self.day:
+                self.close_day()
+                self.day = int(days[0])
+            self.day_values.append(values)
+
+    def finish(self):
+        self.close_day()
+
+    def r0(self, epoch_ts: np.ndarray) -> np.ndarray:
+        """R0 for each time, NaN where none of the trailing days had readings."""
+        day: np.ndarray = np.asarray(epoch_ts) // 86400
+        known_days: np.ndarray = np.array(sorted(self.daily), dtype=np.int64)
+        known: np.ndarray = np.array([self.daily[d] for d in known_days])
+        ret: np.ndarray = np.full(day.shape, np.nan)
+        for d in np.unique(day):
+            window: np.ndarray = known[np.searchsorted(known_days, d - self.days + 1):
+                                       np.searchsorted(known_days, d, side="right")]
+            if len(window):
+                ret[day == d] = np.median(window)
+        return ret
@@ -0,0 +1,236 @@
+import os
+import tempfile
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import perf_counter
+from typing import Iterator, Optional, Union
+
+Labels = tuple[tuple[str, str], ...]
+
+# seconds, from a cached SQLite write to a Kasa discovery broadcast
+default_buckets_s: tuple[float, ...] = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                                        10.0, 30.0)
+
+
+class Counter:
+    def __init__(self):
+        self.value: float = 0.0
+        self.lock: threading.Lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self.lock:
+            self.value += amount
+
+    def samples(self, name: str) -> list[tuple[str, Labels, float]]:
+        return [(f"{name}_total", (), self.value)]
+
+
+class Gauge:
+    def __init__(self):
+        self.value: float = 0.0
+
+    def set(self, value: float):
+        self.value = value
+
+    def samples(self, name: str) -> list[tuple[str, Labels, float]]:
+        return [(name, (), self.value)]
+
+
+class Histogram:
+    """Observation counts per bucket, plus their sum and count. Buckets are upper bounds, cumulated on export."""
+    def __init__(self, buckets: tuple[float, ...] = default_buckets_s):
+        self.buckets: tuple[float, ...] = buckets
+        self.counts: list[int] = [0] * (len(buckets) + 1)
+        self.sum: float = 0.0
+        self.count: int = 0
+        self.lock: threading.Lock = threading.Lock()
+
+    def observe(self, value: float):
+        i: int = bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        """Observe the seconds the with block took, also when it raises."""
+        start: float = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(perf_counter() - start)
+
+    def samples(self, name: str) -> list[tuple[str, Labels, float]]:
+        with self.lock:
+            counts: list[int] = list(self.counts)
+            total: float = self.sum
+            count: int = self.count
+        ret: list[tuple[str, Labels, float]] = []
+        cumulative: int = 0
+        for bound, n in zip(self.buckets, counts):
+            cumulative += n
+            ret.append((f"{name}_bucket", (("le", format_value(bound)),), cumulative))
+        ret.append((f"{name}_bucket", (("le", "+Inf"),), count))
+        ret.append((f"{name}_sum", (), total))
+        ret.append((f"{name}_count", (), count))
+        return ret
+
+
+Metric = Union[Counter, Gauge, Histogram]
+
+
+class Family:
+    """One metric name, a Counter/Gauge/Histogram per distinct label set.
+
+    Hot paths should keep the child from labels() rather than looking it up on every observation.
+    """
+    kinds: dict[type, str] = {Counter: "counter", Gauge: "gauge", Histogram: "histogram"}
+
+    def __init__(self, name: str, help_text: str, kind: type, **kwargs):
+        self.name: str = name
+        self.help_text: str = help_text
+        self.kind: type = kind
+        self.kwargs: dict = kwargs
+        self.children: dict[Labels, Metric] = {}
+        self.lock: threading.Lock = threading.Lock()
+
+    def labels(self, **labels: str) -> Metric:
+        key: Labels = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        child: Optional[Metric] = self.children.get(key)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(key, self.kind(**self.kwargs))
+        return child
+
+    def render(self) -> list[str]:
+        # text format 0.0.4: a counter's only sample is <name>_total, and HELP/TYPE name the sample, not the family
+        exposed: str = f"{self.name}_total" if self.kind is Counter else self.name
+        lines: list[str] = [f"# HELP {exposed} {self.help_text}", f"# TYPE {exposed} {self.kinds[self.kind]}"]
+        for labels, child in list(self.children.items()):
+            for sample_name, extra, value in child.samples(self.name):
+                lines.append(f"{sample_name}{format_labels(labels + extra)} {format_value(value)}")
+        return lines
+
+
+def escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{escape_label(v)}"' for k, v in labels) + "}"
+
+
+def format_value(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) and not float(value).is_integer() else str(int(value))
+
+
+class Registry:
+    """Metric families of the process, rendered in the Prometheus text exposition format."""
+    def __init__(self):
+        self.families: dict[str, Family] = {}
+        self.lock: threading.Lock = threading.Lock()
+
+    def family(self, name: str, help_text: str, kind: type, **kwargs) -> Family:
+        with self.lock:
+            family: Optional[Family] = self.families.get(name)
+            if family is None:
+                family = self.families[name] = Family(name, help_text, kind, **kwargs)
+            elif family.kind is not kind:
+                raise ValueError(f"metric {name} is already a {Family.kinds[family.kind]}")
+            return family
+
+    def counter(self, name: str, help_text: str) -> Family:
+        return self.family(name, help_text, Counter)
+
+    def gauge(self, name: str, help_text: str) -> Family:
+        return self.family(name, help_text, Gauge)
+
+    def histogram(self, name: str, help_text: str, buckets: tuple[float, ...] = default_buckets_s) -> Family:
+        return self.family(name, help_text, Histogram, buckets=buckets)
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for family in list(self.families.values()):
+            lines += family.render()
+        return "\n".join(lines) + "\n"
+
+
+registry: Registry = Registry()
+
+
+class MetricsServer:
+    """Serves the registry at /metrics over HTTP for Prometheus to scrape, on a daemon thread."""
+    def __init__(self, metrics: Registry = registry, host: str = "127.0.0.1", port: int = 9101):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body: bytes = metrics.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server: ThreadingHTTPServer = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread: threading.Thread = threading.Thread(target=self.server.serve_forever, name="metrics-http",
+                                                         daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/metrics"
+
+    def start(self) -> "MetricsServer":
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class MetricsFile:
+    """Writes the registry to path every interval_s, for node_exporter's textfile collector or plain tail -f.
+
+    The file is replaced atomically, a reader never sees a half written one.
+    """
+    def __init__(self, path: str, interval_s: float = 15, metrics: Registry = registry):
+        self.path: str = path
+        self.interval_s: float = interval_s
+        self.metrics: Registry = metrics
+        self.closed: threading.Event = threading.Event()
+        self.thread: threading.Thread = threading.Thread(target=self.write_periodically, name="metrics-file",
+                                                         daemon=True)
+
+    def write(self):
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)), suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            f.write(self.metrics.render())
+        os.replace(tmp, self.path)
+
+    def write_periodically(self):
+        while not self.closed.wait(self.interval_s):
+            try:
+                self.write()
+            except OSError as e:
+                print(f"ERROR writing metrics to {self.path}: {e}")
+
+    def start(self) -> "MetricsFile":
+        self.thread.start()
+        return self
+
+    def close(self):
+        self.closed.set()
+        self.thread.join()
+        self.write()
@@ -0,0 +1,128 @@
+import math
+from datetime import datetime
+from typing import Iterable, Optional
+
+import numpy as np
+import pytz
+from sqlalchemy import Column, DateTime, INTEGER, REAL
+
+from sqlite import BaseWithMigrations
+
+
+class NoiseLevel(BaseWithMigrations):
+    """Noise statistics of one clock aligned window, from the SPL monitor's per block A-weighted levels.
+
+    l10_db is the level exceeded 10% of the window, l90_db the level exceeded 90% of it (the background).
+    """
+    __tablename__ = "noise_level"
+
+    ts: datetime = Column(DateTime, primary_key=True, nullable=False)
+    window_s: int = Column(INTEGER, primary_key=True, nullable=False)
+    epoch_ts: int = Column(INTEGER, nullable=False)
+
+    blocks: int = Column(INTEGER, nullable=False)
+    leq_db: float = Column(REAL, nullable=False)
+    lmax_db: float = Column(REAL, nullable=False)
+    l10_db: float = Column(REAL, nullable=False)
+    l90_db: float = Column(REAL, nullable=False)
+
+    @classmethod
+    def migrations(cls) -> list[str]:
+        return [
+            f"CREATE INDEX IF NOT EXISTS ix_{cls.__tablename__}_window_epoch_ts "
+            f"ON {cls.__tablename__} (window_s, epoch_ts);"
+        ]
+
+
+class LevelHistogram:
+    """Streaming percentiles of dB levels: counts in fixed resolution_db bins over [min_db, max_db).
+
+    Constant memory whatever the number of levels. A percentile comes out as the centre of the bin holding the level at
+    that rank, within resolution_db / 2 of it; np.percentile interpolates between neighbouring levels instead.
+    Levels outside the range are counted in the first or last bin.
+    """
+    def __init__(self, min_db: float = 0.0, max_db: float = 150.0, resolution_db: float = 0.1):
+        self.min_db: float = min_db
+        self.resolution_db: float = resolution_db
+        self.counts: np.ndarray = np.zeros(int(round((max_db - min_db) / resolution_db)), dtype=np.int64)
+        self.count: int = 0
+
+    def add(self, level_db: float):
+        i: int = int((level_db - self.min_db) / self.resolution_db)
+        self.counts[min(max(i, 0), len(self.counts) - 1)] += 1
+        self.count += 1
+
+    def percentile(self, q: float) -> float:
+        """Level below which q percent of the levels fall."""
+        if not self.count:
+            return math.nan
+        i: int = int(np.searchsorted(np.cumsum(self.counts), q / 100 * self.count))
+        return self.min_db + (min(i, len(self.counts) - 1) + 0.5) * self.resolution_db
+
+    def clear(self):
+        self.counts[:] = 0
+        self.count = 0
+
+
+class NoiseWindow:
+    """Leq, Lmax and the L10/L90 sketch of the window being filled."""
+    def __init__(self, window_s: int):
+        self.window_s: int = window_s
+        self.start: Optional[int] = None
+        self.blocks: int = 0
+        self.mean_square_sum: float = 0.0
+        self.lmax_db: float = -math.inf
+        self.levels: LevelHistogram = LevelHistogram()
+
+    def add(self, level_db: float, mean_square: float):
+        self.blocks += 1
+        self.mean_square_sum += mean_square
+        self.lmax_db = max(self.lmax_db, level_db)
+        self.levels.add(level_db)
+
+    def row(self, ref_level: float) -> NoiseLevel:
+        ts: datetime = datetime.fromtimestamp(self.start, tz=pytz.UTC)
+        return NoiseLevel(ts=ts, window_s=self.window_s, epoch_ts=self.start, blocks=self.blocks,
+                          leq_db=10 * math.log10(self.mean_square_sum / self.blocks / ref_level ** 2),
+                          lmax_db=self.lmax_db, l10_db=self.levels.percentile(90), l90_db=self.levels.percentile(10))
+
+    def reset(self, start: Optional[int]):
+        self.start = start
+        self.blocks = 0
+        self.mean_square_sum = 0.0
+        self.lmax_db = -math.inf
+        self.levels.clear()
+
+
+class NoiseStatistics:
+    """Per block A-weighted RMS in, one NoiseLevel per finished window out.
+
+    Windows are aligned to the clock (a 60s window runs from :00 to :00), a window is finished by the first block of
+    the next one, or by close().
+
+    :param ref_level: RMS of 0 dB, Noise.spl_ref_level
+    """
+    def __init__(self, ref_level: float, windows_s: Iterable[int] = (60, 900)):
+        self.ref_level: float = ref_level
+        self.windows: list[NoiseWindow] = [NoiseWindow(window_s) for window_s in windows_s]
+
+    def add(self, epoch_ts: float, rms: float) -> list[NoiseLevel]:
+        if rms <= 0:
+            return []
+        level_db: float = 20 * math.log10(rms / self.ref_level)
+        ret: list[NoiseLevel] = []
+        for window in self.windows:
+            start: int = int(epoch_ts // window.window_s * window.window_s)
+            if window.start != start:
+                if window.blocks:
+                    ret.append(window.row(self.ref_level))
+                window.reset(start)
+            window.add(level_db, rms * rms)
+        return ret
+
+    def close(self) -> list[NoiseLevel]:
+        """Rows of the partly filled windows, blocks says how much of the window they cover."""
+        ret: list[NoiseLevel] = [window.row(self.ref_level) for window in self.windows if window.blocks]
+        for window in self.windows:
+            window.reset(None)
+        return ret
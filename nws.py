@@ -1,62 +1,43 @@
 from datetime import datetime
 
 import pytz
-import requests
 
+from metrics import MetricsServer, registry as metrics
+from nws_client import NwsClient, forecast_path, forecast_rows, observation_path, observation_rows
 from rocketry import Rocketry
-from requests import Response
 from rocketry.conditions.api import cron
+from rollup import Rollup, RollupWriter
 from sqlite import SqliteStore
-from timeseries import Timeseries, TimeseriesID, DatetimeMask, NumericTimeseries
+from timeseries import ChangeFilter, MetadataWriter, Timeseries, TimeseriesID, DatetimeMask, VersionedTimeseries
 
 app: Rocketry = Rocketry(config={
     'task_execution': 'thread'
 })
 
-ds: SqliteStore = SqliteStore("timeseries", [Timeseries, TimeseriesID, DatetimeMask])
+ds: SqliteStore = SqliteStore("timeseries", [Timeseries, TimeseriesID, DatetimeMask, Rollup],
+                              write_hooks=[RollupWriter(), MetadataWriter()])
+nws: NwsClient = NwsClient()
+changes: ChangeFilter = ChangeFilter(VersionedTimeseries(ds))
+nws_rows_stored = metrics.counter("nws_rows_stored", "Changed forecast and observation rows stored")
 # build a hello world method here
 
 
 
-# https://forecast.weather.gov/MapClick.php?lat=45.5234&lon=-122.6762&lg=ep&FcstType=graphical
-# https://api.weather.gov/points/45.53,-122.67
-# https://api.weather.gov/gridpoints/PQR/112,103/forecast/hourly
-def collect_forecasts(data_ts: datetime) -> list[Timeseries]:
-    resp: Response = requests.get("https://api.weather.gov/gridpoints/PQR/112,103/forecast/hourly", timeout=10)
+def collect_forecasts(data_ts: datetime, client: NwsClient = None) -> list[Timeseries]:
+    """Forecast rows that changed since the last stored version, nothing if the forecast wasn't reissued."""
+    client = client or nws
+    payload, modified = client.get_json(forecast_path)
+    if not modified:
+        return []
+    return changes.changed(forecast_rows(payload, data_ts))
 
-    periods: list[dict] = resp.json()["properties"]["periods"]
-    ret: list[Timeseries] = []
-    for p in periods[:24]:
-        ts: datetime = datetime.fromisoformat(p.pop("startTime")).astimezone(pytz.UTC)
-        temp: float = p["temperature"]
 
-        row: NumericTimeseries = NumericTimeseries(series_id="nws-hourly-forecast",
-                                                   ts=ts,
-                                                   value_=temp,
-                                                   version_ts=data_ts,
-                                                   row_metadata=p)
-        ret.append(row)
-
-    # save ret to a new list
-    
-    return ret
-
-
-# https://api.weather.gov/stations/KPDX/observations/latest
-def current_observation(data_ts: datetime) -> list[Timeseries]:
-    resp: Response = requests.get("https://api.weather.gov/stations/KPDX/observations/latest")
-    obs: dict = resp.json()["properties"]
-
-    ts: datetime = datetime.fromisoformat(obs["timestamp"]).astimezone(pytz.UTC)
-    temp: float = obs["temperature"]["value"]
-
-    row: NumericTimeseries = NumericTimeseries(series_id="nws-observations",
-                                               ts=ts,
-                                               value_=temp,
-                                               version_ts=data_ts,
-                                               row_metadata=obs)
-
-    return [row]
+def current_observation(data_ts: datetime, client: NwsClient = None) -> list[Timeseries]:
+    client = client or nws
+    payload, modified = client.get_json(observation_path)
+    if not modified:
+        return []
+    return changes.changed(observation_rows(payload, data_ts))
 
 
 @app.task("daily between 00:00 and 11:59 | daily between 12:00 and 23:59")
@@ -65,7 +46,8 @@ def twice_a_day_loop():
     forecasts: list[Timeseries] = collect_forecasts(data_ts)
     # print("forecast store")
     ds.store_rows(forecasts)
-    print(f"forecast stored at {data_ts.isoformat()}")
+    nws_rows_stored.labels(series="forecast").inc(len(forecasts))
+    print(f"forecast stored at {data_ts.isoformat()}, {len(forecasts)} changed periods")
 
     # stmt: GenericQuery[NumericTimeseries] = (select(NumericTimeseries).offset(1).limit(1)
     #                                          .order_by(desc(NumericTimeseries.version_ts)))
@@ -82,10 +64,13 @@ def minutely_loop():
     obs: list[Timeseries] = current_observation(data_ts)
     # print("hi minutely")
     ds.store_rows(obs)
-    print(f"Observation stored at {data_ts.isoformat()}")
+    nws_rows_stored.labels(series="observation").inc(len(obs))
+    print(f"Observation stored at {data_ts.isoformat()}, {len(obs)} new")
 
 
 if __name__ == "__main__":
     print("run")
+    # next to the controller's on 9101
+    MetricsServer(port=9102).start()
     app.run()
     # twice_a_day_loop()
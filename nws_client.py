@@ -0,0 +1,127 @@
+import threading
+from datetime import datetime
+from typing import Optional
+
+import pytz
+import requests
+from requests import Response
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from metrics import registry as metrics
+from timeseries import Timeseries, NumericTimeseries
+
+nws_fetch_seconds = metrics.histogram("nws_fetch_seconds", "Latency of one NWS API GET, conditional or not")
+nws_fetches = metrics.counter("nws_fetches", "NWS API GETs by outcome")
+
+api_url: str = "https://api.weather.gov"
+
+
+class CachedResponse:
+    def __init__(self, etag: Optional[str], last_modified: Optional[str], payload: dict):
+        self.etag: Optional[str] = etag
+        self.last_modified: Optional[str] = last_modified
+        self.payload: dict = payload
+
+
+class NwsClient:
+    """Pooled, conditional GETs against api.weather.gov.
+
+    One requests.Session keeps connections alive between fetches. The ETag and Last-Modified of every URL are sent
+    back as If-None-Match/If-Modified-Since, and a 304 is answered from the last payload.
+
+    :param base_url: API root, point it at a local stand-in to test
+    :param timeout_s: connect and read timeout of every request
+    :param retries: retries on connection errors and 5xx, with backoff
+    """
+    def __init__(self, base_url: str = api_url, timeout_s: float = 10, pool_size: int = 4, retries: int = 2,
+                 user_agent: str = "(enviro-thermostat, weather collection)"):
+        self.base_url: str = base_url.rstrip("/")
+        self.timeout_s: float = timeout_s
+        self.session: requests.Session = requests.Session()
+        adapter: HTTPAdapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size,
+                                           max_retries=Retry(total=retries, backoff_factor=0.5,
+                                                             status_forcelist=(500, 502, 503, 504)))
+        self.session.mount(self.base_url, adapter)
+        # api.weather.gov rejects requests without a User-Agent
+        self.session.headers.update({"User-Agent": user_agent, "Accept": "application/geo+json"})
+
+        self.cache: dict[str, CachedResponse] = {}
+        self.lock: threading.Lock = threading.Lock()
+        self.fetches: int = 0
+        self.not_modified: int = 0
+
+    def get_json(self, path: str) -> tuple[dict, bool]:
+        """The payload at path and whether it changed since the last fetch."""
+        url: str = f"{self.base_url}/{path.lstrip('/')}"
+        with self.lock:
+            cached: Optional[CachedResponse] = self.cache.get(url)
+        headers: dict[str, str] = {}
+        if cached is not None:
+            if cached.etag:
+                headers["If-None-Match"] = cached.etag
+            if cached.last_modified:
+                headers["If-Modified-Since"] = cached.last_modified
+
+        try:
+            with nws_fetch_seconds.labels(path=path).time():
+                resp: Response = self.session.get(url, headers=headers, timeout=self.timeout_s)
+        except requests.RequestException:
+            nws_fetches.labels(path=path, status="error").inc()
+            raise
+        self.fetches += 1
+        if resp.status_code == 304 and cached is not None:
+            self.not_modified += 1
+            nws_fetches.labels(path=path, status="not_modified").inc()
+            return cached.payload, False
+        nws_fetches.labels(path=path, status=str(resp.status_code)).inc()
+        resp.raise_for_status()
+
+        payload: dict = resp.json()
+        with self.lock:
+            self.cache[url] = CachedResponse(resp.headers.get("ETag"), resp.headers.get("Last-Modified"), payload)
+        return payload, True
+
+    def close(self):
+        self.session.close()
+
+
+# https://forecast.weather.gov/MapClick.php?lat=45.5234&lon=-122.6762&lg=ep&FcstType=graphical
+# https://api.weather.gov/points/45.53,-122.67
+# https://api.weather.gov/gridpoints/PQR/112,103/forecast/hourly
+forecast_path: str = "gridpoints/PQR/112,103/forecast/hourly"
+# https://api.weather.gov/stations/KPDX/observations/latest
+observation_path: str = "stations/KPDX/observations/latest"
+
+
+def forecast_rows(payload: dict, data_ts: datetime, hours: int = 24) -> list[Timeseries]:
+    periods: list[dict] = payload["properties"]["periods"]
+    ret: list[Timeseries] = []
+    for p in periods[:hours]:
+        p = dict(p)
+        ts: datetime = datetime.fromisoformat(p.pop("startTime")).astimezone(pytz.UTC)
+        # position in this issue, not part of the period, dropping it lets unchanged periods dedupe across issues
+        p.pop("number", None)
+        temp: float = p["temperature"]
+
+        row: NumericTimeseries = NumericTimeseries(series_id="nws-hourly-forecast",
+                                                   ts=ts,
+                                                   value_=temp,
+                                                   version_ts=data_ts,
+                                                   row_metadata=p)
+        ret.append(row)
+    return ret
+
+
+def observation_rows(payload: dict, data_ts: datetime) -> list[Timeseries]:
+    obs: dict = payload["properties"]
+
+    ts: datetime = datetime.fromisoformat(obs["timestamp"]).astimezone(pytz.UTC)
+    temp: float = obs["temperature"]["value"]
+
+    row: NumericTimeseries = NumericTimeseries(series_id="nws-observations",
+                                               ts=ts,
+                                               value_=temp,
+                                               version_ts=data_ts,
+                                               row_metadata=obs)
+    return [row]
@@ -0,0 +1,83 @@
+from datetime import datetime
+from typing import Iterable
+
+import pytz
+from sqlalchemy import create_engine, text
+from sqlalchemy.future import select
+from sqlalchemy.orm import Session
+
+from rollup import Rollup, RollupWriter
+from sqlite import SqliteStore, month_start, next_month
+from timeseries import DatetimeMask
+
+# what a month keeps once its raw rows are gone, minute buckets are about as big as the rows themselves
+archive_granularities: tuple[DatetimeMask.Mask, ...] = (DatetimeMask.Mask.hour, DatetimeMask.Mask.day)
+
+
+def months_before(month: datetime, months: int) -> datetime:
+    index: int = month.year * 12 + month.month - 1 - months
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+def downsample_partition(datastore: SqliteStore, month: datetime,
+                         granularities: Iterable[DatetimeMask.Mask] = archive_granularities,
+                         chunk_size: int = 10000) -> int:
+    """Recompute the month's rollup buckets in the main file from the raw rows of its partition.
+
+    The month's buckets of every partitioned model are replaced rather than added to, so a second run is harmless
+    and rows stored before rollups were turned on are counted too. Granularities not given are dropped for the month.
+    Returns the rows folded.
+    """
+    writer: RollupWriter = RollupWriter(granularities)
+    if datastore.session.in_transaction():
+        datastore.session.commit()
+    engine = create_engine(f"sqlite:///{datastore.partition_path(month)}", echo=False, future=True)
+    rows_done: int = 0
+    try:
+        with Session(engine) as partition, datastore.engine.begin() as conn:
+            for model in datastore.partitioned:
+                # buckets are formatted timestamps, the month's all sort between its first day and the next month's
+                conn.execute(text(f"DELETE FROM {Rollup.__tablename__} "
+                                  f"WHERE source = :source AND bucket >= :start AND bucket < :end"),
+                             {"source": model.__tablename__, "start": f"{month:%Y-%m-%d}",
+                              "end": f"{next_month(month):%Y-%m-%d}"})
+                stmt = select(model).execution_options(yield_per=chunk_size)
+                for chunk in partition.execute(stmt).scalars().partitions(chunk_size):
+                    writer(conn, chunk)
+                    rows_done += len(chunk)
+    finally:
+        engine.dispose()
+    return rows_done
+
+
+def compact(datastore: SqliteStore, retain_months: int = 12,
+            granularities: Iterable[DatetimeMask.Mask] = archive_granularities, chunk_size: int = 10000,
+            vacuum: bool = True) -> int:
+    """Retention and compaction of the datastore's partitioned models, run every month or so:
+
+    - rows from before this month move out of the main file into monthly partitions
+    - partitions more than retain_months before this month are downsampled to rollups, then deleted
+    - the main file is vacuumed when rows moved, it is back to one month of rows and indexes that stay cached
+
+    Returns the rows moved out of the main file.
+    """
+    moved: int = datastore.roll_partitions(chunk_size=chunk_size)
+    cutoff: datetime = months_before(month_start(datetime.now(tz=pytz.UTC)), retain_months)
+    for month in datastore.partition_months(end=cutoff):
+        rows: int = downsample_partition(datastore, month, granularities, chunk_size)
+        datastore.drop_partition(month)
+        print(f"partition {month:%Y-%m}: {rows} rows downsampled to rollups, deleted")
+    if moved and vacuum:
+        datastore.vacuum()
+    return moved
+
+
+if __name__ == "__main__":
+    import sys
+
+    from controller import ControllerCollect
+
+    retain_months: int = int(sys.argv[1]) if len(sys.argv) > 1 else 12
+    datastore: SqliteStore = SqliteStore("sensors", [ControllerCollect, Rollup], wal=True,
+                                         partitioned=[ControllerCollect])
+    compact(datastore, retain_months)
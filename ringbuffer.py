@@ -0,0 +1,156 @@
+from collections import deque
+from typing import Any, Iterable, Optional, Type
+
+import numpy as np
+from sqlalchemy import DateTime, Integer, Numeric, Text
+
+from sqlite import Base
+
+
+class RollingWindow:
+    """Running sum, count, min and max over the newest `size` rows of a RingBuffer.
+
+    Sums are updated by adding the new value and subtracting the one leaving the window, min and max use monotonic
+    deques, so every push is O(1) amortized per channel. Missing values (NaN) are skipped.
+    """
+    def __init__(self, channels: list[str], size: int):
+        self.size: int = size
+        self.sums: np.ndarray = np.zeros(len(channels))
+        self.counts: np.ndarray = np.zeros(len(channels), dtype=np.int64)
+        self.mins: list[deque] = [deque() for _ in channels]
+        self.maxs: list[deque] = [deque() for _ in channels]
+
+    def push(self, seq: int, new: np.ndarray, old: Optional[np.ndarray]):
+        new_ok: np.ndarray = ~np.isnan(new)
+        self.sums += np.where(new_ok, new, 0.0)
+        self.counts += new_ok
+        if old is not None:
+            old_ok: np.ndarray = ~np.isnan(old)
+            self.sums -= np.where(old_ok, old, 0.0)
+            self.counts -= old_ok
+
+        oldest_kept: int = seq - self.size + 1
+        for i, value in enumerate(new):
+            for q, worse in ((self.mins[i], float.__ge__), (self.maxs[i], float.__le__)):
+                while q and q[0][0] < oldest_kept:
+                    q.popleft()
+                if new_ok[i]:
+                    while q and worse(q[-1][1], float(value)):
+                        q.pop()
+                    q.append((seq, float(value)))
+
+    def resum(self, values: np.ndarray):
+        # Wipe accumulated float error, values are the rows currently in the window
+        ok: np.ndarray = ~np.isnan(values)
+        self.sums = np.where(ok, values, 0.0).sum(axis=0)
+        self.counts = ok.sum(axis=0)
+
+
+class RingBuffer:
+    """Preallocated NumPy structured array holding the last `capacity` rows.
+
+    Numeric channels get O(1) rolling mean, min, max and EWMA over each window in `windows` (the whole capacity when
+    not given). Text channels are kept for lookback but have no statistics.
+    """
+    def __init__(self, channels: list[str], capacity: int, windows: Iterable[int] = (),
+                 text_channels: Iterable[str] = (), ewma_alpha: float = 0.2):
+        self.channels: list[str] = list(channels)
+        self.text_channels: list[str] = list(text_channels)
+        self.index: dict[str, int] = {c: i for i, c in enumerate(self.channels)}
+        self.capacity: int = capacity
+        self.ewma_alpha: float = ewma_alpha
+
+        self.data: np.ndarray = np.zeros(capacity, dtype=[("seq", "i8"), ("values", "f8", (len(self.channels),))]
+                                         + [(c, "U32") for c in self.text_channels])
+        self.data["values"] = np.nan
+        self.seq: int = 0
+
+        sizes: set[int] = {capacity, *windows}
+        if max(sizes) > capacity:
+            raise ValueError(f"windows must fit in the capacity of {capacity}")
+        self.windows: dict[int, RollingWindow] = {size: RollingWindow(self.channels, size) for size in sizes}
+        self.ewmas: np.ndarray = np.full(len(self.channels), np.nan)
+
+    @classmethod
+    def from_model(cls, model: Type[Base], capacity: int, **kwargs) -> "RingBuffer":
+        """Channels for every numeric and text column of a model, timestamps go in as epoch seconds."""
+        channels: list[str] = []
+        text_channels: list[str] = []
+        for column in model.__table__.columns:
+            if isinstance(column.type, (Numeric, Integer)):
+                channels.append(column.key)
+            elif isinstance(column.type, Text):
+                text_channels.append(column.key)
+            elif not isinstance(column.type, DateTime):
+                raise ValueError(f"no ring buffer channel type for {column.key}: {column.type}")
+        return cls(channels, capacity, text_channels=text_channels, **kwargs)
+
+    def __len__(self) -> int:
+        return min(self.seq, self.capacity)
+
+    def push(self, values: dict[str, Any]):
+        slot: int = self.seq % self.capacity
+        new: np.ndarray = np.array([np.nan if values.get(c) is None else float(values[c]) for c in self.channels])
+
+        for size, window in self.windows.items():
+            leaving: Optional[np.ndarray] = None
+            if size <= self.seq:
+                leaving = self.data["values"][(self.seq - size) % self.capacity].copy()
+            window.push(self.seq, new, leaving)
+
+        self.data["seq"][slot] = self.seq
+        self.data["values"][slot] = new
+        for c in self.text_channels:
+            self.data[c][slot] = "" if values.get(c) is None else str(values[c])
+
+        ok: np.ndarray = ~np.isnan(new)
+        first: np.ndarray = ok & np.isnan(self.ewmas)
+        self.ewmas = np.where(first, new, self.ewmas)
+        update: np.ndarray = ok & ~first
+        self.ewmas = np.where(update, self.ewma_alpha * new + (1 - self.ewma_alpha) * self.ewmas, self.ewmas)
+
+        self.seq += 1
+        if self.seq % self.capacity == 0:
+            for size, window in self.windows.items():
+                window.resum(self.values(size))
+
+    def push_row(self, row: Base):
+        self.push({c: getattr(row, c, None) for c in self.channels + self.text_channels})
+
+    def values(self, window: Optional[int] = None) -> np.ndarray:
+        """Rows oldest to newest as a (rows, channels) array, a copy."""
+        n: int = min(len(self), window or self.capacity)
+        order: np.ndarray = (np.arange(self.seq - n, self.seq)) % self.capacity
+        return self.data["values"][order]
+
+    def column(self, channel: str, window: Optional[int] = None) -> np.ndarray:
+        if channel in self.text_channels:
+            n: int = min(len(self), window or self.capacity)
+            return self.data[channel][(np.arange(self.seq - n, self.seq)) % self.capacity]
+        return self.values(window)[:, self.index[channel]]
+
+    def latest(self, channel: str) -> Optional[Any]:
+        if self.seq == 0:
+            return None
+        slot: int = (self.seq - 1) % self.capacity
+        if channel in self.text_channels:
+            return self.data[channel][slot] or None
+        value: float = self.data["values"][slot][self.index[channel]]
+        return None if np.isnan(value) else float(value)
+
+    def mean(self, channel: str, window: Optional[int] = None) -> Optional[float]:
+        w: RollingWindow = self.windows[window or self.capacity]
+        i: int = self.index[channel]
+        return None if w.counts[i] == 0 else float(w.sums[i] / w.counts[i])
+
+    def min(self, channel: str, window: Optional[int] = None) -> Optional[float]:
+        q: deque = self.windows[window or self.capacity].mins[self.index[channel]]
+        return q[0][1] if q else None
+
+    def max(self, channel: str, window: Optional[int] = None) -> Optional[float]:
+        q: deque = self.windows[window or self.capacity].maxs[self.index[channel]]
+        return q[0][1] if q else None
+
+    def ewma(self, channel: str) -> Optional[float]:
+        value: float = self.ewmas[self.index[channel]]
+        return None if np.isnan(value) else float(value)
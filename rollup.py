@@ -0,0 +1,131 @@
+from datetime import datetime
+from typing import Any, Iterable, Optional, Tuple
+
+import pytz
+from sqlalchemy import Column, TEXT, INTEGER, REAL, text
+from sqlalchemy.future import select
+
+from sqlite import Base, BaseWithMigrations, GenericQuery, SqliteStore
+from timeseries import DatetimeMask
+
+# (series, ts, value) samples a row contributes to the rollups
+Sample = Tuple[str, datetime, float]
+
+
+class Rollup(BaseWithMigrations):
+    """Pre-aggregated buckets of a source table, one row per source, series, granularity and bucket.
+
+    bucket is the sample ts formatted with the DatetimeMask for the granularity, so it lines up with the masks used
+    by the ad-hoc queries in sql_queries/.
+    """
+    __tablename__ = "rollup"
+
+    source: str = Column(TEXT, primary_key=True, nullable=False)
+    series: str = Column(TEXT, primary_key=True, nullable=False)
+    granularity: str = Column(TEXT, primary_key=True, nullable=False)
+    bucket: str = Column(TEXT, primary_key=True, nullable=False)
+
+    count: int = Column(INTEGER, nullable=False)
+    sum: float = Column(REAL, nullable=False)
+    min: float = Column(REAL, nullable=False)
+    max: float = Column(REAL, nullable=False)
+    last: float = Column(REAL, nullable=False)
+    last_epoch_ts: float = Column(REAL, nullable=False)
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count
+
+    @classmethod
+    def migrations(cls) -> list[str]:
+        return []
+
+
+upsert_sql: str = f"""
+INSERT INTO {Rollup.__tablename__} (source, series, granularity, bucket, count, sum, min, max, last, last_epoch_ts)
+VALUES (:source, :series, :granularity, :bucket, :count, :sum, :min, :max, :last, :last_epoch_ts)
+ON CONFLICT (source, series, granularity, bucket) DO UPDATE SET
+    count = count + excluded.count,
+    sum = sum + excluded.sum,
+    min = MIN(min, excluded.min),
+    max = MAX(max, excluded.max),
+    last = CASE WHEN last_epoch_ts <= excluded.last_epoch_ts THEN excluded.last ELSE last END,
+    last_epoch_ts = MAX(last_epoch_ts, excluded.last_epoch_ts)
+"""
+
+default_granularities: tuple[DatetimeMask.Mask, ...] = (DatetimeMask.Mask.minute, DatetimeMask.Mask.hour,
+                                                        DatetimeMask.Mask.day)
+
+
+def as_utc(ts: datetime) -> datetime:
+    # SQLite hands back naive datetimes, everything in these tables is stored as UTC
+    return ts.replace(tzinfo=pytz.UTC) if ts.tzinfo is None else ts.astimezone(pytz.UTC)
+
+
+def bucket(ts: datetime, granularity: DatetimeMask.Mask) -> str:
+    return as_utc(ts).strftime(granularity.value)
+
+
+class RollupWriter:
+    """SqliteStore write hook that folds every stored row into the rollup buckets, in the same transaction.
+
+    Rows opt in by defining rollup_samples() returning (series, ts, value) samples. Each batch is aggregated in
+    memory first so there is one upsert per touched bucket, not per sample.
+    """
+    def __init__(self, granularities: Iterable[DatetimeMask.Mask] = default_granularities):
+        self.granularities: tuple[DatetimeMask.Mask, ...] = tuple(granularities)
+
+    def aggregate(self, rows: list[Base]) -> list[dict[str, Any]]:
+        buckets: dict[Tuple[str, str, str, str], dict[str, Any]] = {}
+        for row in rows:
+            if not hasattr(row, "rollup_samples"):
+                continue
+            source: str = row.__tablename__
+            for series, ts, value in row.rollup_samples():
+                epoch_ts: float = as_utc(ts).timestamp()
+                for granularity in self.granularities:
+                    key: Tuple[str, str, str, str] = (source, series, granularity.name, bucket(ts, granularity))
+                    agg: Optional[dict[str, Any]] = buckets.get(key)
+                    if agg is None:
+                        buckets[key] = {"source": source, "series": series, "granularity": granularity.name,
+                                        "bucket": key[3], "count": 1, "sum": value, "min": value, "max": value,
+                                        "last": value, "last_epoch_ts": epoch_ts}
+                        continue
+                    agg["count"] += 1
+                    agg["sum"] += value
+                    agg["min"] = min(agg["min"], value)
+                    agg["max"] = max(agg["max"], value)
+                    if agg["last_epoch_ts"] <= epoch_ts:
+                        agg["last"] = value
+                        agg["last_epoch_ts"] = epoch_ts
+        return list(buckets.values())
+
+    def __call__(self, conn, rows: list[Base]):
+        params: list[dict[str, Any]] = self.aggregate(rows)
+        if params:
+            conn.execute(text(upsert_sql), params)
+
+    def backfill(self, datastore: SqliteStore, stmt: GenericQuery, chunk_size: int = 10000) -> int:
+        """Fold rows that were stored before rollups were turned on. Run once per source, it is not idempotent."""
+        rows_done: int = 0
+        session = datastore.session
+        # Reads and upserts share the session's connection, a second connection would deadlock on the file lock
+        with session.begin():
+            result = session.execute(stmt.execution_options(yield_per=chunk_size)).scalars()
+            for chunk in result.partitions(chunk_size):
+                self(session, chunk)
+                rows_done += len(chunk)
+                print(f"rollup backfill: {rows_done} rows")
+        return rows_done
+
+
+def rollup_query(source: str, series: str, granularity: DatetimeMask.Mask, start: Optional[datetime] = None,
+                 end: Optional[datetime] = None) -> GenericQuery[Rollup]:
+    """Buckets overlapping [start, end], oldest first."""
+    stmt = select(Rollup).where(Rollup.source == source, Rollup.series == series,
+                                Rollup.granularity == granularity.name)
+    if start is not None:
+        stmt = stmt.where(bucket(start, granularity) <= Rollup.bucket)
+    if end is not None:
+        stmt = stmt.where(Rollup.bucket <= bucket(end, granularity))
+    return stmt.order_by(Rollup.bucket)
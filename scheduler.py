@@ -0,0 +1,169 @@
+import asyncio
+import math
+import time
+from datetime import datetime
+from enum import Enum
+from typing import Callable, Optional
+
+import pytz
+
+from metrics import registry as metrics
+
+scheduler_lateness_seconds = metrics.histogram("scheduler_lateness_seconds", "How late a cycle started after its "
+                                                                             "deadline")
+scheduler_overruns = metrics.counter("scheduler_overruns", "Cycles that ran past the next deadline")
+scheduler_missed_ticks = metrics.counter("scheduler_missed_ticks", "Deadlines dropped by the skip policy")
+scheduler_resyncs = metrics.counter("scheduler_resyncs", "Realignments after the wall clock stepped")
+
+
+class OverrunPolicy(Enum):
+    # drop the deadlines that passed during an overrun, the next cycle runs at the next boundary still ahead
+    SKIP = "skip"
+    # run the passed deadlines' cycles right away, back to back, up to max_catch_up in a row, then skip
+    CATCH_UP = "catch_up"
+
+
+class Tick:
+    """One scheduled cycle.
+
+    :param ts: the wall clock boundary the cycle is for, strictly increasing across ticks
+    :param lateness_s: how long after its deadline the cycle was released
+    :param missed: deadlines skipped right before this one
+    """
+    def __init__(self, ts: datetime, deadline: float, lateness_s: float, missed: int):
+        self.ts: datetime = ts
+        self.deadline: float = deadline
+        self.lateness_s: float = lateness_s
+        self.missed: int = missed
+
+    @property
+    def epoch_ts(self) -> int:
+        return int(self.ts.timestamp())
+
+
+class JitterStats:
+    """Running lateness statistics (Welford), alongside the scheduler_lateness_seconds histogram."""
+    def __init__(self):
+        self.count: int = 0
+        self.mean_s: float = 0.0
+        self.m2: float = 0.0
+        self.max_s: float = 0.0
+        self.overruns: int = 0
+        self.missed: int = 0
+
+    def add(self, lateness_s: float):
+        self.count += 1
+        delta: float = lateness_s - self.mean_s
+        self.mean_s += delta / self.count
+        self.m2 += delta * (lateness_s - self.mean_s)
+        self.max_s = max(self.max_s, lateness_s)
+
+    @property
+    def stdev_s(self) -> float:
+        return math.sqrt(self.m2 / (self.count - 1)) if 1 < self.count else 0.0
+
+    def __str__(self) -> str:
+        return (f"{self.count} cycles, lateness mean {self.mean_s * 1000:.1f}ms stdev {self.stdev_s * 1000:.1f}ms "
+                f"max {self.max_s * 1000:.1f}ms, {self.overruns} overruns, {self.missed} missed")
+
+
+class FixedRateScheduler:
+    """Releases cycles every period_s on wall clock boundaries, e.g. at :00 of every minute for period_s=60.
+
+    Deadlines are kept on the monotonic clock and advance by exactly period_s, so time spent in a cycle does not
+    push the next one back and the cadence doesn't drift. A cycle still running at its next deadline is an overrun,
+    handled by policy. If the wall clock steps (NTP) by more than resync_s against the monotonic clock, deadlines
+    are realigned to the new wall clock boundaries; tick timestamps still never repeat or go backwards, so they
+    are safe as a unique epoch_ts (for period_s of a second or more).
+
+    :param offset_s: boundaries at offset_s past each multiple of period_s
+    :param clock: wall clock, time.time
+    :param monotonic: time.monotonic
+    """
+    def __init__(self, period_s: float, policy: OverrunPolicy = OverrunPolicy.SKIP, offset_s: float = 0.0,
+                 max_catch_up: int = 3, resync_s: float = 1.0, name: str = "control",
+                 clock: Callable[[], float] = time.time, monotonic: Callable[[], float] = time.monotonic):
+        if period_s <= 0:
+            raise ValueError(f"period_s must be positive, got {period_s}")
+        self.period_s: float = period_s
+        self.policy: OverrunPolicy = policy
+        self.offset_s: float = offset_s
+        self.max_catch_up: int = max_catch_up
+        self.resync_s: float = resync_s
+        self.clock: Callable[[], float] = clock
+        self.monotonic: Callable[[], float] = monotonic
+
+        self.stats: JitterStats = JitterStats()
+        self.lateness = scheduler_lateness_seconds.labels(scheduler=name)
+        self.overruns = scheduler_overruns.labels(scheduler=name)
+        self.missed = scheduler_missed_ticks.labels(scheduler=name)
+        self.resyncs = scheduler_resyncs.labels(scheduler=name)
+
+        # wall minus monotonic time, the next deadline on the monotonic clock and the ts its tick gets
+        self.wall_offset: float = 0.0
+        self.deadline: float = 0.0
+        self.next_ts: float = -math.inf
+        self.caught_up: int = 0
+        self.align()
+
+    def align(self):
+        """Next deadline at the first wall clock boundary from now on."""
+        wall_now: float = self.clock()
+        mono_now: float = self.monotonic()
+        self.wall_offset = wall_now - mono_now
+        boundary: float = math.ceil((wall_now - self.offset_s) / self.period_s) * self.period_s + self.offset_s
+        self.deadline = boundary - self.wall_offset
+        # after the wall clock went back the cadence follows it right away, but tick timestamps carry on from the
+        # last one handed out until the clock catches up, so they never repeat
+        self.next_ts = max(boundary, self.next_ts)
+
+    def next_tick(self) -> tuple[Tick, float]:
+        """The next cycle and the seconds to wait until it is due, advancing the deadline past it."""
+        if self.resync_s < abs(self.clock() - self.monotonic() - self.wall_offset):
+            self.resyncs.inc()
+            self.align()
+
+        now: float = self.monotonic()
+        missed: int = 0
+        if self.deadline < now:
+            # the previous cycle ran past this deadline
+            self.overruns.inc()
+            self.stats.overruns += 1
+            if self.policy == OverrunPolicy.CATCH_UP and self.caught_up < self.max_catch_up:
+                self.caught_up += 1
+            else:
+                missed = int((now - self.deadline) // self.period_s) + 1
+                self.deadline += missed * self.period_s
+                self.next_ts += missed * self.period_s
+                self.missed.inc(missed)
+                self.stats.missed += missed
+                self.caught_up = 0
+        else:
+            self.caught_up = 0
+
+        wait_s: float = max(0.0, self.deadline - now)
+        lateness_s: float = max(0.0, now - self.deadline)
+        tick: Tick = Tick(datetime.fromtimestamp(self.next_ts, tz=pytz.UTC), self.deadline, lateness_s, missed)
+        self.deadline += self.period_s
+        self.next_ts += self.period_s
+        return tick, wait_s
+
+    def released(self, tick: Tick):
+        tick.lateness_s = max(0.0, self.monotonic() - tick.deadline)
+        self.lateness.observe(tick.lateness_s)
+        self.stats.add(tick.lateness_s)
+
+    def wait(self) -> Tick:
+        """Block until the next cycle is due."""
+        tick, wait_s = self.next_tick()
+        if wait_s:
+            time.sleep(wait_s)
+        self.released(tick)
+        return tick
+
+    async def wait_async(self) -> Tick:
+        tick, wait_s = self.next_tick()
+        if wait_s:
+            await asyncio.sleep(wait_s)
+        self.released(tick)
+        return tick
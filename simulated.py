@@ -0,0 +1,339 @@
+import asyncio
+import random
+import threading
+from math import pi, sin
+from time import monotonic, sleep
+from typing import Callable, Optional
+
+import numpy as np
+
+from fan_scripting import State
+from thermostat import Thermostat
+
+
+class Waveform:
+    """mean + amplitude * sin(2 pi t / period) plus gaussian noise, clamped to [minimum, maximum]."""
+    def __init__(self, mean: float, amplitude: float = 0.0, period_s: float = 86400.0, noise: float = 0.0,
+                 minimum: Optional[float] = None, maximum: Optional[float] = None):
+        self.mean: float = mean
+        self.amplitude: float = amplitude
+        self.period_s: float = period_s
+        self.noise: float = noise
+        self.minimum: Optional[float] = minimum
+        self.maximum: Optional[float] = maximum
+
+    def sample(self, t: float, rng: random.Random) -> float:
+        value: float = self.mean + self.amplitude * sin(2 * pi * t / self.period_s)
+        if self.noise:
+            value += rng.gauss(0, self.noise)
+        if self.minimum is not None:
+            value = max(self.minimum, value)
+        if self.maximum is not None:
+            value = min(self.maximum, value)
+        return value
+
+
+class SimulatedDevice:
+    """Common latency and failure injection for the simulated drivers.
+
+    Every device read sleeps for latency_s plus up to jitter_s, then fails with probability failure_rate.
+    """
+    def __init__(self, latency_s: float = 0.0, jitter_s: float = 0.0, failure_rate: float = 0.0,
+                 seed: Optional[int] = None, clock: Callable[[], float] = monotonic):
+        self.latency_s: float = latency_s
+        self.jitter_s: float = jitter_s
+        self.failure_rate: float = failure_rate
+        self.rng: random.Random = random.Random(seed)
+        self.clock: Callable[[], float] = clock
+        self.started_at: float = clock()
+
+    def elapsed(self) -> float:
+        return self.clock() - self.started_at
+
+    def delay(self) -> float:
+        return self.latency_s + (self.rng.uniform(0, self.jitter_s) if self.jitter_s else 0.0)
+
+    def maybe_fail(self):
+        if self.failure_rate and self.rng.random() < self.failure_rate:
+            raise OSError(f"simulated {type(self).__name__} failure")
+
+    def io(self, fail: bool = True):
+        delay: float = self.delay()
+        if delay > 0:
+            sleep(delay)
+        if fail:
+            self.maybe_fail()
+
+    async def io_async(self):
+        delay: float = self.delay()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        self.maybe_fail()
+
+
+class SimulatedBME280(SimulatedDevice):
+    def __init__(self, temperature_C: Waveform = Waveform(24.0, 3.0, noise=0.05),
+                 humidity_pct: Waveform = Waveform(45.0, 10.0, noise=0.2, minimum=0, maximum=100), **kwargs):
+        super().__init__(**kwargs)
+        self.temperature_C: Waveform = temperature_C
+        self.humidity_pct: Waveform = humidity_pct
+        self.temperature: float = 0.0
+        self.humidity: float = 0.0
+        # the constructor's first measurement can't fail, injected failures are for the reads
+        self.measure()
+
+    def update_sensor(self):
+        self.io()
+        self.measure()
+
+    def measure(self):
+        t: float = self.elapsed()
+        self.temperature = self.temperature_C.sample(t, self.rng)
+        self.humidity = self.humidity_pct.sample(t, self.rng)
+
+    def get_temperature(self) -> float:
+        return self.temperature
+
+    def get_humidity(self) -> float:
+        return self.humidity
+
+
+class SimulatedLTR559(SimulatedDevice):
+    def __init__(self, lux: Waveform = Waveform(100.0, 100.0, noise=1.0, minimum=0),
+                 proximity: Waveform = Waveform(0.0, minimum=0), **kwargs):
+        super().__init__(**kwargs)
+        self.lux: Waveform = lux
+        self.proximity: Waveform = proximity
+
+    def update_sensor(self):
+        self.io()
+
+    def get_lux(self) -> float:
+        self.io()
+        return self.lux.sample(self.elapsed(), self.rng)
+
+    def get_proximity(self) -> float:
+        self.io()
+        return self.proximity.sample(self.elapsed(), self.rng)
+
+
+class SimulatedGasReadings:
+    def __init__(self, oxidising: float, reducing: float, nh3: float):
+        self.oxidising: float = oxidising
+        self.reducing: float = reducing
+        self.nh3: float = nh3
+        self.adc = None
+
+
+class SimulatedGas(SimulatedDevice):
+    def __init__(self, reducing_ohm: Waveform = Waveform(250000.0, 50000.0, noise=2000.0, minimum=1),
+                 oxidising_ohm: Waveform = Waveform(20000.0, 5000.0, noise=200.0, minimum=1),
+                 nh3_ohm: Waveform = Waveform(100000.0, 20000.0, noise=1000.0, minimum=1), **kwargs):
+        super().__init__(**kwargs)
+        self.reducing_ohm: Waveform = reducing_ohm
+        self.oxidising_ohm: Waveform = oxidising_ohm
+        self.nh3_ohm: Waveform = nh3_ohm
+
+    def read_all(self) -> SimulatedGasReadings:
+        self.io()
+        t: float = self.elapsed()
+        return SimulatedGasReadings(oxidising=self.oxidising_ohm.sample(t, self.rng),
+                                    reducing=self.reducing_ohm.sample(t, self.rng),
+                                    nh3=self.nh3_ohm.sample(t, self.rng))
+
+
+class SimulatedPMS5003Data:
+    def __init__(self, pm1p0: float, pm2p5: float, pm10: float):
+        self.pm: dict[float, float] = {1.0: pm1p0, 2.5: pm2p5, 10: pm10}
+
+    def pm_ug_per_m3(self, size: float, atmospheric_environment: bool = False) -> float:
+        return self.pm[size]
+
+
+class SimulatedPMS5003(SimulatedDevice):
+    def __init__(self, pm2p5_ug_per_m3: Waveform = Waveform(6.0, 4.0, noise=0.5, minimum=0), **kwargs):
+        # The real sensor streams a frame roughly every second and read() blocks until the next one, latency_s and
+        # jitter_s model that; by default read() returns at once so simulations run unthrottled
+        super().__init__(**kwargs)
+        self.pm2p5_ug_per_m3: Waveform = pm2p5_ug_per_m3
+
+    def read(self) -> SimulatedPMS5003Data:
+        self.io()
+        pm2p5: float = self.pm2p5_ug_per_m3.sample(self.elapsed(), self.rng)
+        return SimulatedPMS5003Data(pm1p0=pm2p5 * 0.6, pm2p5=pm2p5, pm10=pm2p5 * 1.3)
+
+
+class SimulatedSCD4X(SimulatedDevice):
+    """A measurement is ready every measurement_interval_s, the real sensor's low power mode is about 30s. Like the
+    real one, data_ready only reports it and reading CO2, temperature or relative_humidity takes it."""
+    def __init__(self, co2_ppm: Waveform = Waveform(650.0, 250.0, noise=10.0, minimum=400),
+                 temperature_C: Waveform = Waveform(25.0, 3.0, noise=0.05),
+                 humidity_pct: Waveform = Waveform(42.0, 10.0, noise=0.2, minimum=0, maximum=100),
+                 measurement_interval_s: float = 0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.co2_ppm: Waveform = co2_ppm
+        self.temperature_C: Waveform = temperature_C
+        self.humidity_pct: Waveform = humidity_pct
+        self.measurement_interval_s: float = measurement_interval_s
+        self.temperature_offset: float = 4.0
+        self.last_measurement_at: Optional[float] = None
+
+        self.co2: Optional[float] = None
+        self.temp: Optional[float] = None
+        self.humidity: Optional[float] = None
+
+    # mode commands take the bus time but don't fail, injected failures are for the measurement reads
+    def start_low_periodic_measurement(self):
+        self.io(fail=False)
+
+    def stop_periodic_measurement(self):
+        self.io(fail=False)
+
+    def pending(self) -> bool:
+        return (self.last_measurement_at is None or
+                self.elapsed() - self.last_measurement_at >= self.measurement_interval_s)
+
+    def read_measurement(self):
+        # a pending measurement is taken, otherwise the last one read is returned again
+        if not self.pending():
+            return
+        t: float = self.elapsed()
+        self.last_measurement_at = t
+        self.co2 = self.co2_ppm.sample(t, self.rng)
+        self.temp = self.temperature_C.sample(t, self.rng)
+        self.humidity = self.humidity_pct.sample(t, self.rng)
+
+    @property
+    def data_ready(self) -> bool:
+        self.io()
+        return self.pending()
+
+    @property
+    def CO2(self) -> Optional[float]:
+        self.read_measurement()
+        return self.co2
+
+    @property
+    def temperature(self) -> Optional[float]:
+        self.read_measurement()
+        return self.temp
+
+    @property
+    def relative_humidity(self) -> Optional[float]:
+        self.read_measurement()
+        return self.humidity
+
+
+class SimulatedCpuThermalZone(SimulatedDevice):
+    def __init__(self, temperature_C: Waveform = Waveform(50.0, 5.0, period_s=600.0, noise=0.5), **kwargs):
+        super().__init__(**kwargs)
+        self.temperature_C: Waveform = temperature_C
+
+    def get_temperature(self) -> float:
+        self.io()
+        return self.temperature_C.sample(self.elapsed(), self.rng)
+
+
+class SimulatedDisplay(SimulatedDevice):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.last_message: Optional[str] = None
+        self.frames_pushed: int = 0
+
+    def write_text(self, message: str):
+        self.io()
+        self.last_message = message
+        self.frames_pushed += 1
+
+
+class SimulatedPanel(SimulatedDevice):
+    """Stands in for the ST7735 under display.Display, latency_s is the SPI transfer time of one frame."""
+    def __init__(self, width: int = 160, height: int = 80, **kwargs):
+        super().__init__(**kwargs)
+        self.width: int = width
+        self.height: int = height
+        self.last_frame = None
+        self.frames_pushed: int = 0
+
+    def display(self, image):
+        self.io()
+        self.last_frame = image
+        self.frames_pushed += 1
+
+
+class SimulatedAudioStream:
+    """Stands in for sounddevice.InputStream: a thread calls callback(indata, frames, time, status) with blocksize
+    frames every blocksize / samplerate seconds, until stopped.
+
+    indata is one buffer refilled for every block, like PortAudio's. The signal is a tone plus gaussian noise.
+    """
+    def __init__(self, samplerate: int = 48000, blocksize: int = 12000, channels: int = 1,
+                 callback: Optional[Callable] = None, tone_hz: float = 1000.0, amplitude: float = 0.05,
+                 noise: float = 0.005, seed: Optional[int] = None):
+        self.samplerate: int = samplerate
+        self.blocksize: int = blocksize
+        self.callback: Optional[Callable] = callback
+        self.tone_hz: float = tone_hz
+        self.amplitude: float = amplitude
+        self.noise: float = noise
+        self.rng: np.random.Generator = np.random.default_rng(seed)
+        self.indata: np.ndarray = np.zeros((blocksize, channels), dtype=np.float32)
+        self.blocks: int = 0
+        self.stopping: Optional[threading.Event] = None
+        self.thread: Optional[threading.Thread] = None
+
+    def fill(self, first_frame: int):
+        t: np.ndarray = (first_frame + np.arange(self.blocksize)) / self.samplerate
+        self.indata[:] = (self.amplitude * np.sin(2 * pi * self.tone_hz * t))[:, np.newaxis]
+        self.indata += self.rng.normal(0, self.noise, self.indata.shape)
+
+    def stream(self):
+        period_s: float = self.blocksize / self.samplerate
+        deadline: float = monotonic()
+        while not self.stopping.is_set():
+            deadline += period_s
+            if self.stopping.wait(max(0.0, deadline - monotonic())):
+                break
+            self.fill(self.blocks * self.blocksize)
+            self.blocks += 1
+            self.callback(self.indata, self.blocksize, None, None)
+
+    def start(self):
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.stream, name="simulated-audio", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.thread is not None:
+            self.stopping.set()
+            self.thread.join()
+            self.thread = None
+
+    abort = stop
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class SimulatedThermostat(Thermostat):
+    """Real thermostat logic in front of a simulated fan plug."""
+    def __init__(self, latency_s: float = 0.0, jitter_s: float = 0.0, failure_rate: float = 0.0,
+                 seed: Optional[int] = None, **kwargs):
+        kwargs.setdefault("setpoint_F", 72.0)
+        kwargs.setdefault("cooldown_duration_s", 600)
+        super().__init__(**kwargs)
+        self.plug: SimulatedDevice = SimulatedDevice(latency_s=latency_s, jitter_s=jitter_s,
+                                                     failure_rate=failure_rate, seed=seed)
+        self.plug_state: State = State.OFF
+
+    async def switch_fan(self, new_command: State):
+        await self.plug.io_async()
+        self.plug_state = new_command
+
+    async def read_fan_state(self) -> State:
+        await self.plug.io_async()
+        return self.plug_state
@@ -1,14 +1,32 @@
+import atexit
+import glob
+import os
+import re
+import threading
 from abc import abstractmethod
+from datetime import datetime
 from enum import Enum
-from typing import Type, TypeVar
+from time import monotonic
+from typing import Any, Callable, Iterator, Optional, Type, TypeVar, Union
 
-from sqlalchemy import create_engine
+import numpy as np
+import pytz
+from sqlalchemy import create_engine, event, inspect, types, Table
 from sqlalchemy.exc import OperationalError, IntegrityError
 from sqlalchemy.future import select
 from sqlalchemy.orm import declarative_base, Session, Query, sessionmaker, scoped_session
 
+from metrics import Counter, Gauge, Histogram, registry as metrics
+
 Base = declarative_base()
 
+sqlite_write_seconds = metrics.histogram("sqlite_write_seconds", "Latency of one write transaction, a single "
+                                                                 "store_rows or a buffered flush")
+sqlite_rows_written = metrics.counter("sqlite_rows_written", "Rows written")
+sqlite_rows_dropped = metrics.counter("sqlite_rows_dropped", "Buffered rows dropped for violating a constraint")
+sqlite_flush_errors = metrics.counter("sqlite_flush_errors", "Buffered flushes that failed and were requeued")
+sqlite_pending_rows = metrics.gauge("sqlite_pending_rows", "Rows queued in buffered mode")
+
 
 class GenericTypeVar(TypeVar, _root=True):
     def __getitem__(self, item): pass
@@ -23,29 +41,96 @@ class BaseWithMigrations(Base):
 
     @classmethod
     @abstractmethod
-    def migrations(cls) -> list[str]:
+    def migrations(cls) -> list[Union[str, Callable[[Session], None]]]:
+        """DDL statements run on every start (duplicate errors are ignored), or callables given the session for
+        migrations that need to check the schema first."""
         pass
 
 
+def month_start(ts: datetime) -> datetime:
+    """UTC midnight of the first of ts's month, naive ts taken as UTC."""
+    ts = ts.replace(tzinfo=pytz.UTC) if ts.tzinfo is None else ts.astimezone(pytz.UTC)
+    return ts.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def next_month(month: datetime) -> datetime:
+    return month.replace(year=month.year + 1, month=1) if month.month == 12 else month.replace(month=month.month + 1)
+
+
 class SqliteStore:
     class ParallelizationMode(Enum):
         main = "main"
         threaded = "threaded"
 
-    def __init__(self, db_filename: str, models: list[Type[BaseWithMigrations]], ):
+    def __init__(self, db_filename: str, models: list[Type[BaseWithMigrations]], buffered: bool = False,
+                 batch_size: int = 100, flush_interval_s: Optional[float] = 300, wal: bool = False,
+                 write_hooks: list[Callable[[Any, list[Base]], None]] = None,
+                 partitioned: list[Type[BaseWithMigrations]] = None):
+        """
+        :param buffered: queue rows in memory and write them in batches instead of one transaction per store
+        :param batch_size: buffered mode flushes once this many rows are queued
+        :param flush_interval_s: buffered mode also flushes when the oldest queued row is this old, None to disable
+        :param wal: use the WAL journal with synchronous=NORMAL, fewer fsyncs per commit
+        :param write_hooks: called with the open connection or session and the rows, inside the transaction that
+            writes them, e.g. rollup.RollupWriter
+        :param partitioned: models whose rows roll_partitions moves out of the main file into one file per month,
+            {db_filename}_YYYY_MM.sqlite. fetch_columns reads them back from the partitions its range overlaps.
+        """
+        self.db_filename: str = db_filename
+        self.partitioned: list[Type[BaseWithMigrations]] = partitioned or []
+        self.partitions_ready: set[str] = set()
         self.engine = create_engine(f"sqlite:///{db_filename}.sqlite", echo=False, future=True)
+        db: str = os.path.basename(db_filename)
+        self.write_seconds: dict[str, Histogram] = {mode: sqlite_write_seconds.labels(db=db, mode=mode)
+                                                    for mode in ("row", "batch")}
+        self.rows_written: Counter = sqlite_rows_written.labels(db=db)
+        self.rows_dropped: Counter = sqlite_rows_dropped.labels(db=db)
+        self.flush_errors: Counter = sqlite_flush_errors.labels(db=db)
+        self.pending_rows: Gauge = sqlite_pending_rows.labels(db=db)
+        if wal:
+            event.listen(self.engine, "connect", self.set_wal_pragmas)
         Base.metadata.create_all(self.engine)
 
         # self.session_factory = sessionmaker(bind=self.engine)
 
         self.session: Session = Session(self.engine)
         with self.session.begin() as tx:
-            for model in models:
-                for migration in model.migrations():
-                    self.ddl_statement(self.session, migration)
+            self.migrate(self.session, models)
             print(f"migrations done")
             tx.commit()
 
+        self.write_hooks: list[Callable[[Any, list[Base]], None]] = write_hooks or []
+        self.buffered: bool = buffered
+        self.batch_size: int = batch_size
+        self.flush_interval_s: Optional[float] = flush_interval_s
+        self.pending: list[Base] = []
+        self.pending_since: Optional[float] = None
+        self.pending_lock: threading.Lock = threading.Lock()
+        self.flush_lock: threading.Lock = threading.Lock()
+        self.closed: threading.Event = threading.Event()
+        self.flusher: Optional[threading.Thread] = None
+        if self.buffered:
+            if self.flush_interval_s is not None:
+                self.flusher = threading.Thread(target=self.flush_periodically, name="sqlite-flush", daemon=True)
+                self.flusher.start()
+            atexit.register(self.close)
+
+    @staticmethod
+    def set_wal_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL;")
+        cursor.execute("PRAGMA synchronous=NORMAL;")
+        cursor.close()
+
+    @classmethod
+    def migrate(cls, session: Session, models: list[Type[BaseWithMigrations]]):
+        for model in models:
+            for migration in model.migrations():
+                if callable(migration):
+                    migration(session)
+                else:
+                    cls.ddl_statement(session, migration)
+
     @staticmethod
     def ddl_statement(session: Session, statement: str):
         try:
@@ -63,12 +148,377 @@ class SqliteStore:
         return self.store_rows([row])
 
     def store_rows(self, rows: list[Base]):
+        if self.buffered:
+            with self.pending_lock:
+                if not self.pending:
+                    self.pending_since = monotonic()
+                self.pending.extend(rows)
+                self.pending_rows.set(len(self.pending))
+                full: bool = self.batch_size <= len(self.pending)
+            if full:
+                self.flush()
+            return
+
         # session = scoped_session(self.session_factory) if new_session else self.session
         session: Session = self.session
-        with session.begin():
+        if session.in_transaction():
+            # reads through fetch_entities autobegin, end that so the write gets its own transaction
+            session.commit()
+        with self.write_seconds["row"].time(), session.begin():
             session.add_all(rows)
+            if self.write_hooks:
+                session.flush()
+                for hook in self.write_hooks:
+                    hook(session, rows)
+        self.rows_written.inc(len(rows))
+
+    @staticmethod
+    def row_values(row: Base) -> dict[str, Any]:
+        # Keyed by table column name, leaving out unset columns so server defaults still apply
+        ret: dict[str, Any] = {}
+        for prop in inspect(type(row)).column_attrs:
+            value: Any = getattr(row, prop.key)
+            if value is not None:
+                ret[prop.columns[0].key] = value
+        return ret
+
+    def insert_batch(self, rows: list[Base]):
+        # One transaction and one executemany per table and column set, skipping the ORM unit of work
+        batches: dict[tuple[Table, tuple[str, ...]], list[dict[str, Any]]] = {}
+        for row in rows:
+            values: dict[str, Any] = self.row_values(row)
+            batches.setdefault((row.__table__, tuple(sorted(values))), []).append(values)
+
+        with self.write_seconds["batch"].time(), self.engine.begin() as conn:
+            for (table, _), values in batches.items():
+                conn.execute(table.insert(), values)
+            for hook in self.write_hooks:
+                hook(conn, rows)
+        self.rows_written.inc(len(rows))
+
+    def flush(self):
+        with self.pending_lock:
+            rows: list[Base] = self.pending
+            self.pending = []
+            self.pending_since = None
+            self.pending_rows.set(0)
+        if not rows:
+            return
+
+        with self.flush_lock:
+            try:
+                self.insert_batch(rows)
+            except IntegrityError as ie:
+                # One duplicate shouldn't cost the whole batch, retry row by row and drop the offenders
+                print(f"ERROR batch insert failed, retrying {len(rows)} rows individually: {ie}")
+                for row in rows:
+                    try:
+                        self.insert_batch([row])
+                    except IntegrityError as row_ie:
+                        self.rows_dropped.inc()
+                        print(f"ERROR dropping row: {row_ie}")
+            except Exception:
+                # Put the rows back so the next flush tries again
+                self.flush_errors.inc()
+                with self.pending_lock:
+                    self.pending = rows + self.pending
+                    self.pending_since = monotonic()
+                    self.pending_rows.set(len(self.pending))
+                raise
+
+    def flush_periodically(self):
+        while not self.closed.wait(min(self.flush_interval_s, 1.0)):
+            pending_since: Optional[float] = self.pending_since
+            if pending_since is not None and self.flush_interval_s <= monotonic() - pending_since:
+                try:
+                    self.flush()
+                except Exception as e:
+                    print(f"ERROR periodic flush failed, will retry: {e}")
+
+    def close(self):
+        self.closed.set()
+        if self.flusher is not None:
+            self.flusher.join()
+        self.flush()
 
     def fetch_entities(self, stmt: GenericQuery[M], ) -> list[M]:
         res: list[M] = self.session.execute(statement=stmt).scalars().all()
 
         return res
+
+    @staticmethod
+    def column_kind(column) -> str:
+        # what a column comes back as from fetch_columns; TypeDecorators by what they store (epoch ints are numbers)
+        stored = column.type.impl if isinstance(column.type, types.TypeDecorator) else column.type
+        if isinstance(stored, types.DateTime):
+            return "datetime"
+        if isinstance(stored, (types.Integer, types.Numeric, types.Float)):
+            return "number"
+        return "object"
+
+    def bind_time(self, column, value: Union[datetime, float]) -> Any:
+        """start/end of fetch_columns as stored in column: datetimes or epoch seconds either way."""
+        kind: str = self.column_kind(column)
+        if not isinstance(value, datetime):
+            if kind != "datetime":
+                return value
+            value = datetime.fromtimestamp(value, tz=pytz.UTC)
+        if kind == "datetime":
+            # DateTime columns hold naive UTC
+            if value.tzinfo is not None:
+                value = value.astimezone(pytz.UTC).replace(tzinfo=None)
+        elif not isinstance(column.type, types.TypeDecorator):
+            return value.timestamp()
+        processor = column.type.bind_processor(self.engine.dialect)
+        return processor(value) if processor else value
+
+    @staticmethod
+    def time_column(model: Type[Base]) -> str:
+        return "epoch_ts" if "epoch_ts" in model.__table__.columns else "ts"
+
+    def range_where(self, model: Type[Base], time_column: str, start: Union[datetime, float, None],
+                    end: Union[datetime, float, None], where: Optional[dict[str, Any]]) -> tuple[str, list[Any]]:
+        """WHERE clause and its parameters for start <= time_column < end and column = value for each of where."""
+        table: Table = model.__table__
+        time_col = table.columns[time_column]
+        clauses: list[str] = []
+        params: list[Any] = []
+        if start is not None:
+            clauses.append(f"{time_column} >= ?")
+            params.append(self.bind_time(time_col, start))
+        if end is not None:
+            clauses.append(f"{time_column} < ?")
+            params.append(self.bind_time(time_col, end))
+        for name, value in (where or {}).items():
+            processor = table.columns[name].type.bind_processor(self.engine.dialect)
+            clauses.append(f"{name} = ?")
+            params.append(processor(value) if processor else value)
+        return (f" WHERE {' AND '.join(clauses)}" if clauses else ""), params
+
+    def fetch_chunks(self, model: Type[Base], columns: list[str], start: Union[datetime, float, None] = None,
+                     end: Union[datetime, float, None] = None, time_column: Optional[str] = None,
+                     chunk_size: int = 10000, where: Optional[dict[str, Any]] = None) -> Iterator[list[tuple]]:
+        """Rows with start <= time_column < end, in time order, chunk_size tuples at a time, values as stored.
+
+        The query runs on a raw DBAPI cursor and is read with fetchmany, so memory stays at one chunk whatever the
+        range. A partitioned model is read from the partitions overlapping the range too, see sources(). The
+        connection is held until the generator is exhausted or closed.
+
+        :param columns: column names, as in the table
+        :param time_column: defaults to epoch_ts when the model has one, else ts
+        :param where: column name: value, rows equal to all of them
+        """
+        table: Table = model.__table__
+        time_column = time_column or self.time_column(model)
+        where_sql, params = self.range_where(model, time_column, start, end, where)
+        with self.engine.connect() as conn:
+            dbapi_conn = conn.connection
+            cursor = dbapi_conn.cursor()
+            try:
+                for schema in self.sources(dbapi_conn, model, start, end):
+                    cursor.execute(f"SELECT {', '.join(columns)} FROM {schema}.{table.name}{where_sql} "
+                                   f"ORDER BY {time_column}", params)
+                    while True:
+                        chunk: list[tuple] = cursor.fetchmany(chunk_size)
+                        if not chunk:
+                            break
+                        yield chunk
+            finally:
+                cursor.close()
+
+    def count(self, model: Type[Base], start: Union[datetime, float, None] = None,
+              end: Union[datetime, float, None] = None, time_column: Optional[str] = None,
+              where: Optional[dict[str, Any]] = None) -> int:
+        """Rows fetch_chunks would return, off the time index."""
+        time_column = time_column or self.time_column(model)
+        where_sql, params = self.range_where(model, time_column, start, end, where)
+        with self.engine.connect() as conn:
+            dbapi_conn = conn.connection
+            # fetchall, a partition can't be detached while a statement on it is still open
+            return sum(dbapi_conn.execute(f"SELECT count(*) FROM {schema}.{model.__table__.name}{where_sql}",
+                                          params).fetchall()[0][0]
+                       for schema in self.sources(dbapi_conn, model, start, end))
+
+    def fetch_columns(self, model: Type[Base], columns: list[str], start: Union[datetime, float, None] = None,
+                      end: Union[datetime, float, None] = None, time_column: Optional[str] = None,
+                      chunk_size: int = 10000, where: Optional[dict[str, Any]] = None) -> dict[str, np.ndarray]:
+        """Columns of the rows with start <= time_column < end, in time order, as one array per column.
+
+        Skips the ORM: rows come from fetch_chunks into arrays preallocated from count(). Numeric columns (epoch
+        ints included) come back as float64 with NaN for NULL, DateTime columns as datetime64[us] with NaT, anything
+        else as an object array.
+
+        :param columns: column names, as in the table
+        :param time_column: defaults to epoch_ts when the model has one, else ts
+        :param where: column name: value, rows equal to all of them
+        """
+        table: Table = model.__table__
+        kinds: list[str] = [self.column_kind(table.columns[name]) for name in columns]
+
+        # rows added between the count and the read just grow the arrays
+        capacity: int = self.count(model, start, end, time_column, where)
+        arrays: list[np.ndarray] = [np.empty(capacity, dtype={"number": np.float64,
+                                                              "datetime": "datetime64[us]",
+                                                              "object": object}[kind]) for kind in kinds]
+        n: int = 0
+        for chunk in self.fetch_chunks(model, columns, start, end, time_column, chunk_size, where):
+            if len(arrays[0]) < n + len(chunk):
+                arrays = [np.resize(array, max(2 * len(array), n + len(chunk))) for array in arrays]
+            if all(kind == "number" for kind in kinds):
+                # one conversion for the whole chunk, None becomes NaN
+                block: np.ndarray = np.array(chunk, dtype=np.float64).reshape(len(chunk), len(columns))
+                for i, array in enumerate(arrays):
+                    array[n:n + len(chunk)] = block[:, i]
+            else:
+                for array, kind, values in zip(arrays, kinds, zip(*chunk)):
+                    array[n:n + len(chunk)] = np.array(values, dtype=array.dtype if kind != "object" else object)
+            n += len(chunk)
+        return {name: array[:n].copy() if n < len(array) else array for name, array in zip(columns, arrays)}
+
+    def partition_path(self, month: datetime) -> str:
+        return f"{self.db_filename}_{month:%Y_%m}.sqlite"
+
+    def partition_months(self, start: Union[datetime, float, None] = None,
+                         end: Union[datetime, float, None] = None) -> list[datetime]:
+        """Months with a partition file overlapping [start, end), oldest first."""
+        pattern: re.Pattern = re.compile(re.escape(os.path.basename(self.db_filename)) + r"_(\d{4})_(\d{2})\.sqlite")
+        start = None if start is None else self.as_datetime(start)
+        end = None if end is None else self.as_datetime(end)
+        months: list[datetime] = []
+        for path in glob.glob(f"{glob.escape(self.db_filename)}_*.sqlite"):
+            match: Optional[re.Match] = pattern.fullmatch(os.path.basename(path))
+            if match is None:
+                continue
+            month: datetime = datetime(int(match[1]), int(match[2]), 1, tzinfo=pytz.UTC)
+            if (start is None or start < next_month(month)) and (end is None or month < end):
+                months.append(month)
+        return sorted(months)
+
+    def init_partition(self, month: datetime):
+        """Create the partitioned models' tables in the month's file and run their migrations, once per process."""
+        path: str = self.partition_path(month)
+        if path in self.partitions_ready:
+            return
+        engine = create_engine(f"sqlite:///{path}", echo=False, future=True)
+        try:
+            Base.metadata.create_all(engine, tables=[model.__table__ for model in self.partitioned])
+            with Session(engine) as session, session.begin():
+                self.migrate(session, self.partitioned)
+        finally:
+            engine.dispose()
+        self.partitions_ready.add(path)
+
+    def attach(self, dbapi_conn, month: datetime) -> str:
+        """Attach the month's partition to a raw connection, outside a transaction. Returns its schema name."""
+        self.init_partition(month)
+        schema: str = f"p{month:%Y_%m}"
+        dbapi_conn.execute(f"ATTACH DATABASE ? AS {schema}", (self.partition_path(month),))
+        return schema
+
+    def sources(self, dbapi_conn, model: Type[Base], start: Union[datetime, float, None] = None,
+                end: Union[datetime, float, None] = None) -> Iterator[str]:
+        """Schemas to read model's rows in [start, end) from: the partitions overlapping it, oldest first, each
+        attached only while the caller reads it, then main.
+
+        Reading them one after the other stays in time order as long as the main file holds nothing older than the
+        newest partition, which roll_partitions sees to. SQLite attaches at most 10 databases to a connection, one
+        at a time any range works.
+        """
+        if model in self.partitioned:
+            for month in self.partition_months(start, end):
+                schema: str = self.attach(dbapi_conn, month)
+                try:
+                    yield schema
+                finally:
+                    dbapi_conn.execute(f"DETACH DATABASE {schema}")
+        yield "main"
+
+    @staticmethod
+    def as_datetime(value: Union[datetime, float]) -> datetime:
+        if not isinstance(value, datetime):
+            return datetime.fromtimestamp(value, tz=pytz.UTC)
+        return value.replace(tzinfo=pytz.UTC) if value.tzinfo is None else value
+
+    def stored_time(self, column, value: Any) -> datetime:
+        # a raw time column value back to a UTC datetime
+        processor = column.type.result_processor(self.engine.dialect, None)
+        return self.as_datetime(processor(value) if processor else value)
+
+    def roll_partitions(self, before: Optional[datetime] = None, chunk_size: int = 10000) -> int:
+        """Move the partitioned models' rows from before the month of before, now by default, out of the main file
+        into their month's partition. Returns the rows moved.
+
+        Chunk by chunk in time order: a chunk is copied with INSERT OR IGNORE and committed, then deleted from main
+        and committed, so an interrupted run leaves at most one chunk in both files and the next run moves it again.
+        The main file keeps the free pages, see vacuum().
+        """
+        if self.session.in_transaction():
+            # an open read in rollback journal mode would hold off every write
+            self.session.commit()
+        boundary: datetime = month_start(before or datetime.now(tz=pytz.UTC))
+        moved: int = 0
+        with self.engine.connect() as conn:
+            dbapi_conn = conn.connection
+            for model in self.partitioned:
+                table: Table = model.__table__
+                time_column: str = self.time_column(model)
+                time_col = table.columns[time_column]
+                while True:
+                    oldest: Any = dbapi_conn.execute(f"SELECT min({time_column}) FROM main.{table.name} "
+                                                     f"WHERE {time_column} < ?",
+                                                     (self.bind_time(time_col, boundary),)).fetchall()[0][0]
+                    if oldest is None:
+                        break
+                    month: datetime = month_start(self.stored_time(time_col, oldest))
+                    schema: str = self.attach(dbapi_conn, month)
+                    try:
+                        moved += self.move_rows(dbapi_conn, table, time_column, schema,
+                                                self.bind_time(time_col, month),
+                                                self.bind_time(time_col, next_month(month)), chunk_size)
+                    finally:
+                        dbapi_conn.execute(f"DETACH DATABASE {schema}")
+                    print(f"rolled {table.name} up to {next_month(month):%Y-%m}: {moved} rows")
+        return moved
+
+    @staticmethod
+    def move_rows(dbapi_conn, table: Table, time_column: str, schema: str, start: Any, end: Any,
+                  chunk_size: int) -> int:
+        columns: str = ", ".join(column.name for column in table.columns)
+        in_chunk: str = f"{time_column} >= ? AND {time_column} < ?"
+        moved: int = 0
+        while True:
+            # the chunk ends at the time of its chunk_size'th row, or past the first time after start when that
+            # many rows share start
+            upper: list[tuple] = dbapi_conn.execute(
+                f"SELECT {time_column} FROM main.{table.name} WHERE {in_chunk} ORDER BY {time_column} "
+                f"LIMIT 1 OFFSET ?", (start, end, chunk_size)).fetchall()
+            chunk_end: Any = upper[0][0] if upper else end
+            if chunk_end == start:
+                chunk_end = dbapi_conn.execute(f"SELECT min({time_column}) FROM main.{table.name} "
+                                               f"WHERE {time_column} > ? AND {time_column} < ?",
+                                               (start, end)).fetchall()[0][0] or end
+            dbapi_conn.execute(f"INSERT OR IGNORE INTO {schema}.{table.name} ({columns}) "
+                               f"SELECT {columns} FROM main.{table.name} WHERE {in_chunk}", (start, chunk_end))
+            dbapi_conn.commit()
+            moved += dbapi_conn.execute(f"DELETE FROM main.{table.name} WHERE {in_chunk}",
+                                        (start, chunk_end)).rowcount
+            dbapi_conn.commit()
+            if chunk_end == end:
+                return moved
+            start = chunk_end
+
+    def drop_partition(self, month: datetime):
+        """Delete the month's partition file, with its journals."""
+        path: str = self.partition_path(month)
+        for suffix in ("", "-wal", "-shm", "-journal"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        self.partitions_ready.discard(path)
+
+    def vacuum(self):
+        """Rebuild the main file without the free pages deletes leave, e.g. after roll_partitions. Holds the write
+        lock until done."""
+        if self.session.in_transaction():
+            self.session.commit()
+        with self.engine.connect() as conn:
+            conn.exec_driver_sql("VACUUM")
@@ -1,2 +1,2 @@
 sh ctrl.sh nws on
-sh ctrl.sh controller on
\ No newline at end of file
+sh ctrl.sh cadence on
\ No newline at end of file
@@ -1,12 +1,18 @@
-import asyncio
 from enum import Enum
 from typing import Tuple, Optional
 from datetime import datetime, timedelta, time
 
+import numpy as np
 import pytz
 
 import fan_scripting
-from fan_scripting import State, onoff_toggle, get_state
+from fan_scripting import State, onoff_toggle, get_state, run_sync
+from metrics import registry as metrics
+from ringbuffer import RingBuffer
+
+thermostat_control_seconds = metrics.histogram("thermostat_control_seconds", "Thermostat decision and fan command "
+                                                                             "latency")
+thermostat_results = metrics.counter("thermostat_results", "Thermostat control outcomes")
 
 
 class Thermostat:
@@ -24,7 +30,7 @@ class Thermostat:
         NO_ACTION = "NO_ACTION"
 
     def __init__(self, tstat_mode: TstatMode = TstatMode.AUTO, setpoint_F: float = 70.0, co2_threshold_ppm: float = 800,
-                 cooldown_duration_s: int = 300):
+                 cooldown_duration_s: int = 300, smoothing_cycles: int = 3):
         self.tstat_mode: Thermostat.TstatMode = tstat_mode
 
         self.heat_setpoint: float = setpoint_F
@@ -49,27 +55,50 @@ class Thermostat:
 
         self.tstat_mode_override: Optional[Thermostat.TstatMode] = None
 
+        # Recent controller readings, set by the control loop. Decisions use the mean of the current reading and the
+        # previous smoothing_cycles - 1 rows, so one noisy read doesn't switch the fan.
+        self.history: Optional[RingBuffer] = None
+        self.smoothing_cycles: int = smoothing_cycles
+
     def is_on_cooldown(self) -> bool:
         return self.control_loop_ts - self.last_command_ts < self.cooldown_duration
 
-    def generate_command(self, current_temp_F: float, current_co2_ppm: float) -> State:
+    def smoothed(self, channel: str, current: Optional[float]) -> Optional[float]:
+        """Mean of current and the channel's previous smoothing_cycles - 1 values in history, missing ones skipped."""
+        values: list[float] = [] if current is None else [current]
+        if self.history is not None and self.smoothing_cycles > 1:
+            recent: np.ndarray = self.history.column(channel, self.smoothing_cycles - 1)
+            values += recent[~np.isnan(recent)].tolist()
+        return sum(values) / len(values) if values else None
+
+    def generate_command(self, current_temp_F: float, current_co2_ppm: Optional[float]) -> State:
         new_command: State = State.OFF
-        if self.cool_setpoint < current_temp_F or self.co2_threshold_ppm < current_co2_ppm:
+        if self.cool_setpoint < current_temp_F or (current_co2_ppm is not None and
+                                                   self.co2_threshold_ppm < current_co2_ppm):
             new_command = State.ON
         return new_command
 
     def needs_command(self, new_command: State, force: bool = False):
         return force or new_command != self.previous_command
 
-    def fan_control(self, new_command: State) -> Tuple[Result, State]:
+    async def switch_fan(self, new_command: State):
+        await onoff_toggle("Fan", new_command)
+
+    async def read_fan_state(self) -> State:
+        return await get_state("Fan")
+
+    async def fan_control_async(self, new_command: State) -> Tuple[Result, State]:
         try:
-            asyncio.run(onoff_toggle("Fan", new_command))
+            await self.switch_fan(new_command)
             self.previous_command = new_command
             self.last_command_ts = self.control_loop_ts
         except:
             return Thermostat.Result.DEVICE_ERROR, self.previous_command
         return Thermostat.Result.SUCCESS, new_command
 
+    def fan_control(self, new_command: State) -> Tuple[Result, State]:
+        return run_sync(self.fan_control_async(new_command))
+
     def get_scheduled_mode(self, ts: datetime) -> TstatMode:
         for segment in self.schedule_on:
             if segment[0] < ts.astimezone().time() < segment[1]:
@@ -77,7 +106,13 @@ class Thermostat:
 
         return Thermostat.TstatMode.OFF
 
-    def do_control(self, current_temp_F: float, current_co2_ppm: float) -> Tuple[Result, State]:
+    async def do_control_async(self, current_temp_F: float, current_co2_ppm: float) -> Tuple[Result, State]:
+        with thermostat_control_seconds.labels().time():
+            result, state = await self.control_async(current_temp_F, current_co2_ppm)
+        thermostat_results.labels(result=result.value).inc()
+        return result, state
+
+    async def control_async(self, current_temp_F: float, current_co2_ppm: float) -> Tuple[Result, State]:
         self.control_loop_ts: datetime = datetime.now(pytz.UTC)
 
         self.tstat_mode = self.get_scheduled_mode(self.control_loop_ts)
@@ -90,13 +125,19 @@ class Thermostat:
         if self.is_on_cooldown():
             return Thermostat.Result.COOLDOWN, self.previous_command
 
-        new_command: State = self.generate_command(current_temp_F, current_co2_ppm)
+        new_command: State = self.generate_command(self.smoothed("corrected_temp_F", current_temp_F),
+                                                    self.smoothed("co2_ppm", current_co2_ppm))
 
         if not self.needs_command(new_command):
             return Thermostat.Result.NO_CHANGE, new_command
 
-        return self.fan_control(new_command)
+        return await self.fan_control_async(new_command)
+
+    def do_control(self, current_temp_F: float, current_co2_ppm: float) -> Tuple[Result, State]:
+        return run_sync(self.do_control_async(current_temp_F, current_co2_ppm))
+
+    async def get_fan_state_async(self) -> fan_scripting.State:
+        return await self.read_fan_state()
 
-    @staticmethod
-    def get_fan_state() -> fan_scripting.State:
-        return asyncio.run(get_state("Fan"))
+    def get_fan_state(self) -> fan_scripting.State:
+        return run_sync(self.get_fan_state_async())
@@ -1,41 +1,134 @@
+import calendar
+import hashlib
+import json
+import zlib
 from enum import Enum
-from typing import Union
+from typing import Any, Callable, Optional, Type, Union
 
+import pytz
 import sqlalchemy
-from sqlalchemy import Column, func, TEXT, types
-from sqlalchemy.dialects.sqlite import DATETIME
+from sqlalchemy import BOOLEAN, BLOB, Column, MetaData, TEXT, REAL, func, types, and_, literal, or_, text
+from sqlalchemy.future import select
+from sqlalchemy.orm import relationship, Session
 
-from sqlite import BaseWithMigrations
+from sqlite import BaseWithMigrations, GenericQuery, SqliteStore
 
-from time import mktime
-from datetime import datetime
+from datetime import datetime, timedelta
 
 
 class TimeseriesValue(types.TypeDecorator):
     """Used for working with epoch timestamps.
 
-Converts datetimes into epoch on the way in.
-    Converts epoch timestamps to datetimes on the way out.
+    Converts datetimes into UTC epoch seconds on the way in, naive datetimes are taken as UTC.
+    Converts epoch timestamps to UTC datetimes on the way out.
     """
-    impl = types.TEXT
+    impl = types.INTEGER
+    cache_ok = True
 
     def process_bind_param(self, value, dialect):
-
-        return mktime(value.timetuple())
+        if value is None:
+            return None
+        if value.tzinfo is not None:
+            value = value.astimezone(pytz.UTC)
+        return calendar.timegm(value.timetuple())
 
     def process_result_value(self, value, dialect):
-        return datetime.fromtimestamp(value)
+        if value is None:
+            return None
+        return datetime.fromtimestamp(value, tz=pytz.UTC)
+
+
+def metadata_json(metadata: dict) -> bytes:
+    # Canonical form, equal dicts always hash the same
+    return json.dumps(metadata, sort_keys=True, separators=(",", ":"), default=str).encode()
+
+
+class TimeseriesMetadata(BaseWithMigrations):
+    """Timeseries.row_metadata payloads, stored once per distinct content and keyed by its sha1."""
+    __tablename__ = "timeseries_metadata"
+
+    hash: str = Column(TEXT, primary_key=True, nullable=False)
+    compressed: bool = Column(BOOLEAN, nullable=False, default=False)
+    data: bytes = Column(BLOB, nullable=False)
+
+    @property
+    def value(self) -> dict:
+        # Decoded once per loaded payload, rows sharing a hash share the instance through the identity map
+        decoded: Optional[dict] = self.__dict__.get("decoded")
+        if decoded is None:
+            data: bytes = zlib.decompress(self.data) if self.compressed else self.data
+            decoded = self.__dict__["decoded"] = json.loads(data)
+        return decoded
+
+    @classmethod
+    def migrations(cls) -> list[str]:
+        return []
+
+
+class MetadataWriter:
+    """Write hook storing the row_metadata of new Timeseries rows in timeseries_metadata, see SqliteStore.write_hooks.
+
+    Payloads already stored are skipped by hash.
+
+    :param compress: zlib compress payloads of at least min_bytes
+    """
+    insert_sql: str = (f"INSERT OR IGNORE INTO {TimeseriesMetadata.__tablename__} (hash, compressed, data) "
+                       f"VALUES (:hash, :compressed, :data)")
+
+    def __init__(self, compress: bool = True, min_bytes: int = 128, level: int = 6):
+        self.compress: bool = compress
+        self.min_bytes: int = min_bytes
+        self.level: int = level
+
+    def encode(self, digest: str, data: bytes) -> dict[str, Any]:
+        if self.compress and self.min_bytes <= len(data):
+            return {"hash": digest, "compressed": True, "data": zlib.compress(data, self.level)}
+        return {"hash": digest, "compressed": False, "data": data}
+
+    def __call__(self, conn, rows: list):
+        payloads: dict[str, bytes] = {}
+        for row in rows:
+            data: Optional[bytes] = getattr(row, "pending_metadata_json", None)
+            if data is not None:
+                payloads[row.metadata_hash] = data
+        if payloads:
+            conn.execute(text(self.insert_sql), [self.encode(digest, data) for digest, data in payloads.items()])
 
 
 class Timeseries(BaseWithMigrations):
     __tablename__ = "timeseries"
 
     series_id: str = Column(TEXT, primary_key=True, nullable=False)
-    ts: datetime = Column(DATETIME, primary_key=True, nullable=False)
-    version_ts: datetime = Column(DATETIME, primary_key=True, nullable=False)
-    value_: Union[str, float] = Column("value", TEXT, nullable=False)
-    row_metadata: dict = Column(sqlalchemy.JSON)
-    created_at: datetime = Column(DATETIME, server_default=func.now())
+    ts: datetime = Column(TimeseriesValue, primary_key=True, nullable=False)
+    version_ts: datetime = Column(TimeseriesValue, primary_key=True, nullable=False)
+    # REAL affinity: numbers are stored as 8 byte floats, anything that doesn't parse as a number stays text
+    value_: Union[str, float] = Column("value", REAL, nullable=False)
+    # sha1 of the row_metadata payload in timeseries_metadata
+    metadata_hash: str = Column(TEXT)
+    created_at: datetime = Column(TimeseriesValue, server_default=text("(CAST(strftime('%s', 'now') AS INTEGER))"))
+
+    metadata_blob: Optional[TimeseriesMetadata] = relationship(
+        TimeseriesMetadata, primaryjoin="foreign(Timeseries.metadata_hash) == TimeseriesMetadata.hash",
+        viewonly=True, lazy="select")
+
+    @property
+    def row_metadata(self) -> Optional[dict]:
+        """Loaded from timeseries_metadata on first access, plain value reads never touch it.
+
+        New rows need a MetadataWriter in the store's write_hooks for the payload to be saved.
+        """
+        if "pending_metadata" in self.__dict__:
+            return self.pending_metadata
+        if self.metadata_hash is None or self.metadata_blob is None:
+            return None
+        return self.metadata_blob.value
+
+    @row_metadata.setter
+    def row_metadata(self, metadata: Optional[dict]) -> None:
+        self.pending_metadata: Optional[dict] = metadata
+        self.pending_metadata_json: Optional[bytes] = None if metadata is None else metadata_json(metadata)
+        self.metadata_hash = (None if metadata is None
+                              else hashlib.sha1(self.pending_metadata_json).hexdigest())
 
     @property
     def value(self) -> str:
@@ -45,9 +138,82 @@ class Timeseries(BaseWithMigrations):
     def value(self, value: str) -> None:
         self.value_ = value
 
+    def rollup_samples(self) -> list[tuple[str, datetime, float]]:
+        # Every stored version counts as a sample of its ts, text values aren't rolled up
+        try:
+            return [(self.series_id, self.ts, float(self.value_))]
+        except (TypeError, ValueError):
+            return []
+
     @classmethod
-    def migrations(cls) -> list[str]:
-        return []
+    def migrate_metadata(cls, session: Session, chunk_size: int = 10000):
+        """Move the inline row_metadata JSON column into timeseries_metadata."""
+        columns: set[str] = {row[1] for row in session.execute(text(f"PRAGMA table_info({cls.__tablename__})"))}
+        if "row_metadata" not in columns:
+            return
+
+        print(f"migrating {cls.__tablename__} row_metadata to {TimeseriesMetadata.__tablename__}")
+        if "metadata_hash" not in columns:
+            session.execute(text(f"ALTER TABLE {cls.__tablename__} ADD COLUMN metadata_hash TEXT"))
+        writer: MetadataWriter = MetadataWriter()
+        last_rowid: int = 0
+        while True:
+            chunk: list = session.execute(text(
+                f"SELECT rowid, row_metadata FROM {cls.__tablename__} "
+                f"WHERE rowid > :last_rowid AND row_metadata IS NOT NULL ORDER BY rowid LIMIT :chunk_size"),
+                {"last_rowid": last_rowid, "chunk_size": chunk_size}).all()
+            if not chunk:
+                break
+            payloads: dict[str, bytes] = {}
+            hashes: list[dict[str, Any]] = []
+            for rowid, raw in chunk:
+                data: bytes = metadata_json(json.loads(raw))
+                digest: str = hashlib.sha1(data).hexdigest()
+                payloads[digest] = data
+                hashes.append({"rowid": rowid, "metadata_hash": digest})
+            session.execute(text(writer.insert_sql), [writer.encode(digest, data) for digest, data in payloads.items()])
+            session.execute(text(f"UPDATE {cls.__tablename__} SET metadata_hash = :metadata_hash "
+                                 f"WHERE rowid = :rowid"), hashes)
+            last_rowid = chunk[-1][0]
+        session.execute(text(f"ALTER TABLE {cls.__tablename__} DROP COLUMN row_metadata"))
+
+    @classmethod
+    def migrate_to_epoch(cls, session: Session):
+        """Rebuild a table from the DATETIME/TEXT layout into epoch INTEGER timestamps and REAL values."""
+        columns: dict[str, str] = {row[1]: row[2] for row in session.execute(
+            text(f"PRAGMA table_info({cls.__tablename__})"))}
+        if columns.get("ts", "").upper() != "DATETIME":
+            return
+
+        print(f"migrating {cls.__tablename__} to epoch timestamps")
+        staging: str = f"{cls.__tablename__}_epoch"
+        cls.__table__.to_metadata(MetaData(), name=staging).create(session.connection())
+        session.execute(text(f"""
+            INSERT INTO {staging} (series_id, ts, version_ts, value, metadata_hash, created_at)
+            SELECT
+                series_id,
+                CAST(strftime('%s', ts) AS INTEGER),
+                CAST(strftime('%s', version_ts) AS INTEGER),
+                value,
+                metadata_hash,
+                CAST(strftime('%s', created_at) AS INTEGER)
+            FROM {cls.__tablename__}
+        """))
+        session.execute(text(f"DROP TABLE {cls.__tablename__}"))
+        session.execute(text(f"ALTER TABLE {staging} RENAME TO {cls.__tablename__}"))
+
+    @classmethod
+    def migrations(cls) -> list[Union[str, Callable[[Session], None]]]:
+        return [
+            cls.migrate_metadata,
+            cls.migrate_to_epoch,
+            # covers latest/as_of reads, no table lookups for the value
+            f"CREATE INDEX IF NOT EXISTS ix_{cls.__tablename__}_series_ts_version_value "
+            f"ON {cls.__tablename__} (series_id, ts, version_ts, value);",
+            # scenario reads walk each version's rows in ts order
+            f"CREATE INDEX IF NOT EXISTS ix_{cls.__tablename__}_series_version_ts "
+            f"ON {cls.__tablename__} (series_id, version_ts, ts, value);"
+        ]
 
 
 class NumericTimeseries(Timeseries):
@@ -57,7 +223,7 @@ class NumericTimeseries(Timeseries):
 
     @value.setter
     def value(self, value: float) -> None:
-        self.value_ = str(value)
+        self.value_ = float(value)
 
 
 class TimeseriesID(BaseWithMigrations):
@@ -86,3 +252,126 @@ class DatetimeMask(BaseWithMigrations):
     @classmethod
     def migrations(cls) -> list[str]:
         return [f"INSERT INTO {cls.__tablename__} VALUES ('{e.name}', '{e.value}');" for e in cls.Mask]
+
+
+def utc(ts: datetime) -> datetime:
+    # Naive datetimes are taken as UTC, same as TimeseriesValue
+    return ts if ts.tzinfo is None else ts.astimezone(pytz.UTC)
+
+
+def in_range(model: Type[Timeseries], stmt, start: Optional[datetime], end: Optional[datetime]):
+    if start is not None:
+        stmt = stmt.where(utc(start) <= model.ts)
+    if end is not None:
+        stmt = stmt.where(model.ts < utc(end))
+    return stmt
+
+
+def latest_query(series_id: str, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                 version_ts: Optional[datetime] = None,
+                 model: Type[Timeseries] = NumericTimeseries) -> GenericQuery[Timeseries]:
+    """Newest version of every ts in [start, end), optionally only versions at or before version_ts.
+
+    Predicates are bound parameters against the bare columns. MAX(version_ts) is computed once per ts by a grouped
+    scan of the (series_id, ts, version_ts) index over the range, then each ts's row is one seek on that index.
+    """
+    newest = select(model.ts, func.max(model.version_ts).label("version_ts")).where(model.series_id == series_id)
+    if version_ts is not None:
+        newest = newest.where(model.version_ts <= utc(version_ts))
+    newest = in_range(model, newest, start, end).group_by(model.ts).subquery("newest")
+
+    stmt = (select(model)
+            .join(newest, and_(model.ts == newest.c.ts, model.version_ts == newest.c.version_ts))
+            .where(model.series_id == series_id))
+    return stmt.order_by(model.ts)
+
+
+def scenario_query(series_id: str, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                   model: Type[Timeseries] = NumericTimeseries) -> GenericQuery[Timeseries]:
+    """Versions treated as continuous scenarios: each version owns its ts from its first ts until the first ts of the
+    next version. Same result as sql_queries/versioned_scenarios.sql.
+    """
+    # one grouped scan of the (series_id, ts, version_ts) index over the range, then one seek per version on the
+    # (series_id, version_ts, ts) index for the rows of its span
+    first_ts = func.min(model.ts)
+    spans = in_range(model, select(model.version_ts, first_ts.label("min_ts"),
+                                   func.lead(first_ts).over(order_by=model.version_ts).label("next_ts"))
+                     .where(model.series_id == series_id), start, end).group_by(model.version_ts).cte("spans")
+
+    # the last span runs to the end of the range, a bare bound keeps the seek a range on the index
+    span_end = (or_(spans.c.next_ts.is_(None), model.ts < spans.c.next_ts) if end is None
+                else model.ts < func.coalesce(spans.c.next_ts, literal(utc(end), model.ts.type)))
+    stmt = (select(model)
+            .join(spans, and_(model.series_id == series_id, model.version_ts == spans.c.version_ts,
+                              spans.c.min_ts <= model.ts, span_end)))
+    return stmt.order_by(model.ts)
+
+
+class VersionedTimeseries:
+    """Versioned reads of one timeseries store."""
+    def __init__(self, datastore: SqliteStore, model: Type[Timeseries] = NumericTimeseries):
+        self.datastore: SqliteStore = datastore
+        self.model: Type[Timeseries] = model
+
+    def latest(self, series_id: str, start: Optional[datetime] = None,
+               end: Optional[datetime] = None) -> list[Timeseries]:
+        return self.datastore.fetch_entities(latest_query(series_id, start, end, model=self.model))
+
+    def as_of(self, series_id: str, version_ts: datetime, start: Optional[datetime] = None,
+              end: Optional[datetime] = None) -> list[Timeseries]:
+        """What latest() would have returned at version_ts."""
+        return self.datastore.fetch_entities(latest_query(series_id, start, end, version_ts, model=self.model))
+
+    def scenario(self, series_id: str, start: Optional[datetime] = None,
+                 end: Optional[datetime] = None) -> list[Timeseries]:
+        return self.datastore.fetch_entities(scenario_query(series_id, start, end, model=self.model))
+
+
+def content_hash(row: Timeseries) -> str:
+    """Hash of what a row says about its ts, the value and the metadata, independent of version_ts."""
+    value: Optional[float] = None if row.value_ is None else float(row.value_)
+    return hashlib.sha1(json.dumps([value, row.metadata_hash]).encode()).hexdigest()
+
+
+class ChangeFilter:
+    """Drops rows identical to the latest stored version of the same series and ts.
+
+    The content hash of the latest version of every ts is kept in memory, ts not seen yet are loaded from the store
+    with one latest() read per series, so a restart doesn't store the current forecast again.
+
+    :param max_entries: hashes kept, the oldest ts are forgotten first
+    """
+    def __init__(self, versioned: VersionedTimeseries, max_entries: int = 10000):
+        self.versioned: VersionedTimeseries = versioned
+        self.max_entries: int = max_entries
+        self.hashes: dict[tuple[str, int], str] = {}
+
+    @staticmethod
+    def key(row: Timeseries) -> tuple[str, int]:
+        return row.series_id, calendar.timegm(utc(row.ts).utctimetuple())
+
+    def load(self, series_id: str, rows: list[Timeseries]):
+        start: datetime = min(utc(row.ts) for row in rows)
+        end: datetime = max(utc(row.ts) for row in rows) + timedelta(seconds=1)
+        for stored in self.versioned.latest(series_id, start, end):
+            self.hashes[self.key(stored)] = content_hash(stored)
+
+    def changed(self, rows: list[Timeseries]) -> list[Timeseries]:
+        missing: dict[str, list[Timeseries]] = {}
+        for row in rows:
+            if self.key(row) not in self.hashes:
+                missing.setdefault(row.series_id, []).append(row)
+        for series_id, series_rows in missing.items():
+            self.load(series_id, series_rows)
+
+        ret: list[Timeseries] = []
+        for row in rows:
+            digest: str = content_hash(row)
+            if self.hashes.get(self.key(row)) != digest:
+                self.hashes[self.key(row)] = digest
+                ret.append(row)
+
+        if len(self.hashes) > self.max_entries:
+            for key in sorted(self.hashes, key=lambda k: k[1])[:len(self.hashes) - self.max_entries]:
+                del self.hashes[key]
+        return ret